@@ -9,6 +9,7 @@ Versions up from 13.05 are based on a C++ engine called CuraEngine.
 __copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
 
 from optparse import OptionParser
+import multiprocessing
 
 from Cura.util import profile
 
@@ -16,7 +17,7 @@ def main():
 	"""
 	Main Cura entry point. Parses arguments, and starts GUI or slicing process depending on the arguments.
 	"""
-	parser = OptionParser(usage="usage: %prog [options] <filename>.stl")
+	parser = OptionParser(usage="usage: %prog [options] <filename>.stl [<filename>.stl ...]")
 	parser.add_option("-i", "--ini", action="store", type="string", dest="profileini",
 		help="Load settings from a profile ini file")
 	parser.add_option("-r", "--print", action="store", type="string", dest="printfile",
@@ -26,7 +27,17 @@ def main():
 	parser.add_option("-s", "--slice", action="store_true", dest="slice",
 		help="Slice the given files instead of opening them in Cura")
 	parser.add_option("-o", "--output", action="store", type="string", dest="output",
-		help="path to write sliced file to")
+		help="path to write sliced file to, or the directory for the sliced files when slicing multiple files")
+	parser.add_option("-j", "--jobs", action="store", type="int", dest="jobs", default=0,
+		help="Amount of files to slice at the same time, 0 uses one process per CPU core")
+	parser.add_option("--daemon", action="store", type="int", dest="daemon",
+		help="Run a headless slice service with an HTTP API on this localhost port")
+	parser.add_option("--summary", action="store", type="string", dest="summary",
+		help="Write a JSON summary of the sliced files to this file")
+	parser.add_option("--metrics", action="store_true", dest="metrics",
+		help="Print the time spent in each phase of slicing each file")
+	parser.add_option("--sweep", action="append", type="string", dest="sweep",
+		help="Slice the given files with each combination of setting values, for example --sweep layer_height=0.1,0.2 --sweep fill_density=10,20, and print the print time and filament of each combination")
 	parser.add_option("--serialCommunication", action="store", type="string", dest="serialCommunication",
 		help="Start commandline serial monitor")
 
@@ -48,42 +59,40 @@ def main():
 	else:
 		profile.loadProfile(profile.getDefaultProfilePath(), True)
 
-	if options.printfile is not None:
+	if options.daemon is not None:
+		from Cura.util import sliceDaemon
+		sliceDaemon.serve(options.daemon, options.jobs)
+	elif options.printfile is not None:
 		from Cura.gui import printWindow
 		printWindow.startPrintInterface(options.printfile)
-	elif options.slice is not None:
-		from Cura.util import sliceEngine
-		from Cura.util import objectScene
-		from Cura.util import meshLoader
-		import shutil
-
-		def commandlineProgressCallback(progress):
-			if progress >= 0:
-				#print 'Preparing: %d%%' % (progress * 100)
-				pass
-		scene = objectScene.Scene()
-		scene.updateMachineDimensions()
-		engine = sliceEngine.Engine(commandlineProgressCallback)
-		for m in meshLoader.loadMeshes(args[0]):
-			scene.add(m)
-		engine.runEngine(scene)
-		engine.wait()
+	elif options.sweep is not None:
+		from Cura.util import batchSlice
+		from Cura.util import sliceSweep
+		import sys
 
-		if not options.output:
-			options.output = args[0] + profile.getGCodeExtension()
-		with open(options.output, "wb") as f:
-			gcode = engine.getResult().getGCode()
-			while True:
-				data = gcode.read()
-				if len(data) == 0:
-					break
-				f.write(data)
-		print 'GCode file saved : %s' % options.output
+		filenames = batchSlice.expandFilenames(args)
+		if len(filenames) < 1:
+			parser.error("no files to slice")
+		try:
+			sliceSweep.parseGrid(options.sweep)
+		except ValueError, e:
+			parser.error(str(e))
+		if not sliceSweep.sweepFiles(filenames, options.sweep, options.jobs, options.summary):
+			sys.exit(1)
+	elif options.slice is not None:
+		from Cura.util import batchSlice
+		import sys
 
-		engine.cleanup()
+		filenames = batchSlice.expandFilenames(args)
+		if len(filenames) < 1:
+			parser.error("no files to slice")
+		if not batchSlice.sliceFiles(filenames, options.output, options.jobs, options.summary, options.metrics):
+			sys.exit(1)
 	else:
 		from Cura.gui import app
 		app.CuraApp(args).MainLoop()
 
 if __name__ == '__main__':
+	#Needed for the GCode parse processes when running as a frozen executable.
+	multiprocessing.freeze_support()
 	main()
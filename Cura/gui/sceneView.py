@@ -127,9 +127,10 @@ class SceneView(openglGui.glGuiPanel):
 	def loadGCodeFile(self, filename):
 		self.OnDeleteAll(None)
 		#Cheat the engine results to load a GCode file into it.
+		if self._engine._result is not None:
+			self._engine._result.abortGCodeLoad()
 		self._engine._result = sliceEngine.EngineResult()
-		with open(filename, "r") as f:
-			self._engine._result.setGCode(f.read())
+		self._engine._result.loadGCodeFile(filename)
 		self._engine._result.setFinished(True)
 		self._engineResultView.setResult(self._engine._result)
 		self.printButton.setBottomText('')
@@ -357,18 +358,12 @@ class SceneView(openglGui.glGuiPanel):
 
 	def _saveGCode(self, targetFilename, ejectDrive = False):
 		gcode = self._engine.getResult().getGCode()
+		def progressCallback(progress):
+			self.printButton.setProgressBar(progress)
+			self._queueRefresh()
 		try:
-			size = float(len(gcode))
-			read_pos = 0
 			with open(targetFilename, 'wb') as fdst:
-				while 1:
-					buf = gcode.read(16*1024)
-					if len(buf) < 1:
-						break
-					read_pos += len(buf)
-					fdst.write(buf)
-					self.printButton.setProgressBar(read_pos / size)
-					self._queueRefresh()
+				gcode.copyTo(fdst, progressCallback)
 		except:
 			import sys, traceback
 			traceback.print_exc()
@@ -643,20 +638,25 @@ class SceneView(openglGui.glGuiPanel):
 		self._engineResultView.setResult(result)
 		if finished:
 			self.printButton.setProgressBar(None)
-			text = '%s' % (result.getPrintTime())
-			for e in xrange(0, int(profile.getMachineSetting('extruder_amount'))):
-				amount = result.getFilamentAmount(e)
-				if amount is None:
-					continue
-				text += '\n%s' % (amount)
-				cost = result.getFilamentCost(e)
-				if cost is not None:
-					text += '\n%s' % (cost)
-			self.printButton.setBottomText(text)
+			self._updatePrintInfo(result)
 		else:
 			self.printButton.setBottomText('')
 		self.QueueRefresh()
 
+	def _updatePrintInfo(self, result):
+		if result is not self._engine.getResult() or not result.isFinished():
+			return
+		text = '%s' % (result.getPrintTime())
+		for e in xrange(0, int(profile.getMachineSetting('extruder_amount'))):
+			amount = result.getFilamentAmount(e)
+			if amount is None:
+				continue
+			text += '\n%s' % (amount)
+			cost = result.getFilamentCost(e)
+			if cost is not None:
+				text += '\n%s' % (cost)
+		self.printButton.setBottomText(text)
+
 	def loadScene(self, fileList, pms_transforms=None):
 		objIndex = -1
 		for filename in fileList:
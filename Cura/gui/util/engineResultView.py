@@ -11,6 +11,7 @@ from OpenGL.GLU import *
 from OpenGL.GL import *
 
 from Cura.util import profile
+from Cura.util import polygonStorage
 from Cura.gui.util import openglHelpers
 from Cura.gui.util import openglGui
 
@@ -67,6 +68,9 @@ class engineResultView(object):
 			#Abort loading from this thread.
 			return True
 		self._gcodeLoadProgress = progress
+		if progress >= 1.0:
+			#Loaded GCode files get their print time when the GCode is interpreted.
+			wx.CallAfter(self._parent._updatePrintInfo, result)
 		self._parent._queueRefresh()
 		return False
 
@@ -133,8 +137,8 @@ class engineResultView(object):
 									polygons = []
 									for i in xrange(0, 20):
 										if typeName in result._polygons[n + i]:
-											polygons += result._polygons[n + i][typeName]
-									layerVBOs[typeName] = self._polygonsToVBO_lines(polygons)
+											polygons.append(result._polygons[n + i][typeName])
+									layerVBOs[typeName] = self._polygonsToVBO_lines(polygonStorage.concatenate(polygons))
 									generatedVBO = True
 
 								if not self._singleLayer or n == layerNr - 1:
@@ -188,18 +192,9 @@ class engineResultView(object):
 		self._resultLock.release()
 
 	def _polygonsToVBO_lines(self, polygons):
-		verts = numpy.zeros((0, 3), numpy.float32)
-		indices = numpy.zeros((0), numpy.uint32)
-		for poly in polygons:
-			if len(poly) > 2:
-				i = numpy.arange(len(verts), len(verts) + len(poly) + 1, 1, numpy.uint32)
-				i[-1] = len(verts)
-				i = numpy.dstack((i[0:-1],i[1:])).flatten()
-			else:
-				i = numpy.arange(len(verts), len(verts) + len(poly), 1, numpy.uint32)
-			indices = numpy.concatenate((indices, i), 0)
-			verts = numpy.concatenate((verts, poly), 0)
-		return openglHelpers.GLVBO(GL_LINES, verts, indicesArray=indices)
+		#The polygons are a PolygonStorage, which has all points in one array already.
+		points, indices = polygons.getLines()
+		return openglHelpers.GLVBO(GL_LINES, points, indicesArray=indices)
 
 	def _polygonsToVBO_quads(self, polygons):
 		verts = numpy.zeros((0, 3), numpy.float32)
@@ -248,9 +243,10 @@ class engineResultView(object):
 		for layer in gcodeLayers:
 			for path in layer:
 				if path['type'] == 'extrude' and path['pathType'] == extrudeType and (extruder is None or path['extruder'] == extruder):
+					#The points are a view on the toolpath, so they are not changed in place.
 					a = path['points']
 					if extrudeType == 'FILL':
-						a[:,2] += 0.01
+						a = a + numpy.array([0,0,0.01], numpy.float32)
 
 					#Construct the normals of each line 90deg rotated on the X/Y plane
 					normals = a[1:] - a[:-1]
@@ -0,0 +1,149 @@
+"""
+The batchSlice module slices model files from the command line. Multiple files are sliced at the same time in a pool of
+processes, each process runs its own Engine, which listens on its own port.
+For each file a summary with the print time, filament use, wall time, the time of each slicing phase and errors is returned,
+which is written as JSON.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import sys
+import glob
+import json
+import time
+import traceback
+import multiprocessing
+
+from Cura.util import profile
+from Cura.util import resources
+
+def expandFilenames(args):
+	"""
+	Expand the wildcards in the filename arguments, shells on Windows do not do this.
+	"""
+	filenames = []
+	for arg in args:
+		matches = sorted(glob.glob(arg))
+		if len(matches) < 1:
+			matches = [arg]
+		for filename in matches:
+			if filename not in filenames:
+				filenames.append(filename)
+	return filenames
+
+def getOutputFilename(filename, output, multipleFiles):
+	"""
+	The GCode filename for a model file. With multiple files the output is a directory, else the output is the GCode filename.
+	"""
+	if not output:
+		return filename + profile.getGCodeExtension()
+	if multipleFiles or os.path.isdir(output):
+		return os.path.join(output, os.path.basename(filename) + profile.getGCodeExtension())
+	return output
+
+def _initWorker(profileString):
+	#Pool processes on Windows do not inherit the loaded settings.
+	profile.loadPreferences(profile.getPreferencePath())
+	profile.setProfileFromString(profileString)
+	resources.setupLocalization(profile.getPreference('language'))
+
+def sliceFile(filename, output, engine = None):
+	"""
+	Slice a single model file and save the GCode. Returns the summary of this job.
+	An existing engine can be given to slice with, else a new engine is created for this job.
+	"""
+	from Cura.util import sliceEngine
+	from Cura.util import objectScene
+	from Cura.util import meshLoader
+
+	startTime = time.time()
+	summary = {'filename': filename, 'output': output, 'success': False, 'error': None}
+	ownEngine = engine is None
+	try:
+		scene = objectScene.Scene()
+		scene.updateMachineDimensions()
+		if ownEngine:
+			engine = sliceEngine.Engine(lambda progress: None)
+		meshes = meshLoader.loadMeshes(filename)
+		if len(meshes) < 1:
+			raise ValueError('No models loaded from: %s' % (filename))
+		for m in meshes:
+			scene.add(m)
+		previousResult = engine.getResult()
+		engine.runEngine(scene)
+		engine.wait()
+		result = engine.getResult()
+		if result is previousResult:
+			summary['error'] = 'Nothing to slice, no models on the build platform'
+		elif result is None or not result.isFinished():
+			log = result.getLog()[-5:] if result is not None else []
+			summary['error'] = '\n'.join(['Slicing failed'] + log)
+		else:
+			with open(output, "wb") as f:
+				result.getGCode().copyTo(f)
+			summary['printTimeSeconds'] = result._printTimeSeconds
+			summary['filamentMM'] = [float(amount) for amount in result._filamentMM]
+			summary['filamentGram'] = [result.getFilamentWeight(e) * 1000.0 for e in xrange(0, len(result._filamentMM))]
+			summary['metrics'] = result.getMetrics()
+			summary['success'] = True
+	except:
+		summary['error'] = traceback.format_exc()
+	finally:
+		if ownEngine and engine is not None:
+			engine.cleanup()
+	summary['wallTime'] = time.time() - startTime
+	return summary
+
+def _sliceJob(job):
+	return sliceFile(*job)
+
+def sliceFiles(filenames, output = None, processCount = 0, summaryFilename = None, showMetrics = False):
+	"""
+	Slice all files with a pool of processCount processes, 0 uses one process per CPU core.
+	Writes the summaries of all jobs as a JSON list to summaryFilename, or to stdout. Returns True when all jobs succeeded.
+	With showMetrics the time spent in each slicing phase is printed for each file.
+	"""
+	resources.setupLocalization(profile.getPreference('language'))
+	jobs = [(filename, getOutputFilename(filename, output, len(filenames) > 1)) for filename in filenames]
+	if output and len(filenames) > 1 and not os.path.isdir(output):
+		os.makedirs(output)
+	if processCount < 1:
+		processCount = multiprocessing.cpu_count()
+	processCount = min(processCount, len(jobs))
+
+	startTime = time.time()
+	summaries = []
+	if processCount < 2:
+		results = map(_sliceJob, jobs)
+		pool = None
+	else:
+		pool = multiprocessing.Pool(processCount, _initWorker, (profile.getProfileString(),))
+		results = pool.imap_unordered(_sliceJob, jobs)
+	for summary in results:
+		if summary['success']:
+			print 'GCode file saved : %s (%.1fs)' % (summary['output'], summary['wallTime'])
+			if showMetrics:
+				for name, seconds in sorted(summary['metrics'].items(), key=lambda item: -item[1]):
+					print '  %-20s %8.3fs' % (name, seconds)
+		else:
+			print 'Failed to slice: %s' % (summary['filename'])
+			print summary['error']
+		summaries.append(summary)
+	if pool is not None:
+		pool.close()
+		pool.join()
+
+	summaries.sort(key=lambda summary: filenames.index(summary['filename']))
+	report = {
+		'jobs': summaries,
+		'processes': processCount,
+		'wallTime': time.time() - startTime,
+		'failures': len([summary for summary in summaries if not summary['success']]),
+	}
+	if summaryFilename is not None:
+		with open(summaryFilename, 'w') as f:
+			json.dump(report, f, indent=2)
+	elif len(jobs) > 1:
+		json.dump(report, sys.stdout, indent=2)
+		print
+	return report['failures'] == 0
@@ -1,90 +1,358 @@
+import os
 import sys
+import mmap
+import bisect
+import tempfile
 import cStringIO as StringIO
+import numpy
+
+from Cura.util.gcodeColumnar import growableArray
+
+#Size of the StringIO blocks, and of the chunks copied by copyTo.
+BLOCK_SIZE = 1024 * 1024 * 50
+COPY_CHUNK_SIZE = 1024 * 1024
+#The line index holds the offset of every LINE_INDEX_STEP-th line, so seekLine reads less then LINE_INDEX_STEP lines.
+LINE_INDEX_STEP = 256
+
+class BigDataCursor(object):
+	"""
+	An independent read position on the sealed blocks of a BigDataStorage, with the read functions of a file.
+	A cursor reads the data which was written when it was created. Reading does not change the storage or other cursors,
+	so any number of readers can stream the same data at the same time, without copying the blocks.
+	The lineOffsets are the line index of the storage: the offset of line 0, LINE_INDEX_STEP, 2*LINE_INDEX_STEP, ...
+	"""
+	def __init__(self, blocks, lineOffsets, lineCount):
+		self._blocks = blocks
+		self._lineOffsets = lineOffsets
+		self._lineCount = lineCount
+		self._starts = []
+		self._size = 0
+		for block in blocks:
+			self._starts.append(self._size)
+			self._size += len(block)
+		self._index = 0
+		self._pos = 0
+
+	def __len__(self):
+		return self._size
+
+	def seekStart(self):
+		self._index = 0
+		self._pos = 0
+
+	def seek(self, offset, whence=0):
+		if whence == 1:
+			offset += self.tell()
+		elif whence == 2:
+			offset += self._size
+		offset = max(0, min(offset, self._size))
+		self._index = max(0, bisect.bisect_right(self._starts, offset) - 1)
+		self._pos = offset - self._starts[self._index] if len(self._starts) > 0 else 0
+
+	def tell(self):
+		if self._index >= len(self._blocks):
+			return self._size
+		return self._starts[self._index] + self._pos
+
+	def read(self, size=None):
+		if size is None or size < 0:
+			size = self._size - self.tell()
+		data = []
+		while size > 0 and self._index < len(self._blocks):
+			block = self._blocks[self._index]
+			chunk = block[self._pos:self._pos + size]
+			self._pos += len(chunk)
+			size -= len(chunk)
+			data.append(chunk)
+			if self._pos >= len(block):
+				self._index += 1
+				self._pos = 0
+		if len(data) == 1:
+			return data[0]
+		return ''.join(data)
+
+	def readline(self):
+		data = []
+		while self._index < len(self._blocks):
+			block = self._blocks[self._index]
+			end = block.find('\n', self._pos)
+			if end < 0:
+				data.append(block[self._pos:])
+				self._index += 1
+				self._pos = 0
+				continue
+			data.append(block[self._pos:end + 1])
+			self._pos = end + 1
+			if self._pos >= len(block):
+				self._index += 1
+				self._pos = 0
+			break
+		if len(data) == 1:
+			return data[0]
+		return ''.join(data)
+
+	def lineCount(self):
+		return self._lineCount
+
+	def seekLine(self, lineNr):
+		"""
+		Move the position to the start of line lineNr, counting from 0. Lines after the last line are at the end of the data.
+		"""
+		lineNr = max(0, lineNr)
+		if lineNr >= self._lineCount:
+			self.seek(self._size)
+			return
+		self.seek(int(self._lineOffsets[lineNr // LINE_INDEX_STEP]))
+		for n in xrange(0, lineNr % LINE_INDEX_STEP):
+			self.readline()
+
+	def readLines(self, start, end):
+		"""
+		Returns the lines from line start up to line end, like a slice of a list of the lines.
+		"""
+		start = max(0, start)
+		end = min(end, self._lineCount)
+		self.seekLine(start)
+		return [self.readline() for n in xrange(start, end)]
+
+	def __iter__(self):
+		return self
+
+	def next(self):
+		line = self.readline()
+		if line == '':
+			raise StopIteration
+		return line
+
+	def copyTo(self, f, progressCallback=None):
+		"""
+		Write all data to the file f, in large chunks. The progressCallback is called with the fraction of the data written.
+		This does not move the read position.
+		"""
+		size = float(max(1, self._size))
+		done = 0
+		for block in self._blocks:
+			for offset in xrange(0, len(block), COPY_CHUNK_SIZE):
+				data = block[offset:offset + COPY_CHUNK_SIZE]
+				f.write(data)
+				done += len(data)
+				if progressCallback is not None:
+					progressCallback(done / size)
+
+	def close(self):
+		pass
 
 class BigDataStorage(object):
 	"""
 	The StringIO from python aborts with an out-of-memory error after 250MB.
 	So the BigDataStorage stores data in multiple StringIOs to prevent this issue.
+	When a spillSize is given, the data after the first spillSize bytes is written to a temporary file instead,
+	so very large GCode does not need to be kept in memory.
+	Only the last block is written to. When it is full, or when the data is read, it is sealed: the StringIO is replaced by
+	its string, or the temporary file by a read only memory map of it. Sealed blocks never change, so clones and cursors
+	share them instead of copying them, and writing after a read starts a new block.
+	While writing, the offset of every LINE_INDEX_STEP-th line is stored in a line index, so seekLine and readLines can
+	jump to a line without reading all lines before it.
 	"""
-	def __init__(self):
-		self._active = StringIO.StringIO()
-		self._list = [self._active]
-		self._read_index = None
+	def __init__(self, spillSize=None):
+		self._blocks = []
+		self._sealedSize = 0
+		self._writeBlock = None
+		self._spillSize = spillSize
+		self._spilled = False
+		self._memorySize = 0
+		#Changed when the sealed blocks change, so the reader of the storage itself knows it has to be updated.
+		self._version = 0
+		self._lineOffsets = growableArray(numpy.int64)
+		self._lineOffsets.append([0])
+		self._newlineCount = 0
+		self._lastLineStart = 0
+		#Read position of the read functions of the storage itself, independent readers use a cursor.
+		self._reader = self.cursor()
+		self._readerVersion = self._version
 
 	def write(self, data):
-		self._active.write(data)
-		if self._active.tell() > 1024 * 1024 * 50:
-			self._active = StringIO.StringIO()
-			self._list.append(self._active)
+		if self._writeBlock is None:
+			if self._spilled:
+				self._writeBlock = tempfile.TemporaryFile(prefix='CuraGCode')
+			else:
+				self._writeBlock = StringIO.StringIO()
+		block = self._writeBlock
+		self._indexLines(data, len(self))
+		block.write(data)
+		if self._spilled:
+			return
+		if self._spillSize is not None and self._memorySize + block.tell() > self._spillSize:
+			self._seal()
+			self._spilled = True
+		elif block.tell() > BLOCK_SIZE:
+			self._seal()
+
+	def _indexLines(self, data, start):
+		#Add the offsets of the sampled lines that start in the data, which is written at offset start.
+		count = data.count('\n')
+		if count < 1:
+			return
+		self._lastLineStart = start + data.rfind('\n') + 1
+		first = LINE_INDEX_STEP - self._newlineCount % LINE_INDEX_STEP
+		if first <= count:
+			newlines = numpy.flatnonzero(numpy.frombuffer(data, numpy.uint8) == ord('\n'))
+			self._lineOffsets.append(newlines[first - 1::LINE_INDEX_STEP] + start + 1)
+		self._newlineCount += count
+
+	def _rebuildLineIndex(self):
+		self._lineOffsets = growableArray(numpy.int64)
+		self._lineOffsets.append([0])
+		self._newlineCount = 0
+		self._lastLineStart = 0
+		start = 0
+		for block in self._blocks:
+			for offset in xrange(0, len(block), COPY_CHUNK_SIZE):
+				data = block[offset:offset + COPY_CHUNK_SIZE]
+				self._indexLines(data, start)
+				start += len(data)
+
+	def _seal(self):
+		block = self._writeBlock
+		if block is None:
+			return
+		self._writeBlock = None
+		if hasattr(block, 'fileno'):
+			block.flush()
+			if os.fstat(block.fileno()).st_size > 0:
+				self._blocks.append(mmap.mmap(block.fileno(), 0, access=mmap.ACCESS_READ))
+				self._sealedSize += len(self._blocks[-1])
+				self._version += 1
+			block.close()
+		else:
+			data = block.getvalue()
+			block.close()
+			if len(data) > 0:
+				self._blocks.append(data)
+				self._sealedSize += len(data)
+				self._memorySize += len(data)
+				self._version += 1
+
+	def isSpilled(self):
+		return self._spilled
+
+	def cursor(self):
+		"""
+		Returns a new BigDataCursor at the start of the data written so far.
+		"""
+		self._seal()
+		return BigDataCursor(list(self._blocks), self._lineOffsets.getArray(), self.lineCount())
+
+	def lineCount(self):
+		"""
+		The amount of lines, a last line without a newline is counted as well.
+		"""
+		if len(self) > self._lastLineStart:
+			return self._newlineCount + 1
+		return self._newlineCount
+
+	def seekLine(self, lineNr):
+		self._updateReader()
+		self._reader.seekLine(lineNr)
+
+	def readLines(self, start, end):
+		self._updateReader()
+		return self._reader.readLines(start, end)
+
+	def _updateReader(self):
+		#The reader of the storage also reads the data written after it was created.
+		if self._writeBlock is not None or self._readerVersion != self._version:
+			pos = self._reader.tell()
+			self._reader = self.cursor()
+			self._reader.seek(pos)
+			self._readerVersion = self._version
 
 	def seekStart(self):
-		self._active = self._list[0]
-		self._active.seek(0)
-		self._read_index = 0
+		self._updateReader()
+		self._reader.seekStart()
 
-	def activeRead(self, size=None):
-		return self._active.read(size) if size != None else self._active.read()
+	def seek(self, offset):
+		self._updateReader()
+		self._reader.seek(offset)
 
 	def read(self, size=None):
-		ret = self.activeRead(size)
-		if ret == '':
-			if self._read_index + 1 < len(self._list):
-				self._read_index += 1
-				self._active = self._list[self._read_index]
-				self._active.seek(0)
-				ret = self.activeRead(size)
-		return ret
+		self._updateReader()
+		return self._reader.read(size)
+
+	def copyTo(self, f, progressCallback=None):
+		"""
+		Write all data to the file f, in large chunks. The progressCallback is called with the fraction of the data written.
+		"""
+		self.cursor().copyTo(f, progressCallback)
 
 	def replaceAtStart(self, dictionary):
-		data = self._list[0].getvalue()
-		block0 = data[0:2048]
-		block1 = StringIO.StringIO()
-		self._list[0] = StringIO.StringIO()
-		block1.write(data[2048:])
-		self._list.insert(1, block1)
+		self._seal()
+		if len(self._blocks) < 1:
+			return
+		#The first 2048 bytes can be in multiple blocks, when they were sealed by a read before all data was written.
+		blocks = []
+		size = 0
+		while len(self._blocks) > 0 and size < 2048:
+			blocks.append(self._blocks.pop(0))
+			size += len(blocks[-1])
+		data = ''.join([block[0:2048] for block in blocks])
+		head = data[0:2048]
+		block0 = head
 		for key, value in dictionary.items():
 			block0 = block0.replace(key, str(value))
-		self._list[0].write(block0)
+		#New first blocks, so clones and cursors made before keep the data they had.
+		rest = blocks[-1][len(blocks[-1]) - (size - 2048):] if size > 2048 else ''
+		self._blocks[0:0] = [data for data in [block0, rest] if len(data) > 0]
+		self._sealedSize += len(block0) - len(head)
+		self._version += 1
+
+		#Lines after the start only move, unless the replaced values have newlines.
+		headLines = head.count('\n')
+		if block0.count('\n') != headLines:
+			self._rebuildLineIndex()
+			return
+		newlines = numpy.flatnonzero(numpy.frombuffer(block0, numpy.uint8) == ord('\n'))
+		offsets = self._lineOffsets.getArray() + (len(block0) - len(head))
+		offsets[0] = 0
+		offsets[1:headLines // LINE_INDEX_STEP + 1] = newlines[LINE_INDEX_STEP - 1::LINE_INDEX_STEP] + 1
+		self._lineOffsets = growableArray(numpy.int64)
+		self._lineOffsets.setArray(offsets)
+		if self._newlineCount > headLines:
+			self._lastLineStart += len(block0) - len(head)
+		elif headLines > 0:
+			self._lastLineStart = int(newlines[-1]) + 1
 
 	def __len__(self):
-		ret = 0
-		for data in self._list:
-			pos = data.tell()
-			data.seek(0, 2)
-			ret += data.tell()
-			data.seek(pos)
-		return ret
+		if self._writeBlock is None:
+			return self._sealedSize
+		return self._sealedSize + self._writeBlock.tell()
 
 	def __iter__(self):
-		self._iter_index = 0
-		return self
+		return self.cursor()
 
 	def next(self):
-		if self._iter_index < len(self._list):
-			ret = self._list[self._iter_index].readline()
-			if ret == '' or (ret[-1] != '\n' and ret[-1] != '\r'):
-				self._iter_index += 1
-				if self._iter_index < len(self._list):
-					self._list[self._iter_index].seek(0)
-				return ret + self.next()
-			return ret
-		raise StopIteration
+		self._updateReader()
+		return self._reader.next()
 
 	def tell(self):
-		pos = 0
-		for data in self._list[:self._iter_index]:
-			pos += data.tell()
-		if self._iter_index < len(self._list):
-			pos += self._list[self._iter_index].tell()
-		return pos
+		return self._reader.tell()
 
 	def close(self):
 		pass
 
 	def clone(self):
-		clone = BigDataStorage()
-		clone._list = []
-		for item in self._list:
-			clone._list.append(StringIO.StringIO(item.getvalue()))
-		clone._active = clone._list[-1]
+		"""
+		Returns a copy of the storage which shares the sealed blocks, writing to the copy or the original does not change the other.
+		"""
+		self._seal()
+		clone = BigDataStorage(self._spillSize)
+		clone._blocks = list(self._blocks)
+		clone._sealedSize = self._sealedSize
+		clone._spilled = self._spilled
+		clone._memorySize = self._memorySize
+		clone._version = self._version + 1
+		#A view on the samples so far, appending to it makes a copy.
+		clone._lineOffsets.setArray(self._lineOffsets.getArray())
+		clone._newlineCount = self._newlineCount
+		clone._lastLineStart = self._lastLineStart
 		return clone
@@ -0,0 +1,876 @@
+"""
+The gcodeColumnar module is the vectorized backend of the GCode interpreter.
+Instead of walking the GCode line by line, whole chunks of GCode are tokenized with numpy and the interpreter state
+(positions, extrusion, modal flags) is resolved with array operations. The result is stored as a toolpath with flat
+columns (struct-of-arrays) for the points, and offset arrays which describe where each path and layer starts.
+
+The results are the same as the layerList generated by the line based parser in gcodeInterpreter,
+and the layerListView class makes the columns look like that layerList for existing code.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import warnings
+import json
+import numpy
+
+from Cura.util import profile
+
+#Path move types, stored as index in the pathMoveType column.
+MOVE_TYPES = ['move', 'extrude', 'retract']
+MOVE = 0
+EXTRUDE = 1
+RETRACT = 2
+
+#Default amount of bytes that is parsed in a single block.
+CHUNK_SIZE = 1024 * 1024
+
+_KNOWN_G_CODES = [0, 1, 2, 3, 4, 10, 11, 20, 21, 28, 90, 91, 92]
+_KNOWN_M_CODES = [0, 1, 25, 80, 81, 82, 83, 84, 92, 101, 103, 104, 105, 106, 107, 108, 109, 110, 113, 117, 140, 190, 221]
+
+#Letters for which a value column is generated by the tokenizer.
+_VALUE_LETTERS = 'GMTXYZEFSIJR'
+
+#Maximum amount of line segments a single arc is split into.
+MAX_ARC_SEGMENTS = 10000
+
+class growableArray(object):
+	"""
+	A numpy array which can be appended to with amortized constant cost.
+	getArray() returns a view on the filled part of the array.
+	"""
+	def __init__(self, dtype, width = None, capacity = 1024):
+		self._width = width
+		self._data = numpy.empty(self._shape(capacity), dtype)
+		self._count = 0
+
+	def _shape(self, size):
+		if self._width is None:
+			return (size,)
+		return (size, self._width)
+
+	def reserve(self, size):
+		if size <= len(self._data):
+			return
+		data = numpy.empty(self._shape(max(size, len(self._data) * 2)), self._data.dtype)
+		data[:self._count] = self._data[:self._count]
+		self._data = data
+
+	def append(self, values):
+		count = len(values)
+		self.reserve(self._count + count)
+		self._data[self._count:self._count + count] = values
+		self._count += count
+
+	def grow(self, count):
+		"""
+		Append count entries which are not initialized, returns the view on them to fill in.
+		"""
+		self.reserve(self._count + count)
+		self._count += count
+		return self._data[self._count - count:self._count]
+
+	def getArray(self):
+		return self._data[:self._count]
+
+	def setArray(self, data):
+		"""
+		Use an existing array (like a memory map) as storage, it is only copied when more data is appended.
+		"""
+		self._data = data
+		self._count = len(data)
+
+	def __len__(self):
+		return self._count
+
+class gcodeToolpath(object):
+	"""
+	Struct-of-arrays storage of a parsed GCode toolpath.
+	Every point has a position, the amount of extrusion needed to reach it and the feedrate it was reached with.
+	Paths are consecutive runs of points with the same move type, feature type and extruder.
+	Layers are consecutive runs of paths. The first point of each path is a copy of the last point of the previous path.
+	"""
+	def __init__(self):
+		self._points = growableArray(numpy.float32, 3)
+		self._extrusion = growableArray(numpy.float32)
+		self._feedrate = growableArray(numpy.float32)
+		self._pathStart = growableArray(numpy.int64)
+		self._pathMoveType = growableArray(numpy.int8)
+		self._pathFeature = growableArray(numpy.int16)
+		self._pathExtruder = growableArray(numpy.int8)
+		self._pathThickness = growableArray(numpy.float64)
+		self._layerStart = growableArray(numpy.int64)
+		self.featureNames = []
+		self.finished = False
+
+	#Names of the columns, used to store and merge toolpaths.
+	_ARRAY_NAMES = ['points', 'extrusion', 'feedrate', 'pathStart', 'pathMoveType', 'pathFeature', 'pathExtruder', 'pathThickness', 'layerStart']
+
+	def _getColumn(self, name):
+		return getattr(self, '_' + name)
+
+	def getFeatureId(self, name):
+		try:
+			return self.featureNames.index(name)
+		except ValueError:
+			self.featureNames.append(name)
+			return len(self.featureNames) - 1
+
+	def pointCount(self):
+		return len(self._points)
+
+	def pathCount(self):
+		return len(self._pathStart)
+
+	def layerCount(self):
+		"""
+		The amount of completed layers. The last layer is only complete when the whole GCode has been parsed.
+		"""
+		if self.finished:
+			return len(self._layerStart)
+		return max(0, len(self._layerStart) - 1)
+
+	@property
+	def points(self):
+		return self._points.getArray()
+
+	@property
+	def x(self):
+		return self.points[:,0]
+
+	@property
+	def y(self):
+		return self.points[:,1]
+
+	@property
+	def z(self):
+		return self.points[:,2]
+
+	@property
+	def extrusion(self):
+		return self._extrusion.getArray()
+
+	@property
+	def feedrate(self):
+		return self._feedrate.getArray()
+
+	@property
+	def pathMoveType(self):
+		return self._pathMoveType.getArray()
+
+	@property
+	def pathFeature(self):
+		return self._pathFeature.getArray()
+
+	@property
+	def pathExtruder(self):
+		return self._pathExtruder.getArray()
+
+	@property
+	def pathThickness(self):
+		return self._pathThickness.getArray()
+
+	@property
+	def pathOffsets(self):
+		"""
+		Start index of each path in the point columns, with the total point count appended.
+		"""
+		return numpy.append(self._pathStart.getArray(), self.pointCount())
+
+	@property
+	def layerOffsets(self):
+		"""
+		Start index of each layer in the path columns, with the total path count appended.
+		"""
+		return numpy.append(self._layerStart.getArray(), self.pathCount())
+
+	def pointMoveType(self):
+		"""
+		Per point move type column, expanded from the per path column.
+		"""
+		return numpy.repeat(self.pathMoveType, numpy.diff(self.pathOffsets))
+
+	def pointExtruder(self):
+		"""
+		Per point extruder column, expanded from the per path column.
+		"""
+		return numpy.repeat(self.pathExtruder, numpy.diff(self.pathOffsets))
+
+	def extend(self, other):
+		"""
+		Append the paths and layers of another toolpath, which continues where this toolpath stops.
+		"""
+		featureMap = numpy.array([self.getFeatureId(name) for name in other.featureNames] + [0], numpy.int16)
+		pointBase = self.pointCount()
+		pathBase = self.pathCount()
+		for name in self._ARRAY_NAMES:
+			column = self._getColumn(name)
+			values = other._getColumn(name).getArray()
+			if name == 'pathStart':
+				values = values + pointBase
+			elif name == 'layerStart':
+				values = values + pathBase
+			elif name == 'pathFeature':
+				values = featureMap[values]
+			column.append(values)
+		self.finished = other.finished
+
+	def getLayerPathRange(self, layerNr):
+		layerStart = self._layerStart.getArray()
+		start = layerStart[layerNr]
+		if layerNr + 1 < len(layerStart):
+			return start, layerStart[layerNr + 1]
+		return start, self.pathCount()
+
+	def getPathPointRange(self, pathNr):
+		pathStart = self._pathStart.getArray()
+		start = pathStart[pathNr]
+		if pathNr + 1 < len(pathStart):
+			return start, pathStart[pathNr + 1]
+		return start, self.pointCount()
+
+	def getLayer(self, layerNr):
+		"""
+		Build the list of gcodePath dictionaries for a single layer, the same as the layerList of the line based parser.
+		The point and extrusion arrays are read only views on the columns, so a user of the layer can not change the toolpath.
+		"""
+		points = self.points.view()
+		points.flags.writeable = False
+		extrusion = self.extrusion.view()
+		extrusion.flags.writeable = False
+		moveType = self.pathMoveType
+		feature = self.pathFeature
+		extruder = self.pathExtruder
+		thickness = self.pathThickness
+		layer = []
+		start, end = self.getLayerPathRange(layerNr)
+		for pathNr in xrange(start, end):
+			a, b = self.getPathPointRange(pathNr)
+			layer.append({'type': MOVE_TYPES[moveType[pathNr]],
+				'pathType': self.featureNames[feature[pathNr]],
+				'layerThickness': float(thickness[pathNr]),
+				'points': points[a:b],
+				'extrusion': extrusion[a:b],
+				'extruder': int(extruder[pathNr])})
+		return layer
+
+#Toolpaths are stored in a simple binary format: a magic string, the length of a JSON header and the header itself,
+# followed by the raw data of each column. Columns are aligned to 64 bytes so they can be memory mapped.
+_FILE_MAGIC = 'CuraToolpath1'
+_FILE_ALIGN = 64
+
+def saveToolpath(tp, f):
+	"""
+	Write a toolpath to an open file object.
+	"""
+	arrays = []
+	offset = 0
+	for name in gcodeToolpath._ARRAY_NAMES:
+		data = tp._getColumn(name).getArray()
+		arrays.append({'name': name, 'dtype': data.dtype.str, 'shape': data.shape, 'offset': offset})
+		offset += (data.nbytes + _FILE_ALIGN - 1) / _FILE_ALIGN * _FILE_ALIGN
+	header = json.dumps({'featureNames': tp.featureNames, 'finished': tp.finished, 'arrays': arrays})
+	headerSize = len(_FILE_MAGIC) + 4 + len(header)
+	dataStart = (headerSize + _FILE_ALIGN - 1) / _FILE_ALIGN * _FILE_ALIGN
+	f.write(_FILE_MAGIC)
+	f.write(numpy.array([dataStart], '<u4').tostring())
+	f.write(header)
+	f.write('\0' * (dataStart - headerSize))
+	for name in gcodeToolpath._ARRAY_NAMES:
+		data = numpy.ascontiguousarray(tp._getColumn(name).getArray())
+		f.write(data.tostring())
+		f.write('\0' * ((_FILE_ALIGN - data.nbytes % _FILE_ALIGN) % _FILE_ALIGN))
+
+def loadToolpath(filename, mode = 'c'):
+	"""
+	Load a toolpath written by saveToolpath. The columns are memory mapped, the default copy-on-write mode
+	allows changes to the columns without changing the file. Returns None if the file is not a toolpath file.
+	"""
+	with open(filename, 'rb') as f:
+		if f.read(len(_FILE_MAGIC)) != _FILE_MAGIC:
+			return None
+		dataStart = int(numpy.fromstring(f.read(4), '<u4')[0])
+		header = json.loads(f.read(dataStart - len(_FILE_MAGIC) - 4).rstrip('\0'))
+	tp = gcodeToolpath()
+	tp.featureNames = [str(name) for name in header['featureNames']]
+	tp.finished = header['finished']
+	for info in header['arrays']:
+		shape = tuple(info['shape'])
+		if shape[0] > 0:
+			data = numpy.memmap(filename, numpy.dtype(str(info['dtype'])), mode, dataStart + info['offset'], shape)
+		else:
+			data = numpy.zeros(shape, numpy.dtype(str(info['dtype'])))
+		tp._getColumn(str(info['name'])).setArray(data)
+	return tp
+
+class layerListView(object):
+	"""
+	Thin compatibility view which makes a toolpath look like the layerList of the gcodeInterpreter.
+	Layers are lists of path dictionaries which are built when they are requested.
+	"""
+	def __init__(self, toolpath):
+		self._toolpath = toolpath
+
+	def __len__(self):
+		return self._toolpath.layerCount()
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self._toolpath.getLayer(n) for n in xrange(*index.indices(len(self)))]
+		if index < 0:
+			index += len(self)
+		if index < 0 or index >= len(self):
+			raise IndexError('layer index out of range')
+		return self._toolpath.getLayer(index)
+
+	def __iter__(self):
+		for n in xrange(0, len(self)):
+			yield self._toolpath.getLayer(n)
+
+class parserState(object):
+	"""
+	The interpreter state which is carried over from one block of GCode to the next.
+	This object can be copied and pickled, so parsing can be continued from any block boundary.
+	"""
+	def __init__(self):
+		self.pos = [0.0, 0.0, 0.0]
+		self.lastPoint = [0.0, 0.0, 0.0]
+		self.lastPointIsPos = True
+		self.lastPointRow = 0
+		self.layerStartRow = 0
+		self.currentE = 0.0
+		self.extruder = 0
+		self.multiplier = 1.0
+		self.absoluteE = True
+		self.posAbs = True
+		self.scale = 1.0
+		self.feedrate = 3600.0
+		self.moveType = MOVE
+		self.feature = 'CUSTOM'
+		self.layerThickness = 0.1
+		self.pathKey = (MOVE, 'CUSTOM')
+		self.extruderOffsets = {0: (0.0, 0.0)}
+
+	def copy(self):
+		ret = parserState()
+		ret.__dict__.update(self.__dict__)
+		ret.pos = self.pos[:]
+		ret.lastPoint = self.lastPoint[:]
+		ret.extruderOffsets = self.extruderOffsets.copy()
+		return ret
+
+	def getExtruderOffset(self, extruder):
+		if extruder not in self.extruderOffsets:
+			if extruder > 0:
+				self.extruderOffsets[extruder] = (profile.getMachineSettingFloat('extruder_offset_x%d' % (extruder)), profile.getMachineSettingFloat('extruder_offset_y%d' % (extruder)))
+			else:
+				self.extruderOffsets[extruder] = (0.0, 0.0)
+		return self.extruderOffsets[extruder]
+
+def getParserSettings():
+	"""
+	The profile settings used by the parser, as a dictionary which can be passed to other processes.
+	"""
+	settings = {
+		'spiralize': profile.getProfileSetting('spiralize') == 'True',
+		'layerHeight': profile.getProfileSettingFloat('layer_height'),
+		'arcTolerance': profile.getPreferenceFloat('gcode_arc_tolerance'),
+		'extruderOffsets': {0: (0.0, 0.0)},
+	}
+	for n in xrange(1, 4):
+		settings['extruderOffsets'][n] = (profile.getMachineSettingFloat('extruder_offset_x%d' % (n)), profile.getMachineSettingFloat('extruder_offset_y%d' % (n)))
+	return settings
+
+def warmupState(warmup, settings):
+	"""
+	Parse GCode that comes before a section of GCode, and return the parser state at the end of it.
+	The result of the warmup itself is thrown away, so the warmup can be a selection of the lines before the section.
+	"""
+	state = parserState()
+	state.extruderOffsets = settings['extruderOffsets'].copy()
+	p = parser(state = state, spiralize = settings['spiralize'], layerHeight = settings['layerHeight'], arcTolerance = settings['arcTolerance'])
+	p.feed(warmup)
+	p.finish()
+	return state
+
+def arcCenter(start, end, radius, clockwise):
+	"""
+	Center of arcs given with the R form: the center is at distance radius from both the start and end point.
+	A positive radius gives the arc of less then 180 degrees, a negative radius the larger arc.
+	"""
+	delta = end[:,0:2] - start[:,0:2]
+	length = numpy.sqrt((delta * delta).sum(axis=1))
+	length = numpy.where(length > 0.0, length, 1.0)
+	offset = numpy.sqrt(numpy.maximum(radius * radius - length * length / 4.0, 0.0))
+	side = numpy.where(clockwise, 1.0, -1.0) * numpy.where(radius >= 0.0, 1.0, -1.0) * offset / length
+	center = (start[:,0:2] + end[:,0:2]) / 2.0
+	center[:,0] += delta[:,1] * side
+	center[:,1] -= delta[:,0] * side
+	return center
+
+def tessellateArcs(start, end, center, clockwise, tolerance):
+	"""
+	Split arcs in the XY plane into line segments, which differ at most tolerance mm from the real arc.
+	Z moves linearly over the arc (helix). An arc with the same start and end point is a full circle.
+	Returns the amount of segments of each arc, and the points between the segments of all arcs together.
+	"""
+	startVector = start[:,0:2] - center
+	endVector = end[:,0:2] - center
+	radius = numpy.sqrt((startVector * startVector).sum(axis=1))
+	startAngle = numpy.arctan2(startVector[:,1], startVector[:,0])
+	sweep = numpy.arctan2(endVector[:,1], endVector[:,0]) - startAngle
+	sweep = numpy.where(clockwise & (sweep >= 0.0), sweep - 2.0 * numpy.pi, sweep)
+	sweep = numpy.where(~clockwise & (sweep <= 0.0), sweep + 2.0 * numpy.pi, sweep)
+	with numpy.errstate(divide='ignore', invalid='ignore'):
+		maxAngle = 2.0 * numpy.arccos(numpy.clip(1.0 - tolerance / radius, -1.0, 1.0))
+		counts = numpy.ceil(numpy.abs(sweep) / maxAngle)
+	counts = numpy.clip(numpy.nan_to_num(counts), 1, MAX_ARC_SEGMENTS).astype(numpy.int64)
+
+	arcIndex = numpy.repeat(numpy.arange(len(counts)), counts - 1)
+	firstIndex = numpy.cumsum(counts - 1) - (counts - 1)
+	fraction = (numpy.arange(len(arcIndex)) - firstIndex[arcIndex] + 1) / counts[arcIndex].astype(numpy.float64)
+	angle = startAngle[arcIndex] + sweep[arcIndex] * fraction
+	points = numpy.empty((len(arcIndex), 3), numpy.float64)
+	points[:,0] = center[arcIndex,0] + radius[arcIndex] * numpy.cos(angle)
+	points[:,1] = center[arcIndex,1] + radius[arcIndex] * numpy.sin(angle)
+	points[:,2] = start[arcIndex,2] + (end[arcIndex,2] - start[arcIndex,2]) * fraction
+	return counts, points
+
+def _forwardFill(mask, values, initial):
+	"""
+	For each line return the value of the last line (inclusive) where mask is set, or initial if there is no such line.
+	"""
+	last = numpy.where(mask, numpy.arange(len(mask)), -1)
+	numpy.maximum.accumulate(last, out=last)
+	return numpy.where(last >= 0, values[last], initial)
+
+def _setOrAdd(setMask, setValues, addValues, initial):
+	"""
+	Resolve a register which is either set to a value, or increased by a value on each line.
+	"""
+	addSum = numpy.cumsum(addValues)
+	last = numpy.where(setMask, numpy.arange(len(setMask)), -1)
+	numpy.maximum.accumulate(last, out=last)
+	return numpy.where(last >= 0, setValues[last] + (addSum - addSum[last]), initial + addSum)
+
+def tokenize(data):
+	"""
+	Tokenize a block of GCode, which needs to end with a newline.
+	Returns the amount of lines, a dictionary with a value column per letter in _VALUE_LETTERS (NaN where the letter is not
+	on the line) and a list of (lineNr, comment) tuples for the lines that have a comment.
+	Only the first occurrence of each letter on a line is used, anything after a ';' is a comment.
+	"""
+	buf = numpy.frombuffer(data, numpy.uint8)
+	newlines = numpy.flatnonzero(buf == ord('\n'))
+	lineCount = len(newlines)
+	lineStarts = numpy.empty(lineCount, numpy.int64)
+	lineStarts[0:1] = 0
+	lineStarts[1:] = newlines[:-1] + 1
+
+	#Find the comments, GCode on a line stops at the first ';'.
+	codeEnd = newlines.copy()
+	semicolons = numpy.flatnonzero(buf == ord(';'))
+	comments = []
+	if len(semicolons) > 0:
+		semicolonLine = numpy.searchsorted(newlines, semicolons)
+		commentLines, first = numpy.unique(semicolonLine, return_index=True)
+		codeEnd[commentLines] = semicolons[first]
+		for lineNr, start, end in zip(commentLines.tolist(), codeEnd[commentLines].tolist(), newlines[commentLines].tolist()):
+			comments.append((lineNr, data[start:end], start == lineStarts[lineNr]))
+
+	#Find letters directly followed by a number which are not in a comment, and mark the bytes of these numbers.
+	isNumber = ((buf >= ord('0')) & (buf <= ord('9'))) | (buf == ord('.')) | (buf == ord('-')) | (buf == ord('+'))
+	isLetter = (buf >= ord('A')) & (buf <= ord('Z'))
+	letterPos = numpy.flatnonzero(isLetter[:-1] & isNumber[1:])
+	tokenLine = numpy.searchsorted(newlines, letterPos)
+	if len(semicolons) > 0:
+		inCode = letterPos < codeEnd[tokenLine]
+		letterPos = letterPos[inCode]
+		tokenLine = tokenLine[inCode]
+	notNumber = numpy.flatnonzero(~isNumber)
+	tokenEnd = notNumber[numpy.searchsorted(notNumber, letterPos + 1)]
+	marks = numpy.zeros(len(buf) + 1, numpy.int8)
+	marks[letterPos + 1] = 1
+	marks[tokenEnd] -= 1
+	text = numpy.where(numpy.cumsum(marks[:-1], dtype=numpy.int8) > 0, buf, ord(' ')).astype(numpy.uint8).tostring()
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore')
+		values = numpy.fromstring(text, numpy.float64, sep=' ')
+	if len(values) != len(letterPos):
+		#Some value is not a proper number, fall back to parsing each value on its own.
+		values = numpy.empty(len(letterPos), numpy.float64)
+		for n, (start, end) in enumerate(zip((letterPos + 1).tolist(), tokenEnd.tolist())):
+			try:
+				values[n] = float(data[start:end])
+			except ValueError:
+				values[n] = numpy.nan
+	letters = buf[letterPos]
+
+	columns = {}
+	for letter in _VALUE_LETTERS:
+		select = letters == ord(letter)
+		lines = tokenLine[select]
+		column = numpy.empty(lineCount, numpy.float64)
+		column.fill(numpy.nan)
+		if len(lines) > 0:
+			first = numpy.ones(len(lines), numpy.bool_)
+			first[1:] = lines[1:] != lines[:-1]
+			column[lines[first]] = values[select][first]
+		columns[letter] = column
+	return lineCount, columns, comments
+
+def _codeColumn(column):
+	"""
+	Convert a value column to an integer code column, with -1 where there is no valid integer code.
+	"""
+	valid = ~numpy.isnan(column)
+	valid[valid] = numpy.floor(column[valid]) == column[valid]
+	return numpy.where(valid, column, -1).astype(numpy.int32)
+
+class parser(object):
+	"""
+	Incremental GCode parser. GCode can be fed in pieces of any size, only complete lines are parsed.
+	The results are appended to the toolpath, the parser state is kept in a parserState object.
+	Small pieces are collected until there are at least blockSize bytes, as every parsed block has a fixed overhead.
+	"""
+	def __init__(self, toolpath = None, state = None, blockSize = 0, spiralize = None, layerHeight = None, arcTolerance = None):
+		if spiralize is None:
+			spiralize = profile.getProfileSetting('spiralize') == 'True'
+		if layerHeight is None:
+			layerHeight = profile.getProfileSettingFloat('layer_height')
+		if arcTolerance is None:
+			arcTolerance = profile.getPreferenceFloat('gcode_arc_tolerance')
+		self._spiralize = spiralize
+		self._layerHeight = layerHeight
+		self._arcTolerance = max(arcTolerance, 0.0001)
+		if toolpath is None:
+			#Start with the initial path at the origin, which is where the line based parser also starts.
+			toolpath = gcodeToolpath()
+			toolpath.getFeatureId('CUSTOM')
+			toolpath._points.append(numpy.zeros((1, 3), numpy.float32))
+			toolpath._extrusion.append([0.0])
+			toolpath._feedrate.append([3600.0])
+			toolpath._pathStart.append([0])
+			toolpath._pathMoveType.append([MOVE])
+			toolpath._pathFeature.append([0])
+			toolpath._pathExtruder.append([0])
+			toolpath._pathThickness.append(self._clampThickness(numpy.array([0.1])))
+			toolpath._layerStart.append([0])
+		if state is None:
+			state = parserState()
+		self.toolpath = toolpath
+		self.state = state
+		self._pending = []
+		self._pendingSize = 0
+		self.blockSize = blockSize
+		self.unknownCodes = set()
+
+	def feed(self, data):
+		self._pending.append(data)
+		self._pendingSize += len(data)
+		if self._pendingSize < self.blockSize:
+			return
+		data = ''.join(self._pending)
+		end = data.rfind('\n') + 1
+		self._pending = [data[end:]]
+		self._pendingSize = len(data) - end
+		if end > 0:
+			self.parseBlock(data[:end])
+
+	def finish(self):
+		data = ''.join(self._pending)
+		self._pending = []
+		self._pendingSize = 0
+		if data != '':
+			if not data.endswith('\n'):
+				data += '\n'
+			self.parseBlock(data)
+		self.toolpath.finished = True
+
+	def _clampThickness(self, thickness):
+		thickness = numpy.where(thickness <= 0.0, 0.01, thickness)
+		if self._spiralize:
+			thickness[:] = self._layerHeight
+		return thickness
+
+	def parseBlock(self, data):
+		"""
+		Parse a block of complete GCode lines, and append the result to the toolpath.
+		"""
+		lineCount, columns, comments = tokenize(data)
+		if lineCount < 1:
+			return
+		st = self.state
+		tp = self.toolpath
+		lineIdx = numpy.arange(lineCount)
+
+		g = _codeColumn(columns['G'])
+		m = numpy.where(g < 0, _codeColumn(columns['M']), -1)
+		t = numpy.where((g < 0) & (m < 0), _codeColumn(columns['T']), -1)
+		X = columns['X']
+		Y = columns['Y']
+		Z = columns['Z']
+		E = columns['E']
+		F = columns['F']
+		S = columns['S']
+		I = columns['I']
+		J = columns['J']
+		R = columns['R']
+
+		#Comments: feature types and layer markers.
+		layerMark = numpy.zeros(lineCount, numpy.bool_)
+		featureMark = numpy.zeros(lineCount, numpy.bool_)
+		featureValue = numpy.zeros(lineCount, numpy.int32)
+		for lineNr, comment, atLineStart in comments:
+			feature = None
+			if atLineStart and comment.startswith(';TYPE:'):
+				feature = comment[6:].strip()
+			comment = comment[1:].strip()
+			if comment == 'fill':
+				feature = 'FILL'
+			elif comment == 'perimeter':
+				feature = 'WALL-INNER'
+			elif comment == 'skirt':
+				feature = 'SKIRT'
+			if feature is not None:
+				featureMark[lineNr] = True
+				featureValue[lineNr] = tp.getFeatureId(feature)
+			if comment.startswith('LAYER:'):
+				layerMark[lineNr] = True
+
+		#Modal state for each line.
+		posAbs = _forwardFill((g == 90) | (g == 91), g == 90, st.posAbs)
+		scale = _forwardFill((g == 20) | (g == 21), numpy.where(g == 20, 25.4, 1.0), st.scale)
+		absoluteE = _forwardFill((m == 82) | (m == 83), m == 82, st.absoluteE)
+		multiplier = _forwardFill((m == 221) & ~numpy.isnan(S), S / 100.0, st.multiplier)
+		extruder = _forwardFill(t >= 0, t, st.extruder)
+		feature = _forwardFill(featureMark, featureValue, tp.getFeatureId(st.feature))
+		isMove = (g == 0) | (g == 1) | (g == 2) | (g == 3)
+		isHome = g == 28
+		feedrate = _forwardFill(isMove & ~numpy.isnan(F), F, st.feedrate)
+
+		offsetX = numpy.zeros(lineCount, numpy.float64)
+		offsetY = numpy.zeros(lineCount, numpy.float64)
+		for e in numpy.unique(extruder).tolist():
+			offset = st.getExtruderOffset(e)
+			if offset != (0.0, 0.0):
+				offsetX[extruder == e] = offset[0]
+				offsetY[extruder == e] = offset[1]
+
+		#Positions
+		homeAll = isHome & numpy.isnan(X) & numpy.isnan(Y) & numpy.isnan(Z)
+		pos = []
+		for axis, value, offset in ((0, X, offsetX), (1, Y, offsetY), (2, Z, 0.0)):
+			hasValue = isMove & ~numpy.isnan(value)
+			absSet = hasValue & posAbs
+			setMask = absSet | (isHome & (homeAll | ~numpy.isnan(value)))
+			setValues = numpy.where(absSet, value * scale + offset, 0.0)
+			addValues = numpy.where(hasValue & ~posAbs, value * scale, 0.0)
+			pos.append(_setOrAdd(setMask, setValues, addValues, st.pos[axis]))
+		pos = numpy.column_stack(pos)
+		prevPos = numpy.empty((lineCount, 3), numpy.float64)
+		prevPos[0] = st.pos
+		prevPos[1:] = pos[:-1]
+
+		#Arcs are split in multiple points, the last point is the end position of the move.
+		arcCount = numpy.ones(lineCount, numpy.int64)
+		hasIJ = ~numpy.isnan(I) | ~numpy.isnan(J)
+		arcLines = numpy.flatnonzero(((g == 2) | (g == 3)) & (hasIJ | ~numpy.isnan(R)))
+		if len(arcLines) > 0:
+			clockwise = g[arcLines] == 2
+			center = prevPos[arcLines,0:2] + numpy.column_stack((numpy.nan_to_num(I[arcLines]), numpy.nan_to_num(J[arcLines]))) * scale[arcLines,None]
+			rForm = ~hasIJ[arcLines]
+			if numpy.any(rForm):
+				center[rForm] = arcCenter(prevPos[arcLines[rForm]], pos[arcLines[rForm]], R[arcLines[rForm]] * scale[arcLines[rForm]], clockwise[rForm])
+			arcCount[arcLines], arcPoints = tessellateArcs(prevPos[arcLines], pos[arcLines], center, clockwise, self._arcTolerance)
+
+		#Extrusion
+		hasE = isMove & ~numpy.isnan(E)
+		absE = hasE & absoluteE & posAbs
+		relE = hasE & ~(absoluteE & posAbs)
+		currentE = _setOrAdd(absE | ((g == 92) & ~numpy.isnan(E)), numpy.nan_to_num(E), numpy.where(relE, E, 0.0), st.currentE)
+		prevE = numpy.empty(lineCount, numpy.float64)
+		prevE[0] = st.currentE
+		prevE[1:] = currentE[:-1]
+		deltaE = numpy.where(absE, E - prevE, numpy.where(relE, E, 0.0))
+		moveType = numpy.where(deltaE > 0.0, EXTRUDE, numpy.where(deltaE < 0.0, RETRACT, MOVE)).astype(numpy.int8)
+		lastMoveType = _forwardFill(isMove, moveType, st.moveType)
+
+		#Layer thickness, this is set by the first move in a layer that changes Z.
+		prevZ = numpy.empty(lineCount, numpy.float64)
+		prevZ[0] = st.pos[2]
+		prevZ[1:] = pos[:-1,2]
+		zChange = isMove & (moveType == MOVE) & (prevZ != pos[:,2])
+		zReset = zChange & (prevZ > pos[:,2]) & (numpy.abs(prevZ - pos[:,2]) > 5.0) & (pos[:,2] < 1.0)
+		dz = numpy.abs(numpy.where(zReset, 0.0, prevZ) - pos[:,2])
+		segment = numpy.cumsum(layerMark)
+		segmentCount = segment[-1] + 1
+		candidates = numpy.flatnonzero(zChange & (dz != 0.0))
+		candidateSegment = segment[candidates]
+		first = numpy.ones(len(candidates), numpy.bool_)
+		first[1:] = candidateSegment[1:] != candidateSegment[:-1]
+		firstLine = numpy.empty(segmentCount, numpy.int64)
+		firstLine.fill(lineCount)
+		firstLine[candidateSegment[first]] = candidates[first]
+		firstDz = numpy.zeros(segmentCount, numpy.float64)
+		firstDz[candidateSegment[first]] = dz[candidates[first]]
+		startThickness = numpy.zeros(segmentCount, numpy.float64)
+		startThickness[0] = st.layerThickness
+		finalThickness = numpy.where(startThickness != 0.0, startThickness, firstDz)
+		lineThickness = numpy.where(startThickness[segment] != 0.0, startThickness[segment], numpy.where(lineIdx >= firstLine[segment], firstDz[segment], 0.0))
+
+		#Build the events that create paths or points. Layer markers are handled before the GCode on the same line.
+		layerLines = numpy.flatnonzero(layerMark)
+		moveLines = numpy.flatnonzero(isMove)
+		retractLines = numpy.flatnonzero(g == 10)
+		eventLine = numpy.concatenate((layerLines, moveLines, retractLines))
+		eventKind = numpy.concatenate((numpy.zeros(len(layerLines), numpy.int8), numpy.ones(len(moveLines), numpy.int8), numpy.ones(len(retractLines), numpy.int8) * 2))
+		order = numpy.argsort(eventLine * 2 + (eventKind > 0), kind='mergesort')
+		eventLine = eventLine[order]
+		eventKind = eventKind[order]
+		eventCount = len(eventLine)
+		isMoveEvent = eventKind == 1
+
+		prevLineMoveType = numpy.empty(lineCount, numpy.int8)
+		prevLineMoveType[0] = st.moveType
+		prevLineMoveType[1:] = lastMoveType[:-1]
+		eventMoveType = numpy.where(eventKind == 0, prevLineMoveType[eventLine], numpy.where(eventKind == 2, RETRACT, moveType[eventLine]))
+		eventFeature = feature[eventLine]
+		eventKey = eventMoveType.astype(numpy.int64) * 65536 + eventFeature
+		prevKey = numpy.empty(eventCount, numpy.int64)
+		prevKey[0:1] = st.pathKey[0] * 65536 + tp.getFeatureId(st.pathKey[1])
+		prevKey[1:] = eventKey[:-1]
+		newPath = ~isMoveEvent | (eventKey != prevKey)
+
+		pointCounts = numpy.where(eventKind == 2, 2, numpy.where(isMoveEvent, arcCount[eventLine], 0) + newPath)
+		eventRow = numpy.cumsum(pointCounts) - pointCounts
+		rowBase = tp.pointCount()
+		totalPoints = int(pointCounts.sum()) if eventCount > 0 else 0
+
+		#The last stored point before each event, new paths start at a copy of this point.
+		lastMoveEvent = numpy.where(isMoveEvent, numpy.arange(eventCount), -1)
+		numpy.maximum.accumulate(lastMoveEvent, out=lastMoveEvent)
+		prevMoveEvent = numpy.empty(eventCount, numpy.int64)
+		prevMoveEvent[0:1] = -1
+		prevMoveEvent[1:] = lastMoveEvent[:-1]
+		eventPointRow = eventRow + newPath
+		eventEndRow = eventPointRow + arcCount[eventLine] - 1
+		lastPoint = numpy.where((prevMoveEvent >= 0)[:,None], pos[eventLine[prevMoveEvent]], numpy.array(st.lastPoint, numpy.float64))
+
+		points = numpy.empty((totalPoints, 3), numpy.float32)
+		extrusion = numpy.zeros(totalPoints, numpy.float32)
+		feedrates = numpy.empty(totalPoints, numpy.float32)
+		startRows = eventRow[newPath]
+		points[startRows] = lastPoint[newPath]
+		feedrates[startRows] = feedrate[eventLine[newPath]]
+		retractEvents = eventKind == 2
+		points[eventRow[retractEvents] + 1] = lastPoint[retractEvents]
+		feedrates[eventRow[retractEvents] + 1] = feedrate[eventLine[retractEvents]]
+		moveRows = eventEndRow[isMoveEvent]
+		points[moveRows] = pos[moveLines]
+		extrusion[moveRows] = deltaE[moveLines] * multiplier[moveLines] / arcCount[moveLines]
+		feedrates[moveRows] = feedrate[moveLines]
+		if len(arcLines) > 0:
+			#The moves are in line order, so the rows before the end of the arcs are in the same order as the arc points.
+			arcMoves = moveRows[numpy.searchsorted(moveLines, arcLines)]
+			arcRowCount = arcCount[arcLines] - 1
+			arcRows = numpy.arange(len(arcPoints)) + numpy.repeat(arcMoves - arcRowCount - (numpy.cumsum(arcRowCount) - arcRowCount), arcRowCount)
+			points[arcRows] = arcPoints
+			extrusion[arcRows] = numpy.repeat(extrusion[arcMoves], arcRowCount)
+			feedrates[arcRows] = numpy.repeat(feedrates[arcMoves], arcRowCount)
+
+		pathThickness = numpy.where(eventKind == 0, finalThickness[segment[eventLine] - 1], lineThickness[eventLine])
+
+		tp._points.append(points)
+		tp._extrusion.append(extrusion)
+		tp._feedrate.append(feedrates)
+		pathBase = tp.pathCount()
+		tp._pathStart.append(rowBase + startRows)
+		tp._pathMoveType.append(eventMoveType[newPath])
+		tp._pathFeature.append(eventFeature[newPath])
+		tp._pathExtruder.append(extruder[eventLine[newPath]])
+		tp._pathThickness.append(self._clampThickness(pathThickness[newPath]))
+		tp._layerStart.append(pathBase + numpy.flatnonzero(eventKind[newPath] == 0))
+
+		#A move which drops a lot in height sets the Z of the previous position to zero, this also changes the stored point
+		# and the copies of it that start new paths, but only within the current layer.
+		layerRows = rowBase + startRows[eventKind[newPath] == 0]
+		lastLayerEvent = numpy.where(eventKind == 0, numpy.arange(eventCount), -1)
+		numpy.maximum.accumulate(lastLayerEvent, out=lastLayerEvent)
+		posChange = isMove | isHome
+		lastPosChange = numpy.where(posChange, lineIdx, -1)
+		numpy.maximum.accumulate(lastPosChange, out=lastPosChange)
+		for eventNr in numpy.flatnonzero(isMoveEvent & zReset[eventLine]).tolist():
+			line = eventLine[eventNr]
+			if line > 0 and lastPosChange[line - 1] >= 0:
+				if not isMove[lastPosChange[line - 1]]:
+					continue
+			elif not st.lastPointIsPos:
+				continue
+			if prevMoveEvent[eventNr] >= 0:
+				startRow = rowBase + eventEndRow[prevMoveEvent[eventNr]]
+			else:
+				startRow = st.lastPointRow
+			if lastLayerEvent[eventNr] >= 0:
+				startRow = max(startRow, rowBase + eventRow[lastLayerEvent[eventNr]])
+			else:
+				startRow = max(startRow, st.layerStartRow)
+			tp.points[startRow:rowBase + eventPointRow[eventNr], 2] = 0.0
+
+		#Report unknown codes once per block
+		unknown = numpy.unique(g[(g >= 0) & ~numpy.in1d(g, _KNOWN_G_CODES)])
+		for code in unknown.tolist():
+			if ('G', code) not in self.unknownCodes:
+				self.unknownCodes.add(('G', code))
+				print "Unknown G code:" + str(code)
+		unknown = numpy.unique(m[(m >= 0) & ~numpy.in1d(m, _KNOWN_M_CODES)])
+		for code in unknown.tolist():
+			if ('M', code) not in self.unknownCodes:
+				self.unknownCodes.add(('M', code))
+				print "Unknown M code:" + str(code)
+
+		#Carry the state over to the next block.
+		st.pos = pos[-1].tolist()
+		st.currentE = float(currentE[-1])
+		st.posAbs = bool(posAbs[-1])
+		st.scale = float(scale[-1])
+		st.absoluteE = bool(absoluteE[-1])
+		st.multiplier = float(multiplier[-1])
+		st.extruder = int(extruder[-1])
+		st.feature = tp.featureNames[feature[-1]]
+		st.feedrate = float(feedrate[-1])
+		st.moveType = int(lastMoveType[-1])
+		st.layerThickness = float(finalThickness[-1])
+		if eventCount > 0:
+			st.pathKey = (int(eventMoveType[-1]), tp.featureNames[eventFeature[-1]])
+		if len(moveLines) > 0:
+			st.lastPoint = pos[moveLines[-1]].tolist()
+			st.lastPointRow = rowBase + int(moveRows[-1])
+		if len(layerRows) > 0:
+			st.layerStartRow = int(layerRows[-1])
+		if lastPosChange[-1] >= 0:
+			st.lastPointIsPos = bool(isMove[lastPosChange[-1]])
+
+def parseStream(read, progressCallback = None, size = None, chunkSize = None, p = None):
+	"""
+	Parse GCode from a read function (like file.read) in blocks of chunkSize bytes.
+	The progressCallback is called after each block with the fraction of the data that is parsed,
+	if it returns True parsing is aborted. Returns the parser, its toolpath holds the result.
+	"""
+	if p is None:
+		p = parser()
+	if chunkSize is None:
+		chunkSize = CHUNK_SIZE
+	done = 0
+	while True:
+		data = read(chunkSize)
+		if len(data) < 1:
+			break
+		p.feed(data)
+		done += len(data)
+		if progressCallback is not None and size:
+			if progressCallback(float(done) / float(size)):
+				return p
+	p.finish()
+	if progressCallback is not None and size:
+		progressCallback(1.0)
+	return p
@@ -1,6 +1,7 @@
 """
 The GCodeInterpreter module generates layer information from GCode.
 It does this by parsing the whole GCode file. On large files this can take a while and should be used from a thread.
+Files and BigDataStorage objects are parsed by the vectorized parser in gcodeColumnar, lists of lines by the line based parser.
 """
 __copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
 
@@ -10,9 +11,14 @@ import os
 import time
 import numpy
 import types
+import array
 import cStringIO as StringIO
 
 from Cura.util import profile
+from Cura.util import gcodeColumnar
+from Cura.util import gcodeParallel
+from Cura.util import gcodeStatistics
+from Cura.util import gcodeTimeEstimator
 
 def gcodePath(newType, pathType, layerThickness, startPoint):
 	"""
@@ -28,6 +34,68 @@ def gcodePath(newType, pathType, layerThickness, startPoint):
 			'points': [startPoint],
 			'extrusion': [0.0]}
 
+class gcodePathRecord(object):
+	"""
+	Compact path of the line based parser. A dictionary per path costs over a kilobyte, which adds up to most of the
+	memory of a parsed file. The points and extrusion of all paths of a layer are stored in a single array,
+	and each path only stores its range in it. The record can be used like the dictionary from gcodePath.
+	"""
+	__slots__ = ['type', 'pathType', 'layerThickness', 'extruder', '_points', '_extrusion', '_start', '_end']
+	_KEYS = frozenset(['type', 'pathType', 'layerThickness', 'extruder', 'points', 'extrusion'])
+
+	def __init__(self, moveType, pathType, layerThickness, extruder):
+		self.type = moveType
+		self.pathType = pathType
+		self.layerThickness = layerThickness
+		self.extruder = extruder
+		self._points = None
+		self._extrusion = None
+		self._start = 0
+		self._end = 0
+
+	def _setData(self, points, extrusion, start, end):
+		self._points = points
+		self._extrusion = extrusion
+		self._start = start
+		self._end = end
+
+	@property
+	def points(self):
+		return self._points[self._start:self._end]
+
+	@points.setter
+	def points(self, points):
+		self._setData(points, self.extrusion, 0, len(points))
+
+	@property
+	def extrusion(self):
+		return self._extrusion[self._start:self._end]
+
+	@extrusion.setter
+	def extrusion(self, extrusion):
+		self._setData(self.points, extrusion, 0, len(extrusion))
+
+	def keys(self):
+		return list(self._KEYS)
+
+	def __contains__(self, key):
+		return key in self._KEYS
+
+	def __getitem__(self, key):
+		if key not in self._KEYS:
+			raise KeyError(key)
+		return getattr(self, key)
+
+	def __setitem__(self, key, value):
+		if key not in self._KEYS:
+			raise KeyError(key)
+		setattr(self, key, value)
+
+	def get(self, key, default = None):
+		if key not in self._KEYS:
+			return default
+		return getattr(self, key)
+
 class gcode(object):
 	"""
 	The heavy lifting GCode parser. This is most likely the hardest working python code in Cura.
@@ -36,6 +104,7 @@ class gcode(object):
 	def __init__(self):
 		self.regMatch = {}
 		self.layerList = None
+		self.toolpath = None
 		self.extrusionAmount = 0
 		self.filename = None
 		self.progressCallback = None
@@ -46,14 +115,45 @@ class gcode(object):
 			self.filename = data
 			self._fileSize = os.stat(data).st_size
 			gcodeFile = open(data, 'r')
-			self._load(gcodeFile)
+			self._loadColumnar(gcodeFile)
 			gcodeFile.close()
 		elif type(data) is list:
 			self._load(data)
 		else:
 			self._fileSize = len(data)
 			data.seekStart()
-			self._load(data)
+			self._loadColumnar(data)
+
+	def _loadColumnar(self, gcodeFile):
+		"""
+		Parse the GCode with the vectorized parser. The layerList is a view on the resulting toolpath columns.
+		Large files are split in layers which are parsed by multiple processes.
+		"""
+		if gcodeParallel.useParallel(self._fileSize):
+			self.toolpath = gcodeColumnar.gcodeToolpath()
+			self.layerList = gcodeColumnar.layerListView(self.toolpath)
+			gcodeParallel.parseParallel(gcodeFile, self._fileSize, self.progressCallback, toolpath=self.toolpath)
+			return
+		p = gcodeColumnar.parser()
+		self.toolpath = p.toolpath
+		self.layerList = gcodeColumnar.layerListView(self.toolpath)
+		gcodeColumnar.parseStream(gcodeFile.read, self.progressCallback, self._fileSize, p=p)
+
+	def getStatistics(self):
+		"""
+		Per layer and per feature statistics of the parsed GCode, or None when the GCode is not completely parsed by the vectorized parser.
+		"""
+		if self.toolpath is None or not self.toolpath.finished:
+			return None
+		return gcodeStatistics.gcodeStatistics(self.toolpath)
+
+	def estimatePrintTime(self):
+		"""
+		Estimated print time in seconds of the parsed GCode, or None when the GCode is not completely parsed by the vectorized parser.
+		"""
+		if self.toolpath is None or not self.toolpath.finished:
+			return None
+		return gcodeTimeEstimator.estimatePrintTime(self.toolpath)
 
 	def calculateWeight(self):
 		#Calculates the weight of the filament in kg
@@ -72,6 +172,24 @@ class gcode(object):
 			return "%.2f" % (self.extrusionAmount / 1000 * cost_meter)
 		return None
 	
+	def _arcPoints(self, line, oldPos, pos, scale, clockwise):
+		"""
+		The points between the line segments of an arc move, with the same tessellation as the columnar parser.
+		"""
+		i = getCodeFloat(line, 'I')
+		j = getCodeFloat(line, 'J')
+		r = getCodeFloat(line, 'R')
+		start = numpy.array([oldPos], numpy.float64)
+		end = numpy.array([pos], numpy.float64)
+		if i is not None or j is not None:
+			center = numpy.array([[oldPos[0] + (i or 0.0) * scale, oldPos[1] + (j or 0.0) * scale]], numpy.float64)
+		elif r is not None:
+			center = gcodeColumnar.arcCenter(start, end, numpy.array([r * scale]), numpy.array([clockwise]))
+		else:
+			return []
+		counts, points = gcodeColumnar.tessellateArcs(start, end, center, numpy.array([clockwise]), profile.getPreferenceFloat('gcode_arc_tolerance'))
+		return points.tolist()
+
 	def _load(self, gcodeFile):
 		self.layerList = []
 		pos = [0.0,0.0,0.0]
@@ -86,11 +204,25 @@ class gcode(object):
 		moveType = 'move'
 		layerThickness = 0.1
 		pathType = 'CUSTOM'
+		if profile.getProfileSetting('spiralize') == 'True':
+			spiralizeThickness = profile.getProfileSettingFloat('layer_height')
+		else:
+			spiralizeThickness = None
+		#The points and extrusion of the current layer are stored in flat arrays, and converted to numpy arrays
+		# once at the end of the layer. Paths only store the index of their first point until then.
+		# lastPoint is the last stored point, posRow is the first row of the current layer which stores pos, or None.
 		currentLayer = []
-		currentPath = gcodePath('move', pathType, layerThickness, pos)
-		currentPath['extruder'] = currentExtruder
-
+		layerPoints = array.array('f')
+		layerExtrusion = array.array('f')
+		pathStarts = []
+		lastPoint = pos
+		posRow = 0
+		currentPath = self._newPath('move', pathType, layerThickness, currentExtruder, spiralizeThickness)
 		currentLayer.append(currentPath)
+		pathStarts.append(0)
+		layerPoints.extend(pos)
+		layerExtrusion.append(0.0)
+
 		for line in gcodeFile:
 			if type(line) is tuple:
 				line = line[0]
@@ -110,24 +242,28 @@ class gcode(object):
 					pathType = 'SKIRT'
 				#Cura layer comments.
 				if comment.startswith('LAYER:'):
-					currentPath = gcodePath(moveType, pathType, layerThickness, currentPath['points'][-1])
-					layerThickness = 0.0
-					currentPath['extruder'] = currentExtruder
-					for path in currentLayer:
-						path['points'] = numpy.array(path['points'], numpy.float32)
-						path['extrusion'] = numpy.array(path['extrusion'], numpy.float32)
+					self._finishLayer(currentLayer, pathStarts, layerPoints, layerExtrusion)
 					self.layerList.append(currentLayer)
+					currentPath = self._newPath(moveType, pathType, layerThickness, currentExtruder, spiralizeThickness)
+					layerThickness = 0.0
+					currentLayer = [currentPath]
+					layerPoints = array.array('f', lastPoint)
+					layerExtrusion = array.array('f', [0.0])
+					pathStarts = [0]
+					if lastPoint is pos:
+						posRow = 0
+					else:
+						posRow = None
 					if self.progressCallback is not None:
 						if self.progressCallback(float(gcodeFile.tell()) / float(self._fileSize)):
 							#Abort the loading, we can safely return as the results here will be discarded
 							gcodeFile.close()
 							return
-					currentLayer = [currentPath]
 				line = line[0:line.find(';')]
 
 			G = getCodeInt(line, 'G')
 			if G is not None:
-				if G == 0 or G == 1:	#Move
+				if G == 0 or G == 1 or G == 2 or G == 3:	#Move, G2 and G3 are clockwise and counter clockwise arcs
 					x = getCodeFloat(line, 'X')
 					y = getCodeFloat(line, 'Y')
 					z = getCodeFloat(line, 'Z')
@@ -163,23 +299,40 @@ class gcode(object):
 					if moveType == 'move' and oldPos[2] != pos[2]:
 						if oldPos[2] > pos[2] and abs(oldPos[2] - pos[2]) > 5.0 and pos[2] < 1.0:
 							oldPos[2] = 0.0
+							#The old position can already be stored in the current layer, update those copies as well.
+							if posRow is not None:
+								for n in xrange(posRow * 3 + 2, len(layerPoints), 3):
+									layerPoints[n] = 0.0
 						if layerThickness == 0.0:
 							layerThickness = abs(oldPos[2] - pos[2])
-					if currentPath['type'] != moveType or currentPath['pathType'] != pathType:
-						currentPath = gcodePath(moveType, pathType, layerThickness, currentPath['points'][-1])
-						currentPath['extruder'] = currentExtruder
+					if currentPath.type != moveType or currentPath.pathType != pathType:
+						currentPath = self._newPath(moveType, pathType, layerThickness, currentExtruder, spiralizeThickness)
 						currentLayer.append(currentPath)
+						pathStarts.append(len(layerExtrusion))
+						layerPoints.extend(lastPoint)
+						layerExtrusion.append(0.0)
 
-					currentPath['points'].append(pos)
-					currentPath['extrusion'].append(e * extrudeAmountMultiply)
+					arcPoints = []
+					if G == 2 or G == 3:
+						arcPoints = self._arcPoints(line, oldPos, pos, scale, G == 2)
+					for point in arcPoints:
+						layerPoints.extend(point)
+						layerExtrusion.append(e * extrudeAmountMultiply / (len(arcPoints) + 1))
+					posRow = len(layerExtrusion)
+					lastPoint = pos
+					layerPoints.extend(pos)
+					layerExtrusion.append(e * extrudeAmountMultiply / (len(arcPoints) + 1))
 				elif G == 4:	#Delay
 					S = getCodeFloat(line, 'S')
 					P = getCodeFloat(line, 'P')
 				elif G == 10:	#Retract
-					currentPath = gcodePath('retract', pathType, layerThickness, currentPath['points'][-1])
-					currentPath['extruder'] = currentExtruder
+					currentPath = self._newPath('retract', pathType, layerThickness, currentExtruder, spiralizeThickness)
 					currentLayer.append(currentPath)
-					currentPath['points'].append(currentPath['points'][0])
+					pathStarts.append(len(layerExtrusion))
+					layerPoints.extend(lastPoint)
+					layerPoints.extend(lastPoint)
+					layerExtrusion.append(0.0)
+					layerExtrusion.append(0.0)
 				elif G == 11:	#Push back after retract
 					pass
 				elif G == 20:	#Units are inches
@@ -191,6 +344,7 @@ class gcode(object):
 					y = getCodeFloat(line, 'Y')
 					z = getCodeFloat(line, 'Z')
 					center = [0.0,0.0,0.0]
+					posRow = None
 					if x is None and y is None and z is None:
 						pos = center
 					else:
@@ -284,13 +438,28 @@ class gcode(object):
 							posOffset[0] += profile.getMachineSettingFloat('extruder_offset_x%d' % (currentExtruder))
 							posOffset[1] += profile.getMachineSettingFloat('extruder_offset_y%d' % (currentExtruder))
 
-		for path in currentLayer:
-			path['points'] = numpy.array(path['points'], numpy.float32)
-			path['extrusion'] = numpy.array(path['extrusion'], numpy.float32)
+		self._finishLayer(currentLayer, pathStarts, layerPoints, layerExtrusion)
 		self.layerList.append(currentLayer)
 		if self.progressCallback is not None and self._fileSize > 0:
 			self.progressCallback(float(gcodeFile.tell()) / float(self._fileSize))
 
+	def _newPath(self, moveType, pathType, layerThickness, extruder, spiralizeThickness):
+		if layerThickness <= 0.0:
+			layerThickness = 0.01
+		if spiralizeThickness is not None:
+			layerThickness = spiralizeThickness
+		return gcodePathRecord(moveType, pathType, layerThickness, extruder)
+
+	def _finishLayer(self, layer, pathStarts, layerPoints, layerExtrusion):
+		"""
+		Convert the flat point and extrusion arrays of a layer to numpy, and give each path a slice of them.
+		"""
+		points = numpy.frombuffer(layerPoints, numpy.float32).reshape((-1, 3))
+		extrusion = numpy.frombuffer(layerExtrusion, numpy.float32)
+		pathEnds = pathStarts[1:] + [len(extrusion)]
+		for path, start, end in zip(layer, pathStarts, pathEnds):
+			path._setData(points, extrusion, start, end)
+
 def getCodeInt(line, code):
 	n = line.find(code) + 1
 	if n < 1:
@@ -0,0 +1,218 @@
+"""
+The gcodeLayerIndex module allows showing very large GCode files without interpreting all of it.
+A single pass over the GCode records the byte offset and height of each ';LAYER:' line, and the parser state at that
+point (position, E, feedrate, relative/absolute modes, units, extruder and feature). The GCode is parsed for this, but
+the parsed toolpath is thrown away, so the memory use does not grow with the size of the GCode.
+
+The lazyLayerList uses this index to look like the layerList of the gcodeInterpreter, but it only interprets a layer
+when it is requested, starting from the recorded state. The interpreted layers are kept in a small least recently used cache.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import re
+import threading
+import collections
+import numpy
+
+from Cura.util import gcodeColumnar
+
+#GCode larger then this is shown with a lazyLayerList instead of interpreting all of it.
+MIN_LAZY_SIZE = 128 * 1024 * 1024
+#Amount of interpreted layers that are kept in memory.
+LAYER_CACHE_SIZE = 32
+#Amount of bytes read at once while scanning.
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+_layerZRe = re.compile(r'^[ \t]*G[0-3][ \t][^;\n]*Z[ \t]*(-?[0-9.]+)', re.MULTILINE)
+
+class layerIndex(object):
+	"""
+	Byte offsets of the ';LAYER:' lines in a GCode file. Layer 0 is all the GCode before the first ';LAYER:' line,
+	and layer N starts at the Nth ';LAYER:' line, which matches the layer numbering of the gcodeInterpreter.
+	"""
+	def __init__(self):
+		self._offsets = gcodeColumnar.growableArray(numpy.int64)
+		self._z = gcodeColumnar.growableArray(numpy.float32)
+		#For each layer start, the parserState at that point.
+		self._states = []
+		self.size = 0
+		self.finished = False
+
+	def layerCount(self):
+		"""
+		The amount of layers for which the start and end are known.
+		"""
+		if self.finished:
+			return len(self._offsets) + 1
+		return len(self._offsets)
+
+	def getLayerRange(self, layerNr):
+		"""
+		Returns the start and end byte offset of a layer.
+		"""
+		offsets = self._offsets.getArray()
+		if layerNr == 0:
+			start = 0
+		else:
+			start = int(offsets[layerNr - 1])
+		if layerNr < len(offsets):
+			return start, int(offsets[layerNr])
+		return start, self.size
+
+	def getLayerZ(self, layerNr):
+		"""
+		The height of the first move in a layer, or None for layer 0.
+		"""
+		if layerNr == 0:
+			return None
+		return float(self._z.getArray()[layerNr - 1])
+
+	def getState(self, layerNr):
+		"""
+		A copy of the parserState at the start of a layer, or None for layer 0.
+		"""
+		if layerNr == 0:
+			return None
+		return self._states[layerNr - 1].copy()
+
+	def scan(self, read, progressCallback = None, size = None, settings = None):
+		"""
+		Read all GCode from the read function and record the start of each layer.
+		The progressCallback is called after each chunk, if it returns True the scan is aborted.
+		"""
+		if settings is None:
+			settings = gcodeColumnar.getParserSettings()
+		state = gcodeColumnar.parserState()
+		state.extruderOffsets = settings['extruderOffsets'].copy()
+		p = gcodeColumnar.parser(state = state, spiralize = settings['spiralize'], layerHeight = settings['layerHeight'], arcTolerance = settings['arcTolerance'])
+		def parse(data):
+			#Only the state is kept, each part is parsed into a new toolpath.
+			if data == '':
+				return
+			if p.toolpath.pointCount() > 0:
+				p.toolpath = gcodeColumnar.gcodeToolpath()
+				state.lastPointRow = 0
+				state.layerStartRow = 0
+			p.parseBlock(data)
+		pending = ''
+		base = 0
+		needZ = False
+		z = 0.0
+		while True:
+			data = read(SCAN_CHUNK_SIZE)
+			if len(data) < 1:
+				break
+			data = pending + data
+			end = data.rfind('\n') + 1
+			pending = data[end:]
+			data = data[:end]
+
+			pos = 0
+			parsed = 0
+			while True:
+				layerPos = data.find(';LAYER:', pos)
+				while layerPos > 0 and data[layerPos - 1] != '\n':
+					layerPos = data.find(';LAYER:', layerPos + 1)
+				layerEnd = layerPos if layerPos >= 0 else len(data)
+				if needZ:
+					m = _layerZRe.search(data, pos, layerEnd)
+					if m is not None:
+						try:
+							z = float(m.group(1))
+						except ValueError:
+							pass
+						self._z.getArray()[-1] = z
+						needZ = False
+				if layerPos < 0:
+					break
+				parse(data[parsed:layerPos])
+				parsed = layerPos
+				self._states.append(state.copy())
+				self._z.append([z])
+				self._offsets.append([base + layerPos])
+				needZ = True
+				pos = layerPos + 1
+			parse(data[parsed:])
+			base += len(data)
+			if progressCallback is not None and size:
+				if progressCallback(float(base) / float(size)):
+					return False
+		self.size = base + len(pending)
+		self.finished = True
+		if progressCallback is not None and size:
+			progressCallback(1.0)
+		return True
+
+class lazyLayerList(object):
+	"""
+	Layer list which interprets layers from the GCode source when they are requested.
+	The source needs read and seek functions, like a file or a BigDataStorage.
+	The index is filled by the scan function, which can run on another thread while layers are already requested.
+	"""
+	def __init__(self, source, cacheSize = LAYER_CACHE_SIZE):
+		self._source = source
+		self._lock = threading.Lock()
+		self._cache = collections.OrderedDict()
+		self._cacheSize = cacheSize
+		self._settings = gcodeColumnar.getParserSettings()
+		self.index = layerIndex()
+
+	def _readAt(self, offset, size):
+		data = []
+		with self._lock:
+			self._source.seek(offset)
+			while size > 0:
+				chunk = self._source.read(size)
+				if len(chunk) < 1:
+					break
+				data.append(chunk)
+				size -= len(chunk)
+		return ''.join(data)
+
+	def scan(self, progressCallback = None, size = None):
+		pos = [0]
+		def read(size):
+			data = self._readAt(pos[0], size)
+			pos[0] += len(data)
+			return data
+		return self.index.scan(read, progressCallback, size, self._settings)
+
+	def _parseLayer(self, layerNr):
+		start, end = self.index.getLayerRange(layerNr)
+		if layerNr == 0:
+			p = gcodeColumnar.parser(spiralize = self._settings['spiralize'], layerHeight = self._settings['layerHeight'], arcTolerance = self._settings['arcTolerance'])
+			p.state.extruderOffsets = self._settings['extruderOffsets'].copy()
+		else:
+			state = self.index.getState(layerNr)
+			state.lastPointRow = 0
+			state.layerStartRow = 0
+			p = gcodeColumnar.parser(gcodeColumnar.gcodeToolpath(), state, spiralize = self._settings['spiralize'], layerHeight = self._settings['layerHeight'], arcTolerance = self._settings['arcTolerance'])
+		p.feed(self._readAt(start, end - start))
+		p.finish()
+		return p.toolpath.getLayer(0)
+
+	def getLayer(self, layerNr):
+		if layerNr in self._cache:
+			layer = self._cache.pop(layerNr)
+		else:
+			layer = self._parseLayer(layerNr)
+		self._cache[layerNr] = layer
+		while len(self._cache) > self._cacheSize:
+			self._cache.popitem(False)
+		return layer
+
+	def __len__(self):
+		return self.index.layerCount()
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self.getLayer(n) for n in xrange(*index.indices(len(self)))]
+		if index < 0:
+			index += len(self)
+		if index < 0 or index >= len(self):
+			raise IndexError('layer index out of range')
+		return self.getLayer(index)
+
+	def __iter__(self):
+		for n in xrange(0, len(self)):
+			yield self.getLayer(n)
@@ -0,0 +1,182 @@
+"""
+The gcodeParallel module parses large GCode files with multiple processes.
+The GCode is split into shards at ';LAYER:' lines, and each shard is parsed by the gcodeColumnar parser in a process pool.
+
+A shard needs the interpreter state at its start (position, E, absolute/relative flags, extruder, M221 multiplier).
+This is not known until the previous shard is parsed, so each worker first warms up its parser state by parsing the
+modal GCode lines that come before the shard and the two layers before the shard. For normal slicer output this
+gives the exact state. After all shards are done the start states are checked against the end state of the previous
+shard, and shards with a wrong start state are read from the source again and parsed again, so the result is always the
+same as a sequential parse.
+
+Workers return their results in memory mapped temporary files, so no point data is pickled between the processes.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import re
+import tempfile
+import multiprocessing
+
+from Cura.util import profile
+from Cura.util import gcodeColumnar
+
+#Files smaller then this are parsed in a single process, as starting the processes costs more then it gains.
+MIN_PARALLEL_SIZE = 32 * 1024 * 1024
+#Target and minimal size of a single shard.
+SHARD_SIZE = 8 * 1024 * 1024
+MIN_SHARD_SIZE = 1024 * 1024
+
+#Lines which change modal state that is not set in each layer.
+_modalLineRe = re.compile(r'^[ \t]*(?:G9[01]|G2[01]|M8[23]|M221|T\d)[^\n]*\n', re.MULTILINE)
+
+#State fields which influence the result of a shard that starts at a layer.
+_STATE_FIELDS = ['pos', 'lastPoint', 'lastPointIsPos', 'currentE', 'extruder', 'multiplier', 'absoluteE', 'posAbs', 'scale', 'feedrate', 'moveType', 'feature', 'layerThickness']
+
+def getProcessCount():
+	"""
+	The amount of processes to use for parsing, from the 'gcode_parse_processes' preference. 0 means one per CPU core.
+	"""
+	try:
+		count = int(profile.getPreference('gcode_parse_processes'))
+	except ValueError:
+		count = 0
+	if count < 1:
+		try:
+			count = multiprocessing.cpu_count()
+		except NotImplementedError:
+			count = 1
+	return count
+
+def useParallel(size):
+	return size >= MIN_PARALLEL_SIZE and getProcessCount() > 1
+
+def _statesEqual(a, b):
+	for field in _STATE_FIELDS:
+		if getattr(a, field) != getattr(b, field):
+			return False
+	return True
+
+def _parseShard(args):
+	"""
+	Worker function, parses a single shard into a temporary toolpath file.
+	Returns the filename, the start state that was used and the end state.
+	"""
+	shardNr, warmup, data, state, settings = args
+	if state is None:
+		state = gcodeColumnar.warmupState(warmup, settings)
+	startState = state.copy()
+	state.lastPointRow = 0
+	state.layerStartRow = 0
+	if shardNr == 0:
+		toolpath = None
+	else:
+		toolpath = gcodeColumnar.gcodeToolpath()
+	p = gcodeColumnar.parser(toolpath, state, spiralize = settings['spiralize'], layerHeight = settings['layerHeight'], arcTolerance = settings['arcTolerance'])
+	p.feed(data)
+	p.finish()
+	f = tempfile.NamedTemporaryFile(prefix='CuraToolpath', suffix='.bin', delete=False)
+	gcodeColumnar.saveToolpath(p.toolpath, f)
+	f.close()
+	return f.name, startState, p.state
+
+def _splitShards(read, shardSize):
+	"""
+	Generator which reads the GCode and yields (warmup, data) tuples for each shard.
+	Shards start at a ';LAYER:' line. The warmup contains the modal lines before the shard and the two layers before the shard,
+	two layers are needed as the layer thickness is measured from the height of the layer before it.
+	"""
+	modalLines = []
+	pending = ''
+	tail = ''
+	while True:
+		data = read(shardSize)
+		pending += data
+		split = -1
+		if len(data) > 0 and len(pending) >= shardSize:
+			split = pending.find('\n;LAYER:', shardSize / 2) + 1
+		elif len(data) < 1:
+			split = len(pending)
+		if split > 0:
+			shard = pending[:split]
+			pending = pending[split:]
+			yield ''.join(modalLines) + tail, shard
+			modalLines += _modalLineRe.findall(shard)
+			tail += shard
+			start = tail.rfind('\n;LAYER:')
+			if start >= 0:
+				start = tail.rfind('\n;LAYER:', 0, start)
+			tail = tail[start + 1:]
+		if len(data) < 1:
+			break
+
+def _readAt(source, offset, size):
+	source.seek(offset)
+	data = []
+	while size > 0:
+		chunk = source.read(size)
+		if len(chunk) < 1:
+			break
+		data.append(chunk)
+		size -= len(chunk)
+	return ''.join(data)
+
+def parseParallel(source, size, progressCallback = None, processCount = None, toolpath = None):
+	"""
+	Parse GCode from a source with read and seek functions, like a file or a BigDataStorage, with a process pool.
+	The source is read from its current position, which has to be the start of the GCode.
+	The shards are added to the given (empty) toolpath in order as soon as they are done, so the first layers can be used
+	while the rest is still being parsed. Returns the resulting gcodeToolpath, or None when the progressCallback asked to abort.
+	"""
+	if processCount is None:
+		processCount = getProcessCount()
+	settings = gcodeColumnar.getParserSettings()
+	shardSize = max(MIN_SHARD_SIZE, min(SHARD_SIZE, size / (processCount * 4) + 1))
+
+	pool = multiprocessing.Pool(processCount)
+	jobs = []
+	#The (offset, length) of each shard in the source, only the shards which are parsed again are read again.
+	shards = []
+	if toolpath is None:
+		toolpath = gcodeColumnar.gcodeToolpath()
+	try:
+		offset = source.tell()
+		for warmup, data in _splitShards(source.read, shardSize):
+			if len(jobs) == 0:
+				state = gcodeColumnar.parserState()
+				state.extruderOffsets = settings['extruderOffsets'].copy()
+			else:
+				state = None
+			shards.append((offset, len(data)))
+			offset += len(data)
+			jobs.append(pool.apply_async(_parseShard, ((len(jobs), warmup, data, state, settings),)))
+
+		done = 0
+		endState = None
+		for shardNr, job in enumerate(jobs):
+			filename, startState, state = job.get()
+			jobs[shardNr] = None
+			if endState is not None and not _statesEqual(startState, endState):
+				#The warmup did not give the right state, parse this shard again with the real state.
+				os.unlink(filename)
+				shardOffset, shardLength = shards[shardNr]
+				filename, startState, state = _parseShard((shardNr, None, _readAt(source, shardOffset, shardLength), endState.copy(), settings))
+			endState = state
+			done += shards[shardNr][1]
+			shardToolpath = gcodeColumnar.loadToolpath(filename)
+			toolpath.extend(shardToolpath)
+			toolpath.finished = False
+			del shardToolpath
+			os.unlink(filename)
+			if progressCallback is not None and size > 0:
+				if progressCallback(min(1.0, float(done) / float(size))):
+					return None
+	finally:
+		pool.terminate()
+		pool.join()
+		#Remove the results of shards which are not used because of an abort.
+		for job in jobs:
+			if job is not None and job.ready() and job.successful():
+				os.unlink(job.get()[0])
+	toolpath.finished = True
+	return toolpath
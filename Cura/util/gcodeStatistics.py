@@ -0,0 +1,80 @@
+"""
+The gcodeStatistics module calculates statistics of an interpreted GCode toolpath, for quoting and checking prints.
+All statistics are calculated in a single pass of numpy operations over the point and extrusion columns of the toolpath,
+instead of looping over the paths of the layerList.
+
+Extrusion amounts are in mm of filament, and are the deposited amount: only the extrusion of moves in extrusion paths
+is counted, retractions and the primes after them are left out.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import math
+import numpy
+
+from Cura.util import profile
+from Cura.util import gcodeColumnar
+
+class gcodeStatistics(object):
+	"""
+	Per layer and per feature statistics of a toolpath.
+	Per layer arrays are indexed with the layer number of the layerList, per feature arrays with the index in featureNames.
+	"""
+	def __init__(self, toolpath, filamentDiameter = None):
+		if filamentDiameter is None:
+			filamentDiameter = profile.getProfileSettingFloat('filament_diameter')
+		self.filamentArea = math.pi * (filamentDiameter / 2.0) ** 2
+		self.featureNames = list(toolpath.featureNames)
+
+		layerCount = len(toolpath.layerOffsets) - 1
+		pathLengths = numpy.diff(toolpath.pathOffsets)
+		pathLayer = numpy.repeat(numpy.arange(layerCount), numpy.diff(toolpath.layerOffsets))
+		pointLayer = numpy.repeat(pathLayer, pathLengths)
+		pointMoveType = numpy.repeat(toolpath.pathMoveType, pathLengths)
+		pointFeature = numpy.repeat(toolpath.pathFeature, pathLengths)
+		pointExtruder = numpy.repeat(toolpath.pathExtruder, pathLengths)
+
+		#Length of the move towards each point. The first point of a path is a copy of the previous point, so it has no length.
+		points = toolpath.points
+		distance = numpy.zeros(len(points), numpy.float64)
+		if len(points) > 1:
+			delta = numpy.diff(points.astype(numpy.float64), axis=0)
+			distance[1:] = numpy.sqrt((delta * delta).sum(axis=1))
+		distance[toolpath.pathOffsets[:-1]] = 0.0
+		extrusion = toolpath.extrusion.astype(numpy.float64)
+
+		isMove = pointMoveType == gcodeColumnar.MOVE
+		isExtrude = pointMoveType == gcodeColumnar.EXTRUDE
+		#A prime does not move the head, so it has no distance.
+		deposited = numpy.where(isExtrude & (distance > 0.0), numpy.maximum(extrusion, 0.0), 0.0)
+		self.layerExtrusion = numpy.bincount(pointLayer, deposited, layerCount)
+		self.layerTravelDistance = numpy.bincount(pointLayer, distance * isMove, layerCount)
+		self.layerExtrudeDistance = numpy.bincount(pointLayer, distance * isExtrude, layerCount)
+		self.layerRetractCount = numpy.bincount(pathLayer[toolpath.pathMoveType == gcodeColumnar.RETRACT], minlength=layerCount)[:layerCount]
+		featureCount = len(self.featureNames)
+		self.layerFeatureExtrusion = numpy.bincount(pointLayer * featureCount + pointFeature, deposited, layerCount * featureCount).reshape((layerCount, featureCount))
+		self.extruderExtrusion = numpy.bincount(pointExtruder, deposited, 4)
+
+	def layerCount(self):
+		return len(self.layerExtrusion)
+
+	def getTotalExtrusion(self):
+		return float(self.layerExtrusion.sum())
+
+	def getTotalTravelDistance(self):
+		return float(self.layerTravelDistance.sum())
+
+	def getTotalExtrudeDistance(self):
+		return float(self.layerExtrudeDistance.sum())
+
+	def getRetractCount(self):
+		return int(self.layerRetractCount.sum())
+
+	def getFeatureVolumes(self):
+		"""
+		Returns a dictionary with the extruded volume in mm3 of each feature type (';TYPE:' comment).
+		"""
+		volumes = self.layerFeatureExtrusion.sum(axis=0) * self.filamentArea
+		return dict(zip(self.featureNames, volumes.tolist()))
+
+	def getLayerVolume(self, layerNr):
+		return float(self.layerExtrusion[layerNr] * self.filamentArea)
@@ -0,0 +1,106 @@
+"""
+The gcodeTimeEstimator module estimates the print time of an interpreted GCode toolpath, so GCode that was not
+sliced by the CuraEngine (which reports the print time itself) can also get a print time.
+
+Every move is modeled as a trapezoid: accelerate from the entry speed to the feedrate, cruise, and decelerate to the exit
+speed. The speed at the junction of two moves is limited with the junction deviation model of Grbl and newer Marlin versions.
+The limits that acceleration puts on the junction speeds are normally found with a backward and forward pass over all
+moves. In squared speeds these passes are a minimum over cumulative sums, so they are calculated with numpy.minimum.accumulate
+instead of a Python loop.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import numpy
+
+from Cura.util import profile
+
+def _junctionSpeedSquared(unit, speed, stop, acceleration, junctionDeviation):
+	"""
+	Squared maximum speed at the junctions between the moves. Junction 0 is the start of the first move,
+	and the last junction is the end of the last move. At a stop the head needs to stand still.
+	"""
+	count = len(unit)
+	junction = numpy.zeros(count + 1, numpy.float64)
+	if count < 2:
+		return junction
+	cosTheta = -(unit[:-1] * unit[1:]).sum(axis=1)
+	sinHalfTheta = numpy.sqrt(numpy.clip(0.5 * (1.0 - cosTheta), 0.0, 1.0))
+	with numpy.errstate(divide='ignore'):
+		limit = acceleration * junctionDeviation * sinHalfTheta / (1.0 - sinHalfTheta)
+	limit = numpy.where(sinHalfTheta >= 1.0, numpy.inf, limit)
+	limit = numpy.minimum(limit, numpy.minimum(speed[:-1], speed[1:]) ** 2)
+	junction[1:-1] = numpy.where(stop[1:], 0.0, limit)
+	return junction
+
+def _plan(junction, length, acceleration):
+	"""
+	Limit the squared junction speeds so each move can reach them with the given acceleration.
+	The backward pass is B[k] = min(J[k], B[k+1] + 2*a*L[k]) and the forward pass F[k] = min(B[k], F[k-1] + 2*a*L[k-1]),
+	with the cumulative distance P these become cumulative minimums of J + P and B - P.
+	"""
+	cumulative = numpy.zeros(len(junction), numpy.float64)
+	numpy.cumsum(2.0 * acceleration * length, out=cumulative[1:])
+	backward = numpy.minimum.accumulate((junction + cumulative)[::-1])[::-1] - cumulative
+	return numpy.minimum.accumulate(backward - cumulative) + cumulative
+
+def _trapezoidTime(length, entrySpeed, exitSpeed, speed, acceleration):
+	accelerateDistance = (speed * speed - entrySpeed * entrySpeed) / (2.0 * acceleration)
+	decelerateDistance = (speed * speed - exitSpeed * exitSpeed) / (2.0 * acceleration)
+	cruiseDistance = length - accelerateDistance - decelerateDistance
+	cruiseTime = (speed - entrySpeed) / acceleration + (speed - exitSpeed) / acceleration + numpy.maximum(cruiseDistance, 0.0) / speed
+	#Moves which are too short to reach the feedrate accelerate to a peak speed and decelerate again.
+	peakSpeed = numpy.sqrt(numpy.maximum((2.0 * acceleration * length + entrySpeed * entrySpeed + exitSpeed * exitSpeed) / 2.0, 0.0))
+	peakSpeed = numpy.maximum(peakSpeed, numpy.maximum(entrySpeed, exitSpeed))
+	peakTime = (peakSpeed - entrySpeed) / acceleration + (peakSpeed - exitSpeed) / acceleration
+	return numpy.where(cruiseDistance >= 0.0, cruiseTime, peakTime)
+
+def estimateLayerTimes(toolpath, acceleration = None, junctionDeviation = None):
+	"""
+	Estimate the print time in seconds of each layer of a toolpath.
+	Moves without X, Y or Z movement (retractions and primes) take the time to move the filament at the feedrate.
+	"""
+	if acceleration is None:
+		acceleration = profile.getMachineSettingFloat('machine_acceleration')
+	if junctionDeviation is None:
+		junctionDeviation = profile.getMachineSettingFloat('machine_junction_deviation')
+	acceleration = max(acceleration, 1.0)
+	junctionDeviation = max(junctionDeviation, 0.0)
+
+	points = toolpath.points.astype(numpy.float64)
+	layerCount = len(toolpath.layerOffsets) - 1
+	pathLengths = numpy.diff(toolpath.pathOffsets)
+	pointLayer = numpy.repeat(numpy.repeat(numpy.arange(layerCount), numpy.diff(toolpath.layerOffsets)), pathLengths)
+	if len(points) < 2:
+		return numpy.zeros(layerCount, numpy.float64)
+
+	#Each point after the first is the end of a move.
+	delta = numpy.diff(points, axis=0)
+	length = numpy.sqrt((delta * delta).sum(axis=1))
+	speed = numpy.maximum(toolpath.feedrate[1:].astype(numpy.float64) / 60.0, 0.1)
+	extrusion = numpy.abs(toolpath.extrusion[1:].astype(numpy.float64))
+	time = numpy.zeros(len(length), numpy.float64)
+
+	moving = length > 0.0
+	filamentOnly = ~moving & (extrusion > 0.0)
+	time[filamentOnly] = extrusion[filamentOnly] / speed[filamentOnly]
+
+	moveIndex = numpy.flatnonzero(moving)
+	if len(moveIndex) > 0:
+		moveLength = length[moveIndex]
+		moveSpeed = speed[moveIndex]
+		unit = delta[moveIndex] / moveLength[:,numpy.newaxis]
+		#The head stops for a filament only move between two moves.
+		filamentOnlyCount = numpy.cumsum(filamentOnly)
+		stop = numpy.ones(len(moveIndex), numpy.bool)
+		stop[1:] = filamentOnlyCount[moveIndex[1:]] != filamentOnlyCount[moveIndex[:-1]]
+		junction = _junctionSpeedSquared(unit, moveSpeed, stop, acceleration, junctionDeviation)
+		junction = numpy.sqrt(numpy.maximum(_plan(junction, moveLength, acceleration), 0.0))
+		time[moveIndex] = _trapezoidTime(moveLength, junction[:-1], junction[1:], moveSpeed, acceleration)
+
+	return numpy.bincount(pointLayer[1:], time, layerCount)
+
+def estimatePrintTime(toolpath, acceleration = None, junctionDeviation = None):
+	"""
+	Estimate the total print time of a toolpath in seconds.
+	"""
+	return float(estimateLayerTimes(toolpath, acceleration, junctionDeviation).sum())
@@ -0,0 +1,220 @@
+"""
+The gcodeWorker module interprets GCode in a separate process, so parsing does not compete with the GUI for the
+Python interpreter lock.
+
+The worker parses the GCode in segments which end at a ';LAYER:' line. Each finished segment is written to a temporary
+toolpath file, which the GUI process memory maps, so no point data is pickled between the processes. Only the names of
+these files and the progress are sent over a pipe. When all GCode is parsed, the worker writes the complete toolpath,
+which replaces the segments. The worker process is terminated to cancel the parsing.
+Temporary files which can not be removed yet, because they are still memory mapped, are removed by removeTempFiles.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import bisect
+import tempfile
+import threading
+import traceback
+import multiprocessing
+
+from Cura.util import profile
+from Cura.util import gcodeColumnar
+
+#Amount of GCode in each segment that is send to the GUI process.
+SEGMENT_SIZE = 4 * 1024 * 1024
+
+#Temporary files which could not be removed yet. On Windows a file can not be removed while it is memory mapped.
+_pendingFiles = []
+_pendingLock = threading.Lock()
+
+def useWorker():
+	return profile.getPreference('gcode_interpreter_process') == 'True'
+
+def _removeTempFile(filename):
+	#The memory mapped data stays available after the file is removed. On Windows this fails while the file is mapped.
+	try:
+		os.unlink(filename)
+	except OSError:
+		if os.path.exists(filename):
+			with _pendingLock:
+				_pendingFiles.append(filename)
+
+def removeTempFiles():
+	"""
+	Try again to remove the temporary files which were still memory mapped. This is done when a new GCode load starts and
+	when the engine is cleaned up, the toolpaths of older results are released by then.
+	"""
+	with _pendingLock:
+		filenames = _pendingFiles[:]
+		del _pendingFiles[:]
+	for filename in filenames:
+		_removeTempFile(filename)
+
+def _writeToolpath(toolpath):
+	f = tempfile.NamedTemporaryFile(prefix='CuraToolpath', suffix='.bin', delete=False)
+	gcodeColumnar.saveToolpath(toolpath, f)
+	f.close()
+	return f.name
+
+def _splitSegments(read, segmentSize):
+	"""
+	Generator which reads the GCode and yields segments of at least segmentSize bytes, which end before a ';LAYER:' line.
+	"""
+	pending = ''
+	while True:
+		data = read(segmentSize)
+		pending += data
+		if len(data) < 1:
+			if pending != '':
+				yield pending
+			return
+		if len(pending) >= segmentSize:
+			split = pending.rfind('\n;LAYER:') + 1
+			if split > 0:
+				yield pending[:split]
+				pending = pending[split:]
+
+def _workerMain(gcodeFilename, settings, conn):
+	"""
+	Main function of the worker process. Sends ('segment', filename, progress) for each parsed segment, and
+	('done', filename) with the complete toolpath, or ('error', message) when parsing failed.
+	"""
+	try:
+		size = os.stat(gcodeFilename).st_size
+		state = gcodeColumnar.parserState()
+		state.extruderOffsets = settings['extruderOffsets'].copy()
+		complete = gcodeColumnar.gcodeToolpath()
+		toolpath = None
+		done = 0
+		with open(gcodeFilename, 'r') as f:
+			for data in _splitSegments(f.read, SEGMENT_SIZE):
+				if toolpath is not None:
+					toolpath = gcodeColumnar.gcodeToolpath()
+					state.lastPointRow = 0
+					state.layerStartRow = 0
+				p = gcodeColumnar.parser(toolpath, state, spiralize = settings['spiralize'], layerHeight = settings['layerHeight'], arcTolerance = settings['arcTolerance'])
+				p.feed(data)
+				#Each segment ends before a ';LAYER:' line, so its last layer is complete.
+				p.finish()
+				toolpath = p.toolpath
+				complete.extend(toolpath)
+				done += len(data)
+				conn.send(('segment', _writeToolpath(toolpath), float(done) / float(max(1, size))))
+		complete.finished = True
+		conn.send(('done', _writeToolpath(complete)))
+	except:
+		conn.send(('error', traceback.format_exc()))
+	conn.close()
+
+class segmentLayerList(object):
+	"""
+	Layer list over the toolpaths of consecutive segments, which is extended while the worker is parsing.
+	"""
+	def __init__(self):
+		self._toolpaths = []
+		self._layerStarts = []
+		self._layerCount = 0
+
+	def addToolpath(self, toolpath):
+		self._toolpaths.append(toolpath)
+		self._layerStarts.append(self._layerCount)
+		self._layerCount += toolpath.layerCount()
+
+	def __len__(self):
+		return self._layerCount
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self[n] for n in xrange(*index.indices(len(self)))]
+		if index < 0:
+			index += len(self)
+		if index < 0 or index >= len(self):
+			raise IndexError('layer index out of range')
+		segmentNr = bisect.bisect_right(self._layerStarts, index) - 1
+		return self._toolpaths[segmentNr].getLayer(index - self._layerStarts[segmentNr])
+
+	def __iter__(self):
+		for n in xrange(0, len(self)):
+			yield self[n]
+
+class gcodeLoadWorker(object):
+	"""
+	Interprets a GCode file in a worker process. The layerList can be used while the worker is running,
+	and the toolpath is set when the complete GCode is parsed.
+	"""
+	def __init__(self):
+		self._gcodeFilename = None
+		self._removeFile = False
+		self._process = None
+		self._conn = None
+		self.layerList = segmentLayerList()
+		self.toolpath = None
+		self.aborted = False
+
+	def start(self, gcodeFilename, removeFile = False):
+		"""
+		Start the worker process on a GCode file. With removeFile the file is removed when the worker is done.
+		"""
+		removeTempFiles()
+		self._gcodeFilename = gcodeFilename
+		self._removeFile = removeFile
+		if self.aborted:
+			return
+		self._conn, childConn = multiprocessing.Pipe(False)
+		self._process = multiprocessing.Process(target=_workerMain, args=(self._gcodeFilename, gcodeColumnar.getParserSettings(), childConn))
+		self._process.daemon = True
+		self._process.start()
+		childConn.close()
+
+	def run(self, progressCallback = None):
+		"""
+		Receive the results of the worker until it is done. Returns the complete toolpath, or None when parsing failed or was aborted.
+		The progressCallback is called for each segment, if it returns True the worker is stopped.
+		"""
+		if self._process is None:
+			self._removeGCodeFile()
+			return None
+		try:
+			while True:
+				try:
+					message = self._conn.recv()
+				except (EOFError, IOError):
+					return None
+				if message[0] == 'segment':
+					self.layerList.addToolpath(self._loadToolpath(message[1]))
+					if progressCallback is not None and progressCallback(message[2]):
+						self.abort()
+						return None
+				elif message[0] == 'done':
+					self.toolpath = self._loadToolpath(message[1])
+					self.layerList = gcodeColumnar.layerListView(self.toolpath)
+					if progressCallback is not None:
+						progressCallback(1.0)
+					return self.toolpath
+				else:
+					print message[1]
+					return None
+		finally:
+			self._process.join()
+			self._removeGCodeFile()
+
+	def _removeGCodeFile(self):
+		if self._removeFile:
+			self._removeFile = False
+			_removeTempFile(self._gcodeFilename)
+
+	def _loadToolpath(self, filename):
+		toolpath = gcodeColumnar.loadToolpath(filename)
+		_removeTempFile(filename)
+		return toolpath
+
+	def abort(self):
+		self.aborted = True
+		if self._process is not None and self._process.is_alive():
+			try:
+				self._process.terminate()
+			except:
+				pass
+
+	def cleanup(self):
+		removeTempFiles()
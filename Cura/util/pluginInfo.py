@@ -1,6 +1,14 @@
 """
 The plugin module contains information about the plugins found for Cura.
 It keeps track of a list of installed plugins and the information contained within.
+
+Post processing plugins come in two kinds. Legacy plugins get the name of a file with the GCode in 'filename', which they
+read and rewrite. Plugins with '#Api: stream' in their header are stages in a single streaming pass over the GCode, they
+define one of these generator functions:
+	processLines(lines)    Gets an iterator over the GCode lines, yields the new lines.
+	processLayers(layers)  Gets an iterator over the layers, yields the new layers. A layer is a list of lines, which starts
+	                       with a ';LAYER:' line, except for the first layer which holds the start GCode.
+The parameters of a plugin are available as globals in both kinds.
 """
 __copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
 
@@ -10,6 +18,8 @@ import traceback
 import platform
 import re
 import tempfile
+import shutil
+import cStringIO as StringIO
 import cPickle as pickle
 
 from Cura.util import profile
@@ -29,6 +39,7 @@ class pluginInfo(object):
 		self._type = 'unknown'
 		self._info = ''
 		self._params = []
+		self._api = 'file'
 		with open(os.path.join(dirname, filename), "r") as f:
 			for line in f:
 				line = line.strip()
@@ -45,6 +56,8 @@ class pluginInfo(object):
 					self._type = line[1].strip()
 				elif line[0].upper() == 'DEPEND':
 					pass
+				elif line[0].upper() == 'API':
+					self._api = line[1].strip().lower()
 				elif line[0].upper() == 'PARAM':
 					m = re.match('([a-zA-Z][a-zA-Z0-9_]*)\(([a-zA-Z_]*)(?::([^\)]*))?\) +(.*)', line[1].strip())
 					if m is not None:
@@ -70,6 +83,9 @@ class pluginInfo(object):
 	def getParams(self):
 		return self._params
 
+	def isStreaming(self):
+		return self._api == 'stream'
+
 def getPostProcessPluginConfig():
 	try:
 		return pickle.loads(str(profile.getProfileSetting('plugin_config')))
@@ -111,11 +127,104 @@ def getPluginList(pluginType):
 			ret.append(plugin)
 	return ret
 
+def _getPluginErrorMessage():
+	locationInfo = traceback.extract_tb(sys.exc_info()[2])[-1]
+	return "%s: '%s' @ %s:%s:%d" % (str(sys.exc_info()[0].__name__), str(sys.exc_info()[1]), os.path.basename(locationInfo[0]), locationInfo[2], locationInfo[1])
+
+def _getPluginGlobals(plugin, pluginConfig):
+	locals = {}
+	for param in plugin.getParams():
+		value = param['default']
+		if param['name'] in pluginConfig['params']:
+			value = pluginConfig['params'][param['name']]
+
+		if param['type'] == 'float':
+			try:
+				value = float(value)
+			except:
+				value = float(param['default'])
+
+		locals[param['name']] = value
+	return locals
+
+def splitLayers(lines):
+	"""
+	Generator which groups GCode lines into layers, each new layer starts at a ';LAYER:' line.
+	"""
+	layer = []
+	for line in lines:
+		if line.startswith(';LAYER:') and len(layer) > 0:
+			yield layer
+			layer = []
+		layer.append(line)
+	if len(layer) > 0:
+		yield layer
+
+def _joinLayers(layers):
+	for layer in layers:
+		for line in layer:
+			yield line
+
+def _getStreamStage(locals):
+	#Returns a function which turns an iterator over lines into the iterator over the lines produced by the plugin.
+	if 'processLayers' in locals:
+		processLayers = locals['processLayers']
+		return lambda lines: _joinLayers(processLayers(splitLayers(lines)))
+	if 'processLines' in locals:
+		return locals['processLines']
+	raise ValueError('Streaming plugin has no processLines or processLayers function')
+
+def _readLines(source):
+	#Generator over the lines of a file or BigDataStorage, which reads in large chunks.
+	pending = ''
+	while True:
+		data = source.read(1024 * 1024)
+		if len(data) < 1:
+			break
+		data = pending + data
+		end = data.rfind('\n') + 1
+		pending = data[end:]
+		for line in StringIO.StringIO(data[:end]):
+			yield line
+	if pending != '':
+		yield pending
+
+def _runStages(source, stages, f):
+	#Write the lines that come out of the chain of stages to f, in large writes.
+	lines = _readLines(source)
+	for stage in stages:
+		lines = stage(lines)
+	buffer = []
+	for line in lines:
+		buffer.append(line)
+		if len(buffer) >= 16 * 1024:
+			f.write(''.join(buffer))
+			buffer = []
+	f.write(''.join(buffer))
+
 def runPostProcessingPlugins(engineResult):
+	"""
+	Run the configured post processing plugins on the GCode of the engineResult. Consecutive streaming plugins run together
+	in one pass, the GCode is only written to a temporary file for legacy plugins. Returns an error message, or None.
+	"""
+	#The temporary files are removed on every return, also when a plugin fails.
+	tempFiles = []
+	try:
+		return _runPostProcessingPlugins(engineResult, tempFiles)
+	finally:
+		for filename in tempFiles:
+			if os.path.isfile(filename):
+				try:
+					os.unlink(filename)
+				except OSError:
+					pass
+
+def _runPostProcessingPlugins(engineResult, tempFiles):
 	pluginConfigList = getPostProcessPluginConfig()
 	pluginList = getPluginList('postprocess')
 
 	tempfilename = None
+	stages = []
 	for pluginConfig in pluginConfigList:
 		plugin = None
 		for pluginTest in pluginList:
@@ -125,46 +234,58 @@ def runPostProcessingPlugins(engineResult):
 			continue
 
 		pythonFile = plugin.getFullFilename()
+		locals = _getPluginGlobals(plugin, pluginConfig)
 
-		if tempfilename is None:
+		if plugin.isStreaming():
+			try:
+				execfile(pythonFile, locals)
+				stages.append(_getStreamStage(locals))
+			except:
+				return _getPluginErrorMessage()
+			continue
+
+		#Legacy plugins rewrite a file, so the streaming plugins before it are run while writing that file.
+		if tempfilename is None or len(stages) > 0:
 			f = tempfile.NamedTemporaryFile(prefix='CuraPluginTemp', delete=False)
-			tempfilename = f.name
-			gcode = engineResult.getGCode()
-			while True:
-				data = gcode.read(16 * 1024)
-				if len(data) == 0:
-					break
-				f.write(data)
+			tempFiles.append(f.name)
+			try:
+				if tempfilename is None:
+					if len(stages) > 0:
+						_runStages(engineResult.getGCode(), stages, f)
+					else:
+						engineResult.getGCode().copyTo(f)
+				else:
+					with open(tempfilename, "r") as source:
+						_runStages(source, stages, f)
+					os.unlink(tempfilename)
+			except:
+				f.close()
+				return _getPluginErrorMessage()
 			f.close()
-			del gcode
-
-		locals = {'filename': tempfilename}
-		for param in plugin.getParams():
-			value = param['default']
-			if param['name'] in pluginConfig['params']:
-				value = pluginConfig['params'][param['name']]
-
-			if param['type'] == 'float':
-				try:
-					value = float(value)
-				except:
-					value = float(param['default'])
+			tempfilename = f.name
+			stages = []
 
-			locals[param['name']] = value
+		locals['filename'] = tempfilename
 		try:
 			execfile(pythonFile, locals)
 		except:
-			locationInfo = traceback.extract_tb(sys.exc_info()[2])[-1]
-			return "%s: '%s' @ %s:%s:%d" % (str(sys.exc_info()[0].__name__), str(sys.exc_info()[1]), os.path.basename(locationInfo[0]), locationInfo[2], locationInfo[1])
-	if tempfilename is not None:
-		f = open(tempfilename, "r")
-		engineResult.setGCode("")
-		import gc
-		gc.collect()
-		data = f.read(4096)
-		while len(data) > 0:
-			engineResult._gcodeData.write(data)
-			data = f.read(4096)
-		f.close()
-		os.unlink(tempfilename)
+			return _getPluginErrorMessage()
+	if tempfilename is None and len(stages) < 1:
+		return None
+
+	#The old GCode stays in use until the new GCode is complete, so a failing plugin leaves the GCode unchanged.
+	output = engineResult.createGCodeStorage()
+	try:
+		if tempfilename is not None:
+			with open(tempfilename, "r") as source:
+				if len(stages) > 0:
+					_runStages(source, stages, output)
+				else:
+					shutil.copyfileobj(source, output, 1024 * 1024)
+			os.unlink(tempfilename)
+		else:
+			_runStages(engineResult.getGCode(), stages, output)
+	except:
+		return _getPluginErrorMessage()
+	engineResult.setGCode(output)
 	return None
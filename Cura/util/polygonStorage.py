@@ -0,0 +1,112 @@
+"""
+The polygonStorage module stores the preview polygons which the CuraEngine sends for each layer and type.
+Instead of a list with a small numpy array per polygon, the points of all polygons are kept in one (n,3) float32 array,
+with an int32 offsets array which holds the first point of each polygon and the total amount of points as last entry
+(compressed sparse row layout). This costs a fraction of the memory and allows building the render data at once.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import numpy
+
+from Cura.util.gcodeColumnar import growableArray
+
+def _lineIndices(offsets):
+	"""
+	The GL_LINES indices of polygons: polygons with more then 2 points are closed, polygons with 2 points are a single line.
+	"""
+	count = offsets[-1]
+	lengths = numpy.diff(offsets)
+	starts = offsets[:-1][lengths > 0]
+	ends = offsets[1:][lengths > 0] - 1
+	closed = lengths[lengths > 0] > 2
+	first = numpy.arange(0, count, dtype=numpy.uint32)
+	second = first + 1
+	second[ends[closed]] = starts[closed]
+	keep = numpy.ones(count, numpy.bool)
+	keep[ends[~closed]] = False
+	return numpy.column_stack((first[keep], second[keep])).flatten()
+
+class PolygonStorage(object):
+	"""
+	The polygons of one layer and type. Indexing and iterating gives the points of a single polygon as a view,
+	like the list of polygon arrays it replaces.
+	"""
+	def __init__(self, points = None, offsets = None):
+		self._points = growableArray(numpy.float32, 3, 0)
+		self._offsets = growableArray(numpy.int32, None, 1)
+		self._offsets.append([0])
+		if points is not None:
+			self._points.setArray(numpy.asarray(points, numpy.float32))
+			self._offsets.setArray(numpy.asarray(offsets, numpy.int32))
+
+	def growPoints(self, count):
+		"""
+		Add count points, and return the (count,3) array in which they are filled in. They are not part of a polygon
+		until addPolygons is called, so the polygons can be used while points are added.
+		"""
+		return self._points.grow(count)
+
+	def addPolygons(self, offsets):
+		"""
+		Add polygons over the points after the last polygon. The offsets start at 0 and end with the amount of points.
+		"""
+		end = self._offsets.getArray()[-1]
+		self._offsets.append(numpy.asarray(offsets[1:], numpy.int32) + end)
+
+	def getPolygons(self):
+		"""
+		Returns the points and offsets of the polygons, from a single snapshot of the offsets. Points which are grown but not
+		yet part of a polygon are left out, they can still be filled in by another thread.
+		"""
+		#The offsets are read before the points: the points of all polygons in the offsets are filled in at that moment.
+		offsets = self._offsets.getArray()
+		points = self._points.getArray()
+		return points[:offsets[-1]], offsets
+
+	def getPoints(self):
+		return self.getPolygons()[0]
+
+	def getOffsets(self):
+		return self._offsets.getArray()
+
+	def getLines(self):
+		"""
+		Returns the points and the GL_LINES indices of all polygons, from the same snapshot of the polygons.
+		"""
+		points, offsets = self.getPolygons()
+		return points, _lineIndices(offsets)
+
+	def getLineIndices(self):
+		return self.getLines()[1]
+
+	def __len__(self):
+		return len(self._offsets) - 1
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self[n] for n in xrange(*index.indices(len(self)))]
+		if index < 0:
+			index += len(self)
+		if index < 0 or index >= len(self):
+			raise IndexError('polygon index out of range')
+		points, offsets = self.getPolygons()
+		return points[offsets[index]:offsets[index + 1]]
+
+	def __iter__(self):
+		points, offsets = self.getPolygons()
+		offsets = offsets.tolist()
+		for n in xrange(0, len(offsets) - 1):
+			yield points[offsets[n]:offsets[n + 1]]
+
+def concatenate(storages):
+	"""
+	Join the polygons of multiple PolygonStorage objects into a new one.
+	"""
+	#One snapshot per storage, so the points and offsets match while the socket thread adds polygons.
+	polygons = [storage.getPolygons() for storage in storages]
+	result = PolygonStorage()
+	result._points.reserve(sum([len(points) for points, offsets in polygons]))
+	for points, offsets in polygons:
+		result.growPoints(len(points))[:] = points
+		result.addPolygons(offsets)
+	return result
@@ -33,6 +33,8 @@ class printableObject(object):
 		self._meshList = []
 		self._position = numpy.array([0.0, 0.0])
 		self._matrix = numpy.matrix([[1,0,0],[0,1,0],[0,0,1]], numpy.float64)
+		#Incremented each time the matrix or the vertexes change, the meshes use this to know their transformed vertexes are outdated.
+		self._matrixVersion = 0
 		self._transformedMin = None
 		self._transformedMax = None
 		self._transformedSize = None
@@ -79,14 +81,20 @@ class printableObject(object):
 		if numpy.max(self.getSize()) > 10000.0:
 			for m in self._meshList:
 				m.vertexes /= 1000.0
+			self._matrixChanged()
 			self.processMatrix()
 		if numpy.max(self.getSize()) < 1.0:
 			for m in self._meshList:
 				m.vertexes *= 1000.0
+			self._matrixChanged()
 			self.processMatrix()
 
+	def _matrixChanged(self):
+		self._matrixVersion += 1
+
 	def applyMatrix(self, m):
 		self._matrix *= m
+		self._matrixChanged()
 		self.processMatrix()
 
 	def processMatrix(self):
@@ -202,6 +210,7 @@ class printableObject(object):
 		y = numpy.linalg.norm(self._matrix[::,1].getA().flatten())
 		z = numpy.linalg.norm(self._matrix[::,2].getA().flatten())
 		self._matrix = numpy.matrix([[x,0,0],[0,y,0],[0,0,z]], numpy.float64)
+		self._matrixChanged()
 		self.processMatrix()
 
 	def layFlat(self):
@@ -224,6 +233,7 @@ class printableObject(object):
 		self._matrix *= numpy.matrix([[math.cos(rad), math.sin(rad), 0], [-math.sin(rad), math.cos(rad), 0], [0,0,1]], numpy.float64)
 		rad = -math.asin(dotMin)
 		self._matrix *= numpy.matrix([[math.cos(rad), 0, math.sin(rad)], [0,1,0], [-math.sin(rad), 0, math.cos(rad)]], numpy.float64)
+		self._matrixChanged()
 
 
 		transformedVertexes = self._meshList[0].getTransformedVertexes()
@@ -307,6 +317,10 @@ class mesh(object):
 		self.vertexCount = 0
 		self.vbo = None
 		self._obj = obj
+		#Cache of the vertexes transformed by the matrix of the object, with the matrix version and vertex array it was made from.
+		self._transformedVertexes = None
+		self._transformedVersion = None
+		self._transformedSource = None
 
 	def _addFace(self, x0, y0, z0, x1, y1, z1, x2, y2, z2):
 		n = self.vertexCount
@@ -356,14 +370,27 @@ class mesh(object):
 				return i
 
 	def getTransformedVertexes(self, applyOffsets = False):
+		"""
+		The vertexes transformed by the matrix of the object. The transformation is only calculated again when the matrix changed,
+		so the returned array without offsets is shared and should not be modified.
+		"""
+		if self._transformedVersion != self._obj._matrixVersion or self._transformedSource is not self.vertexes:
+			matrix = numpy.asarray(self._obj._matrix, numpy.float32)
+			if self._transformedVertexes is None or self._transformedVertexes.shape != self.vertexes.shape:
+				self._transformedVertexes = numpy.empty(self.vertexes.shape, numpy.float32)
+			self._transformedVertexes.flags.writeable = True
+			numpy.dot(numpy.ascontiguousarray(self.vertexes, numpy.float32), matrix, out=self._transformedVertexes)
+			self._transformedVertexes.flags.writeable = False
+			self._transformedVersion = self._obj._matrixVersion
+			self._transformedSource = self.vertexes
 		if applyOffsets:
 			pos = self._obj._position.copy()
 			pos.resize((3))
 			pos[2] = self._obj.getSize()[2] / 2
 			offset = self._obj._drawOffset.copy()
 			offset[2] += self._obj.getSize()[2] / 2
-			return (numpy.matrix(self.vertexes, copy = False) * numpy.matrix(self._obj._matrix, numpy.float32)).getA() - offset + pos
-		return (numpy.matrix(self.vertexes, copy = False) * numpy.matrix(self._obj._matrix, numpy.float32)).getA()
+			return self._transformedVertexes - offset + pos
+		return self._transformedVertexes
 
 	def split(self, callback):
 		vertexMap = {}
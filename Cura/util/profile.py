@@ -519,6 +519,14 @@ setting('window_width', '-1', float, 'preference', 'hidden')
 setting('window_height', '-1', float, 'preference', 'hidden')
 setting('window_normal_sash', '320', float, 'preference', 'hidden')
 setting('last_run_version', '', str, 'preference', 'hidden')
+setting('gcode_parse_processes', '0', int, 'preference', 'hidden').setLabel(_("GCode parse processes"), _("Amount of processes used to parse large GCode files for the layer view. 0 uses one process per CPU core, 1 disables parallel parsing."))
+setting('gcode_arc_tolerance', '0.01', float, 'preference', 'hidden').setLabel(_("GCode arc tolerance (mm)"), _("Maximum distance between the line segments and the real arc when G2 and G3 arcs in GCode are shown."))
+setting('slice_cache_size', '512', float, 'preference', 'hidden').setLabel(_("Slice cache size (MB)"), _("Maximum disk space used to store slice results, so slicing the same models with the same settings again does not need to run the engine. 0 disables the slice cache."))
+setting('toolpath_cache_size', '1024', float, 'preference', 'hidden').setLabel(_("Toolpath cache size (MB)"), _("Maximum disk space used to store interpreted GCode files, so reopening them does not need to interpret them again."))
+setting('gcode_memory_size', '256', float, 'preference', 'hidden').setLabel(_("GCode memory size (MB)"), _("GCode larger than this is written to a temporary file instead of kept in memory. 0 keeps all GCode in memory."))
+setting('slice_parallel_objects', 'False', bool, 'preference', 'hidden').setLabel(_("Slice objects in parallel"), _("When printing one object at a time, slice each object in its own engine process at the same time, and join the GCode of the objects."))
+setting('slice_metrics_log', '', str, 'preference', 'hidden').setLabel(_("Slice metrics log"), _("File to which the time spent in each phase of slicing is appended as a JSON line, empty to disable."))
+setting('gcode_interpreter_process', 'True', bool, 'preference', 'hidden').setLabel(_("Interpret GCode in a separate process"), _("Interpret the GCode for the layer view in a worker process, so the interface stays responsive."))
 
 setting('machine_name', '', str, 'machine', 'hidden')
 setting('machine_type', 'unknown', str, 'machine', 'hidden') #Ultimaker, Ultimaker2, RepRap
@@ -540,6 +548,8 @@ setting('extruder_offset_y3', '0.0', float, 'machine', 'hidden').setLabel(_("Off
 setting('extruder_offset_x4', '0.0', float, 'machine', 'hidden').setLabel(_("Offset X"), _("The offset of your forth extruder compared to the primary."))
 setting('extruder_offset_y4', '0.0', float, 'machine', 'hidden').setLabel(_("Offset Y"), _("The offset of your forth extruder compared to the primary."))
 setting('steps_per_e', '0', float, 'machine', 'hidden').setLabel(_("E-Steps per 1mm filament"), _("Amount of steps per mm filament extrusion. If set to 0 then this value is ignored and the value in your firmware is used."))
+setting('machine_acceleration', '3000', float, 'machine', 'hidden').setLabel(_("Acceleration (mm/s^2)"), _("Acceleration of the printer head, used to estimate the print time of GCode files."))
+setting('machine_junction_deviation', '0.05', float, 'machine', 'hidden').setLabel(_("Junction deviation (mm)"), _("Junction deviation of the firmware, limits the speed in corners when estimating the print time of GCode files."))
 setting('serial_port', 'AUTO', str, 'machine', 'hidden').setLabel(_("Serial port"), _("Serial port to use for communication with the printer"))
 setting('serial_port_auto', '', str, 'machine', 'hidden')
 setting('serial_baud', 'AUTO', str, 'machine', 'hidden').setLabel(_("Baudrate"), _("Speed of the serial port communication\nNeeds to match your firmware settings\nCommon values are 250000, 115200, 57600"))
@@ -0,0 +1,253 @@
+"""
+The sliceCache module keeps the results of the CuraEngine, so slicing a scene that was sliced before (for example after an
+undo, or when switching back to a previous setting) does not need to run the engine again.
+
+Results are keyed on everything that is send to the engine: the engine settings, the object positions and matrices, and the
+vertexes of the meshes. The GCode is kept before the replace tags and the post processing plugins are applied, and
+settings which do not change the toolpaths (see sliceEngine.POST_SLICE_SETTINGS) are not part of the key: the cached GCode
+is patched with their new GCode instead. Recently used results are kept in memory, and all results are stored on disk. When the disk cache
+grows over the 'slice_cache_size' preference, the least recently used entries are removed.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import hashlib
+import threading
+import traceback
+import collections
+import cPickle as pickle
+import numpy
+
+from Cura.util import profile
+from Cura.util import bigDataStorage
+from Cura.util.polygonStorage import PolygonStorage
+
+#Maximum amount of GCode and polygon bytes kept in memory.
+MEMORY_CACHE_SIZE = 128 * 1024 * 1024
+
+_memoryLock = threading.Lock()
+_memoryCache = collections.OrderedDict()
+_memorySize = [0]
+
+def isEnabled():
+	return profile.getPreferenceFloat('slice_cache_size') > 0.0
+
+def getCachePath():
+	path = os.path.join(profile.getBasePath(), 'slice_cache')
+	if not os.path.isdir(path):
+		try:
+			os.makedirs(path)
+		except OSError:
+			print "Failed to create directory: %s" % (path)
+	return path
+
+def getModelKey(engineModelData):
+	"""
+	Hash the vertex count and vertexes of each mesh, for the modelKey of getKey.
+	"""
+	key = hashlib.sha1()
+	for vertexCount, vertexes in engineModelData:
+		key.update('%d:' % (vertexCount))
+		key.update(numpy.ascontiguousarray(vertexes, numpy.float32).data)
+	return key.hexdigest()
+
+def getKey(engineExecutable, settings, commandList, modelKey):
+	"""
+	Build the cache key of a slice. The settings are the engine settings dictionary, the commandList the arguments
+	after the settings (object positions and matrices), and modelKey the getModelKey of the meshes.
+	"""
+	key = hashlib.sha1()
+	#A different engine gives a different result.
+	try:
+		stat = os.stat(engineExecutable)
+		key.update('%s:%d:%d' % (engineExecutable, stat.st_size, int(stat.st_mtime)))
+	except OSError:
+		key.update(str(engineExecutable))
+	for k, v in sorted(settings.items()):
+		key.update('%s=%s\n' % (k, str(v)))
+	for arg in commandList:
+		key.update(arg + '\n')
+	key.update(modelKey)
+	return key.hexdigest()
+
+class sliceCacheEntry(object):
+	"""
+	The data of a finished engine result that is kept in the cache. The GCode is kept as a list of blocks, or is None when the
+	GCode is too large for the memory cache and only stored on disk. The polygons of each layer and type are kept as one array
+	with the points of all polygons and the offsets of the polygons in it. The alterations are the [offset, length, code] of the
+	start and end GCode in the GCode.
+	"""
+	def __init__(self, gcodeBlocks, polygons, printTimeSeconds, filamentMM, engineLog, alterations):
+		self.gcodeBlocks = gcodeBlocks
+		self.polygons = polygons
+		self.printTimeSeconds = printTimeSeconds
+		self.filamentMM = filamentMM
+		self.engineLog = engineLog
+		self.alterations = alterations
+
+	def getSize(self):
+		size = sum(map(len, self.gcodeBlocks or []))
+		for layer in self.polygons:
+			for points, offsets in layer.values():
+				size += points.nbytes + offsets.nbytes
+		return size
+
+def _packPolygons(polygons):
+	packed = []
+	for layer in polygons:
+		packed.append(dict((typeName, storage.getPolygons()) for typeName, storage in layer.items()))
+	return packed
+
+def _unpackPolygons(packed):
+	polygons = []
+	for packedLayer in packed:
+		polygons.append(dict((typeName, PolygonStorage(points, offsets)) for typeName, (points, offsets) in packedLayer.items()))
+	return polygons
+
+def _getEntryFilenames(key):
+	path = getCachePath()
+	return os.path.join(path, key + '.gcode'), os.path.join(path, key + '.slice')
+
+def _addToMemory(key, entry):
+	with _memoryLock:
+		if key in _memoryCache:
+			_memorySize[0] -= _memoryCache.pop(key).getSize()
+		size = entry.getSize()
+		if size > MEMORY_CACHE_SIZE:
+			return
+		if entry.gcodeBlocks is None:
+			return
+		_memoryCache[key] = entry
+		_memorySize[0] += size
+		while _memorySize[0] > MEMORY_CACHE_SIZE:
+			_memorySize[0] -= _memoryCache.popitem(False)[1].getSize()
+
+def _getFromMemory(key):
+	with _memoryLock:
+		entry = _memoryCache.pop(key, None)
+		if entry is not None:
+			_memoryCache[key] = entry
+		return entry
+
+def _loadFromDisk(key, result):
+	#The GCode is read into the result while it is loaded, and only kept in the entry when it fits in the memory cache.
+	gcodeFilename, infoFilename = _getEntryFilenames(key)
+	if not os.path.isfile(gcodeFilename) or not os.path.isfile(infoFilename):
+		return None
+	try:
+		with open(infoFilename, 'rb') as f:
+			info = pickle.load(f)
+		gcodeBlocks = None
+		if os.stat(gcodeFilename).st_size <= MEMORY_CACHE_SIZE:
+			gcodeBlocks = []
+		result.setGCode('')
+		with open(gcodeFilename, 'rb') as f:
+			while True:
+				data = f.read(bigDataStorage.BLOCK_SIZE)
+				if len(data) < 1:
+					break
+				result.appendGCode(data)
+				if gcodeBlocks is not None:
+					gcodeBlocks.append(data)
+	except:
+		traceback.print_exc()
+		return None
+	#Mark the entry as recently used.
+	for filename in [gcodeFilename, infoFilename]:
+		try:
+			os.utime(filename, None)
+		except OSError:
+			pass
+	return sliceCacheEntry(gcodeBlocks, info['polygons'], info['printTimeSeconds'], info['filamentMM'], info['engineLog'], info.get('alterations', {}))
+
+def _storeOnDisk(key, entry, gcode):
+	gcodeFilename, infoFilename = _getEntryFilenames(key)
+	#Batch slicing runs multiple processes which share the cache directory.
+	suffix = '.%d.%d.tmp' % (os.getpid(), threading.currentThread().ident)
+	try:
+		with open(gcodeFilename + suffix, 'wb') as f:
+			gcode.copyTo(f)
+		with open(infoFilename + suffix, 'wb') as f:
+			pickle.dump({'polygons': entry.polygons, 'printTimeSeconds': entry.printTimeSeconds, 'filamentMM': entry.filamentMM, 'engineLog': entry.engineLog, 'alterations': entry.alterations}, f, pickle.HIGHEST_PROTOCOL)
+		for filename in [gcodeFilename, infoFilename]:
+			if os.path.exists(filename):
+				os.unlink(filename)
+			os.rename(filename + suffix, filename)
+	except (IOError, OSError):
+		traceback.print_exc()
+		for filename in [gcodeFilename, infoFilename]:
+			try:
+				os.unlink(filename + suffix)
+			except OSError:
+				pass
+		return
+	evict()
+
+def load(key, result):
+	"""
+	Fill an EngineResult with the cached result for this key. Returns False when the key is not in the cache.
+	"""
+	if not isEnabled():
+		return False
+	entry = _getFromMemory(key)
+	if entry is None:
+		entry = _loadFromDisk(key, result)
+		if entry is None:
+			return False
+		_addToMemory(key, entry)
+	else:
+		result.setGCode('')
+		for block in entry.gcodeBlocks:
+			result.appendGCode(block)
+	result._polygons = _unpackPolygons(entry.polygons)
+	result._printTimeSeconds = entry.printTimeSeconds
+	result._filamentMM = list(entry.filamentMM)
+	for line in entry.engineLog:
+		result.addLog(line)
+	#Set after the GCode, setting the GCode clears the alterations.
+	result._alterations = dict((name, list(alteration)) for name, alteration in entry.alterations.items())
+	return True
+
+def store(key, result):
+	"""
+	Store an EngineResult in the memory and disk cache, after the engine finished and before the replace tags are applied.
+	"""
+	if not isEnabled():
+		return
+	#A cursor, so storing does not move the read position of the GCode, which can be saved at the same time.
+	gcode = result.getGCode()
+	entry = sliceCacheEntry(None, _packPolygons(result._polygons), result._printTimeSeconds, list(result._filamentMM), list(result.getLog()), dict((name, list(alteration)) for name, alteration in result._alterations.items()))
+	if len(gcode) <= MEMORY_CACHE_SIZE:
+		entry.gcodeBlocks = list(iter(lambda: gcode.read(bigDataStorage.BLOCK_SIZE), ''))
+	_addToMemory(key, entry)
+	_storeOnDisk(key, entry, gcode)
+
+def evict(maxSize = None):
+	"""
+	Remove the least recently used entries from disk until the total size of the cache is below maxSize bytes.
+	"""
+	if maxSize is None:
+		maxSize = int(profile.getPreferenceFloat('slice_cache_size') * 1024 * 1024)
+	path = getCachePath()
+	entries = {}
+	totalSize = 0
+	for filename in os.listdir(path):
+		key, ext = os.path.splitext(filename)
+		if ext not in ['.gcode', '.slice']:
+			continue
+		try:
+			stat = os.stat(os.path.join(path, filename))
+		except OSError:
+			continue
+		mtime, size = entries.get(key, (0, 0))
+		entries[key] = (max(mtime, stat.st_mtime), size + stat.st_size)
+		totalSize += stat.st_size
+	for mtime, key in sorted((mtime, key) for key, (mtime, size) in entries.items()):
+		if totalSize <= maxSize:
+			break
+		for filename in _getEntryFilenames(key):
+			try:
+				os.unlink(filename)
+			except OSError:
+				pass
+		totalSize -= entries[key][1]
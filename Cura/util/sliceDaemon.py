@@ -0,0 +1,371 @@
+"""
+The sliceDaemon module is a headless slicing service, for integrating Cura in other systems without paying the startup
+cost of Cura for each job. It serves a small HTTP API on localhost:
+
+	POST   /jobs?filename=model.stl&priority=0    Upload a model file, returns {"id": ...}. The optional X-Cura-Profile
+	                                              header holds a profile string (see profile.getProfileString).
+	GET    /jobs                                  State of all jobs.
+	GET    /jobs/<id>                             State, progress and summary of a job.
+	GET    /jobs/<id>/progress                    Stream of JSON lines with the job state, until the job is finished.
+	GET    /jobs/<id>/gcode                       The GCode of a finished job.
+	DELETE /jobs/<id>                             Remove a job and its files.
+
+Jobs are sliced by a fixed amount of worker processes. Each worker keeps its Engine, and the socket server of that engine,
+during its lifetime. Waiting jobs are started in order of priority (highest first), and in order of arrival for equal priority.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import json
+import time
+import heapq
+import shutil
+import urlparse
+import tempfile
+import threading
+import traceback
+import multiprocessing
+import BaseHTTPServer
+import SocketServer
+
+from Cura.util import profile
+from Cura.util import resources
+from Cura.util import batchSlice
+
+#States of a job
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+def _workerMain(conn, defaultProfileString):
+	"""
+	Main function of a worker process. Receives (jobId, modelFilename, outputFilename, profileString) jobs,
+	and sends ('progress', jobId, progress) and ('done', jobId, summary) messages back.
+	"""
+	from Cura.util import sliceEngine
+	profile.loadPreferences(profile.getPreferencePath())
+	resources.setupLocalization(profile.getPreference('language'))
+	currentJob = [None]
+	#The engine reports progress from its own threads.
+	sendLock = threading.Lock()
+	def send(message):
+		with sendLock:
+			conn.send(message)
+	def progressCallback(progress):
+		if currentJob[0] is not None and progress >= 0.0:
+			send(('progress', currentJob[0], progress))
+	engine = sliceEngine.Engine(progressCallback)
+	while True:
+		try:
+			job = conn.recv()
+		except (EOFError, IOError):
+			break
+		if job is None:
+			break
+		jobId, modelFilename, outputFilename, profileString = job
+		currentJob[0] = jobId
+		try:
+			profile.setProfileFromString(profileString or defaultProfileString)
+			summary = batchSlice.sliceFile(modelFilename, outputFilename, engine)
+		except:
+			summary = {'success': False, 'error': traceback.format_exc()}
+		currentJob[0] = None
+		send(('done', jobId, summary))
+	engine.cleanup()
+	conn.close()
+
+def isValidModelFilename(filename):
+	"""
+	The model is stored in the directory of its job under the base name of the filename, so that has to be a file name.
+	"""
+	return os.path.basename(filename) not in ['', '.', '..']
+
+class sliceJob(object):
+	def __init__(self, jobId, filename, priority, profileString, path):
+		self.id = jobId
+		self.filename = filename
+		self.priority = priority
+		self.profileString = profileString
+		self.modelFilename = os.path.join(path, os.path.basename(filename))
+		self.outputFilename = os.path.join(path, os.path.splitext(os.path.basename(filename))[0] + profile.getGCodeExtension())
+		self.state = QUEUED
+		self.progress = 0.0
+		self.summary = None
+		self.createTime = time.time()
+
+	def isFinished(self):
+		return self.state in [DONE, FAILED]
+
+	def getInfo(self):
+		return {'id': self.id, 'filename': self.filename, 'priority': self.priority, 'state': self.state, 'progress': self.progress, 'summary': self.summary}
+
+class sliceWorker(object):
+	"""
+	A worker process with its own engine, and the thread in the service which receives its messages.
+	"""
+	def __init__(self, service):
+		self._service = service
+		self.job = None
+		self._conn, childConn = multiprocessing.Pipe()
+		self._process = multiprocessing.Process(target=_workerMain, args=(childConn, profile.getProfileString()))
+		self._process.daemon = True
+		self._process.start()
+		childConn.close()
+		thread = threading.Thread(target=self._receiveThread)
+		thread.daemon = True
+		thread.start()
+
+	def start(self, job):
+		self.job = job
+		self._conn.send((job.id, job.modelFilename, job.outputFilename, job.profileString))
+
+	def stop(self):
+		try:
+			self._conn.send(None)
+		except IOError:
+			pass
+
+	def _receiveThread(self):
+		while True:
+			try:
+				message = self._conn.recv()
+			except (EOFError, IOError):
+				break
+			if message[0] == 'progress':
+				self._service._jobProgress(message[1], message[2])
+			elif message[0] == 'done':
+				self.job = None
+				self._service._jobDone(self, message[1], message[2])
+		self._process.join()
+		self._service._workerDied(self)
+
+class sliceService(object):
+	"""
+	The job queue and worker processes of the slice service.
+	"""
+	def __init__(self, workerCount = 0):
+		if workerCount < 1:
+			workerCount = multiprocessing.cpu_count()
+		self._path = tempfile.mkdtemp(prefix='CuraSliceService')
+		self._lock = threading.Condition()
+		self._jobs = {}
+		self._queue = []
+		self._nextJobId = 1
+		self._running = True
+		self._idleWorkers = []
+		self._workers = [sliceWorker(self) for n in xrange(0, workerCount)]
+		self._idleWorkers = self._workers[:]
+
+	def addJob(self, filename, data, priority = 0, profileString = None):
+		if not isValidModelFilename(filename):
+			raise ValueError('Invalid model filename: %s' % (filename))
+		with self._lock:
+			jobId = str(self._nextJobId)
+			self._nextJobId += 1
+		path = os.path.join(self._path, jobId)
+		os.makedirs(path)
+		job = sliceJob(jobId, filename, priority, profileString, path)
+		with open(job.modelFilename, 'wb') as f:
+			f.write(data)
+		with self._lock:
+			self._jobs[jobId] = job
+			heapq.heappush(self._queue, (-priority, int(jobId), jobId))
+			self._schedule()
+			self._lock.notifyAll()
+		return job
+
+	def getJob(self, jobId):
+		with self._lock:
+			return self._jobs.get(jobId)
+
+	def getJobs(self):
+		with self._lock:
+			return sorted(self._jobs.values(), key=lambda job: job.createTime)
+
+	def removeJob(self, jobId):
+		with self._lock:
+			job = self._jobs.get(jobId)
+			if job is None or job.state == RUNNING:
+				return False
+			del self._jobs[jobId]
+			self._lock.notifyAll()
+		shutil.rmtree(os.path.dirname(job.modelFilename), True)
+		return True
+
+	def waitForChange(self, job, progress, state, timeout = 1.0):
+		"""
+		Wait until the progress or state of a job is different from the given values, or the timeout passed.
+		"""
+		with self._lock:
+			if job.progress == progress and job.state == state:
+				self._lock.wait(timeout)
+
+	def _schedule(self):
+		#Called with the lock held, start the waiting jobs with the highest priority on the idle workers.
+		while len(self._idleWorkers) > 0 and len(self._queue) > 0:
+			jobId = heapq.heappop(self._queue)[2]
+			job = self._jobs.get(jobId)
+			if job is None:
+				continue
+			worker = self._idleWorkers.pop(0)
+			job.state = RUNNING
+			worker.start(job)
+
+	def _jobProgress(self, jobId, progress):
+		with self._lock:
+			job = self._jobs.get(jobId)
+			if job is not None:
+				job.progress = progress
+				self._lock.notifyAll()
+
+	def _jobDone(self, worker, jobId, summary):
+		with self._lock:
+			job = self._jobs.get(jobId)
+			if job is not None:
+				job.summary = summary
+				job.state = DONE if summary['success'] else FAILED
+				job.progress = 1.0
+			if self._running:
+				self._idleWorkers.append(worker)
+				self._schedule()
+			self._lock.notifyAll()
+
+	def _workerDied(self, worker):
+		with self._lock:
+			if worker.job is not None:
+				worker.job.state = FAILED
+				worker.job.summary = {'success': False, 'error': 'The slice worker process stopped'}
+			if worker in self._idleWorkers:
+				self._idleWorkers.remove(worker)
+			if worker in self._workers:
+				self._workers.remove(worker)
+			if self._running:
+				#Replace the worker, so the amount of workers stays the same.
+				newWorker = sliceWorker(self)
+				self._workers.append(newWorker)
+				self._idleWorkers.append(newWorker)
+				self._schedule()
+			self._lock.notifyAll()
+
+	def stop(self):
+		with self._lock:
+			self._running = False
+			workers = self._workers[:]
+		for worker in workers:
+			worker.stop()
+		shutil.rmtree(self._path, True)
+
+class sliceRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	def _sendJSON(self, data, code = 200):
+		body = json.dumps(data)
+		self.send_response(code)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def _getJob(self, parts):
+		job = None
+		if len(parts) > 1:
+			job = self.server.service.getJob(parts[1])
+		if job is None:
+			self._sendJSON({'error': 'Unknown job'}, 404)
+		return job
+
+	def _parsePath(self):
+		url = urlparse.urlparse(self.path)
+		return url.path.strip('/').split('/'), urlparse.parse_qs(url.query, True)
+
+	def do_POST(self):
+		parts, query = self._parsePath()
+		if parts != ['jobs']:
+			self._sendJSON({'error': 'Unknown request'}, 404)
+			return
+		try:
+			priority = int(query.get('priority', ['0'])[0])
+		except ValueError:
+			self._sendJSON({'error': 'Invalid priority'}, 400)
+			return
+		filename = query.get('filename', ['model.stl'])[0]
+		if not isValidModelFilename(filename):
+			self._sendJSON({'error': 'Invalid filename'}, 400)
+			return
+		data = self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+		job = self.server.service.addJob(filename, data, priority, self.headers.getheader('X-Cura-Profile'))
+		self._sendJSON(job.getInfo(), 201)
+
+	def do_GET(self):
+		parts, query = self._parsePath()
+		if parts == ['jobs']:
+			self._sendJSON([job.getInfo() for job in self.server.service.getJobs()])
+			return
+		if len(parts) < 2 or parts[0] != 'jobs':
+			self._sendJSON({'error': 'Unknown request'}, 404)
+			return
+		job = self._getJob(parts)
+		if job is None:
+			return
+		if len(parts) == 2:
+			self._sendJSON(job.getInfo())
+		elif parts[2] == 'progress':
+			#Stream the state of the job until it is finished, the end of the response is the end of the stream.
+			self.send_response(200)
+			self.send_header('Content-Type', 'application/x-json-stream')
+			self.end_headers()
+			progress = None
+			state = None
+			while True:
+				if job.progress != progress or job.state != state:
+					progress = job.progress
+					state = job.state
+					self.wfile.write(json.dumps(job.getInfo()) + '\n')
+					self.wfile.flush()
+				if job.isFinished():
+					break
+				self.server.service.waitForChange(job, progress, state)
+		elif parts[2] == 'gcode':
+			if job.state != DONE:
+				self._sendJSON({'error': 'Job is not finished', 'state': job.state}, 409)
+				return
+			self.send_response(200)
+			self.send_header('Content-Type', 'text/plain')
+			self.send_header('Content-Length', str(os.stat(job.outputFilename).st_size))
+			self.end_headers()
+			with open(job.outputFilename, 'rb') as f:
+				shutil.copyfileobj(f, self.wfile)
+		else:
+			self._sendJSON({'error': 'Unknown request'}, 404)
+
+	def do_DELETE(self):
+		parts, query = self._parsePath()
+		job = self._getJob(parts)
+		if job is None:
+			return
+		if not self.server.service.removeJob(job.id):
+			self._sendJSON({'error': 'Job is running'}, 409)
+			return
+		self._sendJSON({'id': job.id})
+
+	def log_message(self, format, *args):
+		pass
+
+class sliceHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+
+def serve(port, workerCount = 0):
+	"""
+	Run the slice service on a localhost port until it is interrupted.
+	"""
+	resources.setupLocalization(profile.getPreference('language'))
+	service = sliceService(workerCount)
+	server = sliceHTTPServer(('127.0.0.1', port), sliceRequestHandler)
+	server.service = service
+	print 'Slice service listening on http://127.0.0.1:%d/jobs' % (port)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		service.stop()
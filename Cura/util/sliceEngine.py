@@ -18,12 +18,41 @@ import socket
 import struct
 import errno
 import inspect
+import tempfile
+import json
+import re
+import multiprocessing
 
 from Cura.util.bigDataStorage import BigDataStorage
+from Cura.util.polygonStorage import PolygonStorage
 from Cura.util import profile
 from Cura.util import pluginInfo
 from Cura.util import version
 from Cura.util import gcodeInterpreter
+from Cura.util import gcodeColumnar
+from Cura.util import toolpathCache
+from Cura.util import sliceCache
+from Cura.util import gcodeLayerIndex
+from Cura.util import gcodeParallel
+from Cura.util import gcodeWorker
+from Cura.util import gcodeTimeEstimator
+
+#Maximum amount of GCode read from the engine at once.
+STDOUT_READ_SIZE = 256 * 1024
+
+#Engine settings which hold GCode that does not change the toolpaths: the start GCode, which also holds the print and bed
+#temperatures (see profile.getAlterationFileContents), and the end GCode. The engine gets a marker line in place of this
+#GCode, which is replaced by the GCode while it is received. So the engine input, and the slice cache key, do not depend on
+#it, and a cached result is patched with the new GCode instead of slicing again.
+#The other settings which do not change the toolpaths are applied after the engine result is received or loaded from the
+#cache: the filament cost and density preferences through the replace tags, and the plugin_config with the post processing.
+POST_SLICE_SETTINGS = ['startCode', 'endCode']
+ALTERATION_MARKER = ';CURA_ALTERATION:%s\n'
+
+#Amount of GCode at the start and end of a separately sliced object which is searched for the moves that are changed when
+#the objects are joined.
+OBJECT_HEAD_SIZE = 64 * 1024
+OBJECT_TAIL_SIZE = 4 * 1024
 
 def getEngineFilename():
 	"""
@@ -49,6 +78,76 @@ def getEngineFilename():
 		return '/usr/local/bin/CuraEngine'
 	return ''
 
+def _newGCodeStorage():
+	#GCode above the 'gcode_memory_size' preference is spilled to a temporary file.
+	spillSize = int(profile.getPreferenceFloat('gcode_memory_size') * 1024 * 1024)
+	if spillSize <= 0:
+		return BigDataStorage()
+	return BigDataStorage(spillSize)
+
+def _copyGCode(source, target, size):
+	#Copy size bytes from the current position of the source BigDataCursor to the target.
+	while size > 0:
+		data = source.read(min(size, 1024 * 1024))
+		if len(data) < 1:
+			break
+		target.write(data)
+		size -= len(data)
+
+def _readGCode(gcode, start, end):
+	#Read the bytes from start to end of a BigDataCursor.
+	gcode.seek(start)
+	data = []
+	size = end - start
+	while size > 0:
+		block = gcode.read(size)
+		if len(block) < 1:
+			break
+		data.append(block)
+		size -= len(block)
+	return ''.join(data)
+
+def _setGCodeValue(line, letter, value):
+	#Replace the value of a parameter in a GCode line.
+	return re.sub(' %s[-0-9.]+' % (letter), ' %s%s' % (letter, value), line, 1)
+
+class _phaseTimer(object):
+	"""
+	Context manager which adds the time spent in a with block to a phase in a metrics dictionary.
+	"""
+	def __init__(self, metrics, name):
+		self._metrics = metrics
+		self._name = name
+		self._startTime = None
+
+	def __enter__(self):
+		self._startTime = time.time()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		_addPhaseTime(self._metrics, self._name, time.time() - self._startTime)
+		return False
+
+class _tempOverrides(object):
+	"""
+	Context manager which sets setting overrides as temp overrides of the profile in a with block.
+	The overrides are on the global profile, they should not stay for other slices when the block raises an exception.
+	"""
+	def __init__(self, overrides):
+		self._overrides = overrides
+
+	def __enter__(self):
+		for k, v in self._overrides.items():
+			profile.setTempOverride(k, v)
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if len(self._overrides) > 0:
+			profile.resetTempOverride()
+
+def _addPhaseTime(metrics, name, seconds):
+	metrics[name] = metrics.get(name, 0.0) + seconds
+
 class EngineResult(object):
 	"""
 	Result from running the CuraEngine.
@@ -56,7 +155,7 @@ class EngineResult(object):
 	"""
 	def __init__(self):
 		self._engineLog = []
-		self._gcodeData = BigDataStorage()
+		self._gcodeData = _newGCodeStorage()
 		self._polygons = []
 		self._replaceInfo = {}
 		self._success = False
@@ -67,11 +166,36 @@ class EngineResult(object):
 		self._preferencesString = profile.getPreferencesString()
 		self._gcodeInterpreter = gcodeInterpreter.gcode()
 		self._gcodeLoadThread = None
+		self._gcodeLoadWorker = None
+		self._gcodeLoadAborted = False
+		self._gcodeStreamParser = None
+		self._toolpathCacheKey = None
+		self._gcodeFilename = None
+		self._gcodeStatistics = None
 		self._finished = False
+		#Seconds spent in each phase of the slicing pipeline.
+		self._metrics = {}
+		#For each of the POST_SLICE_SETTINGS in the GCode, the [offset, length, code] of its GCode, before the replace tags are applied.
+		self._alterations = {}
+		self._alterationMarkers = {}
+		self._pendingGCode = ''
+		#The setting overrides this result was sliced with.
+		self._overrides = {}
+
+	def setOverrides(self, overrides):
+		self._overrides = dict(overrides) if overrides is not None else {}
+
+	def getOverrides(self):
+		return self._overrides
+
+	def _getProfileSetting(self, name):
+		if name in self._overrides:
+			return self._overrides[name]
+		return profile.getProfileSetting(name)
 
 	def getFilamentWeight(self, e=0):
 		#Calculates the weight of the filament in kg
-		radius = float(profile.getProfileSetting('filament_diameter')) / 2
+		radius = float(self._getProfileSetting('filament_diameter')) / 2
 		volumeM3 = (self._filamentMM[e] * (math.pi * radius * radius)) / (1000*1000*1000)
 		return volumeM3 * profile.getPreferenceFloat('filament_physical_density')
 
@@ -107,13 +231,155 @@ class EngineResult(object):
 		return self._engineLog
 
 	def getGCode(self):
-		self._gcodeData.seekStart()
-		return self._gcodeData
+		"""
+		Returns a new BigDataCursor on the GCode, so multiple readers can read the GCode at the same time.
+		"""
+		return self._gcodeData.cursor()
+
+	def createGCodeStorage(self):
+		"""
+		Returns a new empty storage for GCode, which can be filled and then given to setGCode.
+		"""
+		return _newGCodeStorage()
 
 	def setGCode(self, gcode):
-		self._gcodeData = BigDataStorage()
-		self._gcodeData.write(gcode)
+		"""
+		Replace the GCode with a string, or with a BigDataStorage which is used as it is.
+		"""
+		self.abortGCodeLoad()
+		if isinstance(gcode, BigDataStorage):
+			self._gcodeData = gcode
+		else:
+			self._gcodeData = _newGCodeStorage()
+			self._gcodeData.write(gcode)
 		self._replaceInfo = {}
+		self._alterations = {}
+		#The GCode is replaced, so layers interpreted from the old GCode are no longer valid.
+		self._gcodeStreamParser = None
+		self._toolpathCacheKey = None
+		self._gcodeFilename = None
+		self._gcodeStatistics = None
+		self._gcodeInterpreter = gcodeInterpreter.gcode()
+		self._gcodeLoadThread = None
+
+	def loadGCodeFile(self, filename):
+		"""
+		Load the GCode from a file. The content hash of the file is used to find the interpreted toolpath in the toolpath cache.
+		"""
+		self.setGCode('')
+		contentHash = toolpathCache.getKnownContentHash(filename)
+		hash = toolpathCache.newContentHash()
+		size = 0
+		with open(filename, "r") as f:
+			while True:
+				data = f.read(1024 * 1024)
+				if len(data) < 1:
+					break
+				self._gcodeData.write(data)
+				if contentHash is None:
+					hash.update(data)
+				size += len(data)
+		if contentHash is None:
+			contentHash = hash.hexdigest()
+			toolpathCache.setContentHash(filename, contentHash)
+		self._toolpathCacheKey = toolpathCache.getKey(contentHash, size)
+		self._gcodeFilename = filename
+
+	def startGCodeStream(self):
+		"""
+		Interpret the GCode while it is added with appendGCode, so the finished layers can be shown while the engine is still running.
+		"""
+		self._gcodeStreamParser = gcodeColumnar.parser(blockSize = 256 * 1024)
+		self._gcodeInterpreter.toolpath = self._gcodeStreamParser.toolpath
+		self._gcodeInterpreter.layerList = gcodeColumnar.layerListView(self._gcodeStreamParser.toolpath)
+
+	def setAlterations(self, codes):
+		"""
+		Set the GCode of the POST_SLICE_SETTINGS for which the engine writes a marker line. The markers are replaced
+		with this GCode by appendGCode.
+		"""
+		self._alterationMarkers = {}
+		for name, code in codes.items():
+			self._alterationMarkers[ALTERATION_MARKER % (name)] = name
+			self._alterations[name] = [None, len(code), code]
+
+	def _replaceAlterationMarkers(self, data):
+		#Only complete lines are searched for the markers, the rest is kept until the next data is added.
+		data = self._pendingGCode + data
+		end = data.rfind('\n') + 1
+		self._pendingGCode = data[end:]
+		data = data[:end]
+		found = []
+		for marker, name in self._alterationMarkers.items():
+			pos = data.find(marker)
+			if pos < 0 or (pos > 0 and data[pos - 1] != '\n'):
+				continue
+			found.append((pos, marker, name))
+		#Replace in the order of the data, so the offset of a marker includes the size change of the markers before it.
+		parts = []
+		last = 0
+		offset = len(self._gcodeData)
+		for pos, marker, name in sorted(found):
+			parts.append(data[last:pos])
+			offset += pos - last
+			code = self._alterations[name][2]
+			self._alterations[name][0] = offset
+			parts.append(code)
+			offset += len(code)
+			last = pos + len(marker)
+			del self._alterationMarkers[marker]
+		if len(found) > 0:
+			parts.append(data[last:])
+			data = ''.join(parts)
+		if len(self._alterationMarkers) < 1:
+			data += self._pendingGCode
+			self._pendingGCode = ''
+		return data
+
+	def replaceAlterations(self, codes):
+		"""
+		Put new GCode in the place of the POST_SLICE_SETTINGS, before the replace tags are applied. Used to reuse a cached result
+		which was sliced with different start or end GCode. Returns False when the GCode of a setting can not be replaced.
+		"""
+		for name in codes.keys():
+			if name not in self._alterations or self._alterations[name][0] is None:
+				return False
+		if all([self._alterations[name][2] == code for name, code in codes.items()]):
+			return True
+		source = self._gcodeData.cursor()
+		output = _newGCodeStorage()
+		pos = 0
+		for name, (offset, length, oldCode) in sorted(self._alterations.items(), key=lambda item: item[1][0]):
+			if offset is None:
+				continue
+			code = codes.get(name, oldCode)
+			source.seek(pos)
+			_copyGCode(source, output, offset - pos)
+			self._alterations[name] = [len(output), len(code), code]
+			output.write(code)
+			pos = offset + length
+		source.seek(pos)
+		_copyGCode(source, output, len(source) - pos)
+		self._gcodeData = output
+		return True
+
+	def appendGCode(self, data):
+		if len(self._alterationMarkers) > 0:
+			data = self._replaceAlterationMarkers(data)
+		self._gcodeData.write(data)
+		if self._gcodeStreamParser is not None:
+			self._gcodeStreamParser.feed(data)
+
+	def finishGCodeStream(self):
+		if self._pendingGCode != '':
+			data = self._pendingGCode
+			self._pendingGCode = ''
+			self._gcodeData.write(data)
+			if self._gcodeStreamParser is not None:
+				self._gcodeStreamParser.feed(data)
+		self._alterationMarkers = {}
+		if self._gcodeStreamParser is not None:
+			self._gcodeStreamParser.finish()
 
 	def addLog(self, line):
 		self._engineLog.append(line)
@@ -127,6 +393,22 @@ class EngineResult(object):
 	def applyReplaceTags(self):
 		self._gcodeData.replaceAtStart(self._replaceInfo)
 
+	def timePhase(self, name):
+		"""
+		Returns a context manager which adds the time spent in it to the named phase of the metrics.
+		"""
+		return _phaseTimer(self._metrics, name)
+
+	def addMetrics(self, metrics):
+		for name, seconds in metrics.items():
+			_addPhaseTime(self._metrics, name, seconds)
+
+	def getMetrics(self):
+		"""
+		The seconds spent in each phase of slicing this result. Phases measured on the engine output are named 'engine:<step>'.
+		"""
+		return dict(self._metrics)
+
 	def setFinished(self, result):
 		self._finished = result
 
@@ -134,20 +416,124 @@ class EngineResult(object):
 		return self._finished
 
 	def getGCodeLayers(self, loadCallback):
+		if self._gcodeStreamParser is not None:
+			return self._gcodeInterpreter.layerList
 		if not self._finished:
 			return None
+		if self._gcodeInterpreter.layerList is None and self._gcodeLoadThread is None and self._toolpathCacheKey is not None:
+			toolpath = toolpathCache.load(self._toolpathCacheKey)
+			if toolpath is not None:
+				self._gcodeInterpreter.toolpath = toolpath
+				self._gcodeInterpreter.layerList = gcodeColumnar.layerListView(toolpath)
+				if self._fillPrintInfo(toolpath):
+					loadCallback(self, 1.0)
 		if self._gcodeInterpreter.layerList is None and self._gcodeLoadThread is None:
+			self._gcodeLoadAborted = False
 			self._gcodeInterpreter.progressCallback = self._gcodeInterpreterCallback
-			self._gcodeLoadThread = threading.Thread(target=lambda : self._gcodeInterpreter.load(self._gcodeData.clone()))
+			size = len(self._gcodeData)
+			if size >= gcodeLayerIndex.MIN_LAZY_SIZE:
+				#Very large GCode is only scanned for the layer starts, layers are interpreted when they are shown.
+				self._gcodeInterpreter.layerList = gcodeLayerIndex.lazyLayerList(self._gcodeData.cursor())
+				self._gcodeLoadThread = threading.Thread(target=self._scanGCodeLayers, args=(self._gcodeInterpreter,))
+			elif gcodeWorker.useWorker() and not gcodeParallel.useParallel(size):
+				#Interpret the GCode in a worker process, the thread only receives the results.
+				self._gcodeLoadWorker = gcodeWorker.gcodeLoadWorker()
+				self._gcodeInterpreter.layerList = self._gcodeLoadWorker.layerList
+				self._gcodeLoadThread = threading.Thread(target=self._workGCodeLayers, args=(self._gcodeInterpreter, self._gcodeLoadWorker, self._toolpathCacheKey))
+			else:
+				if gcodeParallel.useParallel(size):
+					#The GCode is parsed by a pool of processes, so the GUI does not need to be given time.
+					self._gcodeInterpreter.progressCallback = self._gcodeProgressCallback
+				self._gcodeLoadThread = threading.Thread(target=self._loadGCodeLayers, args=(self._gcodeInterpreter, self._toolpathCacheKey))
 			self._gcodeLoadCallback = loadCallback
 			self._gcodeLoadThread.daemon = True
 			self._gcodeLoadThread.start()
 		return self._gcodeInterpreter.layerList
 
+	def getGCodeStatistics(self):
+		"""
+		Statistics of the interpreted GCode, see gcodeStatistics. Returns None until the GCode layers are completely loaded.
+		The statistics are calculated once and kept with the result.
+		"""
+		if self._gcodeStatistics is None:
+			self._gcodeStatistics = self._gcodeInterpreter.getStatistics()
+		return self._gcodeStatistics
+
+	def abortGCodeLoad(self):
+		"""
+		Stop interpreting the GCode for the layer view, used when the result is replaced by a new slice.
+		"""
+		self._gcodeLoadAborted = True
+		if self._gcodeLoadWorker is not None:
+			self._gcodeLoadWorker.abort()
+			self._gcodeLoadWorker.cleanup()
+			self._gcodeLoadWorker = None
+
+	def _writeGCodeToTempFile(self):
+		f = tempfile.NamedTemporaryFile(prefix='CuraGCode', suffix='.gcode', delete=False)
+		self._gcodeData.copyTo(f)
+		f.close()
+		return f.name
+
+	def _loadGCodeLayers(self, interpreter, cacheKey):
+		interpreter.load(self._gcodeData.cursor())
+		self._toolpathLoaded(interpreter.toolpath, cacheKey)
+
+	def _scanGCodeLayers(self, interpreter):
+		interpreter.layerList.scan(self._gcodeInterpreterCallback, len(self._gcodeData))
+
+	def _workGCodeLayers(self, interpreter, worker, cacheKey):
+		if self._gcodeFilename is not None:
+			worker.start(self._gcodeFilename)
+		else:
+			worker.start(self._writeGCodeToTempFile(), True)
+		toolpath = worker.run(self._gcodeProgressCallback)
+		if toolpath is not None:
+			interpreter.toolpath = toolpath
+			interpreter.layerList = worker.layerList
+			#The segment toolpaths are released now, so their files can be removed.
+			worker.cleanup()
+			self._toolpathLoaded(toolpath, cacheKey)
+
+	def _toolpathLoaded(self, toolpath, cacheKey):
+		if toolpath is None or not toolpath.finished:
+			return
+		if cacheKey is not None:
+			toolpathCache.store(cacheKey, toolpath)
+		if self._fillPrintInfo(toolpath):
+			#Report the load as finished again, so the new print time is shown.
+			self._gcodeLoadCallback(self, 1.0)
+
+	def _fillPrintInfo(self, toolpath):
+		"""
+		GCode which is not sliced by the engine has no print time and filament amount, estimate these from the toolpath.
+		Returns True when the print time or the filament amount is filled in.
+		"""
+		filled = False
+		if self._printTimeSeconds is None:
+			self._printTimeSeconds = int(gcodeTimeEstimator.estimatePrintTime(toolpath))
+			filled = True
+		if max(self._filamentMM) == 0.0:
+			statistics = self.getGCodeStatistics()
+			if statistics is not None:
+				filament = statistics.extruderExtrusion
+				if profile.getMachineSetting('gcode_flavor') in ['UltiGCode', 'RepRap (Volumetric)']:
+					filament = filament / statistics.filamentArea
+				for e in xrange(0, min(len(filament), len(self._filamentMM))):
+					self._filamentMM[e] = max(0.0, float(filament[e]))
+				filled = True
+		return filled
+
+	def _gcodeProgressCallback(self, progress):
+		if self._gcodeLoadAborted:
+			return True
+		return self._gcodeLoadCallback(self, progress)
+
 	def _gcodeInterpreterCallback(self, progress):
-		if len(self._gcodeInterpreter.layerList) % 5 == 0:
+		#Parsing on a thread of this process competes with the GUI for the interpreter lock, so the GUI gets time every 5 layers.
+		if not self._gcodeLoadAborted and len(self._gcodeInterpreter.layerList) % 5 == 0:
 			time.sleep(0.1)
-		return self._gcodeLoadCallback(self, progress)
+		return self._gcodeProgressCallback(progress)
 
 	def submitInfoOnline(self):
 		if profile.getPreference('submit_slice_information') != 'True':
@@ -173,6 +559,302 @@ class EngineResult(object):
 			import traceback
 			traceback.print_exc()
 
+class SocketReader(object):
+	"""
+	Buffered reader for the socket connection with the engine. Small reads are served from a reusable buffer that is
+	filled with recv_into, large reads are received directly into the memory of the target array.
+	Raises an EOFError when the connection is closed.
+	"""
+	def __init__(self, sock, bufferSize = 64 * 1024):
+		self._sock = sock
+		self._buffer = bytearray(bufferSize)
+		self._view = memoryview(self._buffer)
+		self._start = 0
+		self._end = 0
+
+	def _recvInto(self, view):
+		while True:
+			try:
+				size = self._sock.recv_into(view)
+			except socket.error, e:
+				if e.errno == errno.EINTR:
+					continue
+				raise EOFError()
+			if size < 1:
+				raise EOFError()
+			return size
+
+	def _fill(self, size):
+		#Make sure at least size bytes are in the buffer.
+		if self._end - self._start >= size:
+			return
+		if self._start > 0:
+			remaining = self._end - self._start
+			self._buffer[0:remaining] = self._view[self._start:self._end]
+			self._start = 0
+			self._end = remaining
+		while self._end < size:
+			self._end += self._recvInto(self._view[self._end:])
+
+	def readInt(self):
+		self._fill(4)
+		value = struct.unpack_from('@i', self._buffer, self._start)[0]
+		self._start += 4
+		return value
+
+	def read(self, size):
+		self._fill(size)
+		data = str(self._buffer[self._start:self._start + size])
+		self._start += size
+		return data
+
+	def readInto(self, view):
+		"""
+		Fill a writable byte memoryview with the next bytes of the socket.
+		"""
+		size = len(view)
+		done = min(size, self._end - self._start)
+		view[0:done] = self._view[self._start:self._start + done]
+		self._start += done
+		while size - done >= len(self._buffer):
+			done += self._recvInto(view[done:])
+		if done < size:
+			self._fill(size - done)
+			view[done:] = self._view[self._start:self._start + size - done]
+			self._start += size - done
+
+class EngineModel(object):
+	"""
+	The meshes of a scene as they are send to the engine, with the engine arguments which place the objects. Preparing this
+	once allows slicing the same models with different settings, without transforming and hashing the meshes again.
+	"""
+	def __init__(self, scene):
+		self.extruderCount = 1
+		for obj in scene.objects():
+			if scene.checkPlatform(obj):
+				self.extruderCount = max(self.extruderCount, len(obj._meshList))
+		self.commandList = []
+		self.modelData = []
+		#The arguments and meshes of each object of a one at a time print, so the objects can be sliced in parallel.
+		self.objectCommandLists = None
+		self.objectModelData = None
+		self.objCount = 0
+		self._modelKey = None
+		hash = hashlib.sha512()
+		order = scene.printOrder()
+		if order is None:
+			pos = numpy.array(profile.getMachineCenterCoords()) * 1000
+			objMin = None
+			objMax = None
+			for obj in scene.objects():
+				if scene.checkPlatform(obj):
+					oMin = obj.getMinimum()[0:2] + obj.getPosition()
+					oMax = obj.getMaximum()[0:2] + obj.getPosition()
+					if objMin is None:
+						objMin = oMin
+						objMax = oMax
+					else:
+						objMin[0] = min(oMin[0], objMin[0])
+						objMin[1] = min(oMin[1], objMin[1])
+						objMax[0] = max(oMax[0], objMax[0])
+						objMax[1] = max(oMax[1], objMax[1])
+			if objMin is None:
+				self.modelHash = hash.hexdigest()
+				return
+			pos += (objMin + objMax) / 2.0 * 1000
+			self.commandList += ['-s', 'posx=%d' % int(pos[0]), '-s', 'posy=%d' % int(pos[1])]
+
+			vertexTotal = [0] * 4
+			meshMax = 1
+			for obj in scene.objects():
+				if scene.checkPlatform(obj):
+					meshMax = max(meshMax, len(obj._meshList))
+					for n in xrange(0, len(obj._meshList)):
+						vertexTotal[n] += obj._meshList[n].vertexCount
+
+			for n in xrange(0, meshMax):
+				#The transformed vertexes of all objects are written into one preallocated array.
+				verts = numpy.empty((vertexTotal[n], 3), numpy.float32)
+				offset = 0
+				for obj in scene.objects():
+					if scene.checkPlatform(obj):
+						if n < len(obj._meshList):
+							mesh = obj._meshList[n]
+							vertexes = verts[offset:offset + mesh.vertexCount]
+							numpy.subtract(mesh.getTransformedVertexes()[:mesh.vertexCount], obj._drawOffset, out=vertexes, casting='unsafe')
+							vertexes += numpy.array([obj.getPosition()[0], obj.getPosition()[1], 0.0])
+							offset += mesh.vertexCount
+							hash.update(numpy.ascontiguousarray(mesh.vertexes).data)
+				self.modelData.append((vertexTotal[n], verts))
+
+			self.commandList += ['$' * meshMax]
+			self.objCount = 1
+		else:
+			self.objectCommandLists = []
+			self.objectModelData = []
+			for n in order:
+				obj = scene.objects()[n]
+				for mesh in obj._meshList:
+					self.modelData.append((mesh.vertexCount, mesh.vertexes))
+					hash.update(numpy.ascontiguousarray(mesh.vertexes).data)
+				pos = obj.getPosition() * 1000
+				pos += numpy.array(profile.getMachineCenterCoords()) * 1000
+				objectCommandList = ['-m', ','.join(map(str, obj._matrix.getA().flatten()))]
+				objectCommandList += ['-s', 'posx=%d' % int(pos[0]), '-s', 'posy=%d' % int(pos[1])]
+				objectCommandList += ['$' * len(obj._meshList)]
+				self.commandList += objectCommandList
+				self.objectCommandLists.append(objectCommandList)
+				self.objectModelData.append(self.modelData[-len(obj._meshList):])
+				self.objCount += 1
+		self.modelHash = hash.hexdigest()
+
+	def getModelKey(self):
+		#The slice cache key of the vertexes, computed once for all slices of this model.
+		if self._modelKey is None:
+			self._modelKey = sliceCache.getModelKey(self.modelData)
+		return self._modelKey
+
+class _ObjectGCode(object):
+	"""
+	The layout of the GCode of an object which is sliced on its own: the start GCode, the layers of the object, and the end of
+	the print, which is a retraction, a move of the head above the object and the end GCode.
+	Raises a ValueError when the GCode does not have this layout.
+	"""
+	def __init__(self, gcode, startCode, endCode):
+		self.gcode = gcode
+		#The engine writes a newline after the start and end GCode.
+		self.bodyStart = len(startCode) + 1
+		size = len(gcode)
+
+		#The first move goes to the start of the first layer, the first extrusion needs to be primed after a retraction.
+		head = _readGCode(gcode, self.bodyStart, min(size, self.bodyStart + OBJECT_HEAD_SIZE))
+		self.firstXY = None
+		self.extrudeStart = None
+		self.extrudeFeedrate = None
+		feedrate = None
+		offset = self.bodyStart
+		for line in head.split('\n')[:-1]:
+			if line.startswith('G0 ') or line.startswith('G1 '):
+				params = dict((param[0], param) for param in line.split(' ')[1:] if param != '')
+				if self.firstXY is None and 'X' in params and 'Y' in params:
+					self.firstXY = (params['X'], params['Y'])
+				if line.startswith('G1 ') and 'E' in params and 'X' in params:
+					self.extrudeStart = offset
+					if 'F' not in params:
+						self.extrudeFeedrate = feedrate
+					break
+				if 'F' in params:
+					feedrate = params['F']
+			offset += len(line) + 1
+		if self.firstXY is None or self.extrudeStart is None:
+			raise ValueError('No extrusion found at the start of the object')
+
+		tail = _readGCode(gcode, max(self.bodyStart, size - OBJECT_TAIL_SIZE - len(endCode)), size)
+		if not tail.endswith(endCode + '\n'):
+			raise ValueError('No end GCode found at the end of the object')
+		lines = tail[:len(tail) - len(endCode) - 1].split('\n')
+		if len(lines) < 3 or not lines[-2].startswith('G0 ') or ' Z' not in lines[-2]:
+			raise ValueError('No move above the object found at the end of the object')
+		self.liftLine = lines[-2]
+		self.liftZ = float(re.search(' Z([-0-9.]+)', self.liftLine).group(1))
+		self.retractLine = None
+		if lines[-3].startswith('G1 ') and ' E' in lines[-3] and ' X' not in lines[-3]:
+			self.retractLine = lines[-3]
+		self.endStart = size - len(endCode) - 1
+		self.bodyEnd = self.endStart - len(self.liftLine) - 1
+		if self.retractLine is not None:
+			self.bodyEnd -= len(self.retractLine) + 1
+
+	def copyTo(self, result, start, end):
+		self.gcode.seek(start)
+		size = end - start
+		while size > 0:
+			data = self.gcode.read(min(size, STDOUT_READ_SIZE))
+			if len(data) < 1:
+				break
+			result.appendGCode(data)
+			size -= len(data)
+
+class _ObjectEngine(object):
+	"""
+	A CuraEngine process which slices one object of a one at a time print, so the objects are sliced in parallel.
+	Each process connects to its own socket, so the meshes and polygons of the processes are not mixed.
+	"""
+	def __init__(self, engine, settingsCommandList, objectCommandList, modelData):
+		self._engine = engine
+		self._modelData = modelData
+		self._result = EngineResult()
+		self._socketMetrics = {}
+		self._objCount = 1
+		self._process = None
+		self._aborted = False
+		self.progress = 0.0
+		self.returnCode = None
+		self._serversocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		self._serversocket.bind(('127.0.0.1', 0))
+		self._serversocket.listen(1)
+		self._commandList = settingsCommandList + ['-g', '%d' % (self._serversocket.getsockname()[1])] + objectCommandList
+
+	def getResult(self):
+		return self._result
+
+	def run(self):
+		try:
+			if self._aborted:
+				return
+			try:
+				self._process = self._engine._runEngineProcess(self._commandList)
+			except OSError:
+				traceback.print_exc()
+				return
+			if self._aborted:
+				self.terminate()
+			socketThread = threading.Thread(target=self._acceptThread)
+			socketThread.daemon = True
+			socketThread.start()
+			logThread = threading.Thread(target=self._engine._watchStderr, args=(self._process.stderr, self))
+			logThread.daemon = True
+			logThread.start()
+
+			stdout = self._process.stdout.fileno()
+			data = os.read(stdout, STDOUT_READ_SIZE)
+			while len(data) > 0:
+				self._result.appendGCode(data)
+				data = os.read(stdout, STDOUT_READ_SIZE)
+			self.returnCode = self._process.wait()
+			logThread.join()
+			socketThread.join()
+		finally:
+			self._serversocket.close()
+
+	def _acceptThread(self):
+		#Wait for the connection of the engine, as long as the engine runs.
+		self._serversocket.settimeout(0.5)
+		while self._process.poll() is None:
+			try:
+				sock, _ = self._serversocket.accept()
+			except socket.timeout:
+				continue
+			except socket.error, e:
+				if e.errno != errno.EINTR:
+					return
+				continue
+			sock.settimeout(None)
+			self._engine._socketConnectionThread(sock, self)
+			return
+
+	def _callback(self, progress):
+		self.progress = progress
+		self._engine._objectEngineProgress()
+
+	def terminate(self):
+		self._aborted = True
+		if self._process is not None:
+			try:
+				self._process.terminate()
+			except:
+				pass
+
 class Engine(object):
 	"""
 	Class used to communicate with the CuraEngine.
@@ -190,6 +872,10 @@ class Engine(object):
 		self._progressSteps = ['inset', 'skin', 'export']
 		self._objCount = 0
 		self._result = None
+		#Engine processes of the objects which are sliced in parallel.
+		self._objectEngines = []
+		#Time spent in the socket thread for the running engine, added to the metrics of the result when the engine is done.
+		self._socketMetrics = {}
 
 		self._engine_executable = getEngineFilename()
 		self._serversocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -221,51 +907,68 @@ class Engine(object):
 				if e.errno != errno.EINTR:
 					raise
 
-	def _socketConnectionThread(self, sock):
+	def _socketConnectionThread(self, sock, target = None):
+		#The target holds the meshes to send and the result which receives the polygons, the engine itself or an _ObjectEngine.
+		if target is None:
+			target = self
+		reader = SocketReader(sock)
+		#Buffer which receives the points of all polygons of a GUI_CMD_SEND_POLYGONS command, it grows when needed.
+		pointBuffer = numpy.empty(64 * 1024, numpy.int64)
+		pointView = memoryview(pointBuffer.view(numpy.uint8))
 		layerNrOffset = 0
 		while True:
 			try:
-				data = sock.recv(4)
-			except:
-				data = ''
-			if len(data) == 0:
+				cmd = reader.readInt()
+			except EOFError:
 				sock.close()
 				return
-			cmd = struct.unpack('@i', data)[0]
 			if cmd == self.GUI_CMD_REQUEST_MESH:
-				meshInfo = self._modelData[0]
-				self._modelData = self._modelData[1:]
-				sock.sendall(struct.pack('@i', meshInfo[0]))
-				sock.sendall(meshInfo[1].tostring())
+				with _phaseTimer(target._socketMetrics, 'meshSend'):
+					meshInfo = target._modelData[0]
+					target._modelData = target._modelData[1:]
+					sock.sendall(struct.pack('@i', meshInfo[0]))
+					#Send the vertexes straight from the array memory, without making a string copy.
+					sock.sendall(memoryview(numpy.ascontiguousarray(meshInfo[1], numpy.float32)))
 			elif cmd == self.GUI_CMD_SEND_POLYGONS:
-				cnt = struct.unpack('@i', sock.recv(4))[0]
-				layerNr = struct.unpack('@i', sock.recv(4))[0]
-				layerNr += layerNrOffset
-				z = struct.unpack('@i', sock.recv(4))[0]
-				z = float(z) / 1000.0
-				typeNameLen = struct.unpack('@i', sock.recv(4))[0]
-				typeName = sock.recv(typeNameLen)
-				while len(self._result._polygons) < layerNr + 1:
-					self._result._polygons.append({})
-				polygons = self._result._polygons[layerNr]
+				startTime = time.time()
+				try:
+					cnt = reader.readInt()
+					layerNr = reader.readInt()
+					layerNr += layerNrOffset
+					z = reader.readInt()
+					z = float(z) / 1000.0
+					typeNameLen = reader.readInt()
+					typeName = reader.read(typeNameLen)
+					#Receive the points of all polygons into one buffer, and convert them at once.
+					offsets = [0]
+					end = 0
+					for n in xrange(0, cnt):
+						length = reader.readInt()
+						start = end
+						end += length
+						offsets.append(end)
+						if end * 16 > len(pointView):
+							newBuffer = numpy.empty(max(len(pointBuffer) * 2, end * 2), numpy.int64)
+							newBuffer[:start * 2] = pointBuffer[:start * 2]
+							pointBuffer = newBuffer
+							pointView = memoryview(pointBuffer.view(numpy.uint8))
+						reader.readInto(pointView[start * 16:end * 16])
+				except EOFError:
+					sock.close()
+					return
+				while len(target._result._polygons) < layerNr + 1:
+					target._result._polygons.append({})
+				polygons = target._result._polygons[layerNr]
 				if typeName not in polygons:
-					polygons[typeName] = []
-				for n in xrange(0, cnt):
-					length = struct.unpack('@i', sock.recv(4))[0]
-					data = ''
-					while len(data) < length * 8 * 2:
-						recvData = sock.recv(length * 8 * 2 - len(data))
-						if len(recvData) < 1:
-							return
-						data += recvData
-					polygon2d = numpy.array(numpy.fromstring(data, numpy.int64), numpy.float32) / 1000.0
-					polygon2d = polygon2d.reshape((len(polygon2d) / 2, 2))
-					polygon = numpy.empty((len(polygon2d), 3), numpy.float32)
-					polygon[:,:-1] = polygon2d
-					polygon[:,2] = z
-					polygons[typeName].append(polygon)
+					polygons[typeName] = PolygonStorage()
+				#Convert the points straight into the storage of this layer and type.
+				points = polygons[typeName].growPoints(end)
+				numpy.multiply(pointBuffer[:end * 2].reshape((end, 2)), 0.001, out=points[:,:-1], casting='unsafe')
+				points[:,2] = z
+				polygons[typeName].addPolygons(offsets)
+				_addPhaseTime(target._socketMetrics, 'polygonReceive', time.time() - startTime)
 			elif cmd == self.GUI_CMD_FINISH_OBJECT:
-				layerNrOffset = len(self._result._polygons)
+				layerNrOffset = len(target._result._polygons)
 			else:
 				print "Unknown command on socket: %x" % (cmd)
 
@@ -273,6 +976,7 @@ class Engine(object):
 		self.abortEngine()
 		self.wait()
 		self._serversocket.close()
+		gcodeWorker.removeTempFiles()
 
 	def abortEngine(self):
 		if self._process is not None:
@@ -280,6 +984,8 @@ class Engine(object):
 				self._process.terminate()
 			except:
 				pass
+		for objectEngine in self._objectEngines:
+			objectEngine.terminate()
 
 	def wait(self):
 		if self._thread is not None:
@@ -291,111 +997,85 @@ class Engine(object):
 	def runEngine(self, scene, overrides = None):
 		if len(scene.objects()) < 1:
 			return
-		self._thread = threading.Thread(target=self._runEngine, args=(scene, overrides, self._thread))
+		self._startEngineThread(scene, None, overrides)
+
+	def runEngineModel(self, model, overrides = None):
+		"""
+		Slice a prepared EngineModel, to slice the same models with different settings overrides.
+		"""
+		self._startEngineThread(None, model, overrides)
+
+	def _startEngineThread(self, scene, model, overrides):
+		self._thread = threading.Thread(target=self._runEngine, args=(scene, model, overrides, self._thread))
 		self._thread.daemon = True
 		self._thread.start()
 
-	def _runEngine(self, scene, overrides, old_thread):
+	def _runEngine(self, scene, model, overrides, old_thread):
 		if old_thread is not None:
-			if self._process is not None:
-				try:
-					self._process.terminate()
-				except:
-					pass
+			self.abortEngine()
 			old_thread.join()
 		self._callback(-1.0)
+		startTime = time.time()
+		metrics = {}
 
-		extruderCount = 1
-		for obj in scene.objects():
-			if scene.checkPlatform(obj):
-				extruderCount = max(extruderCount, len(obj._meshList))
-
-		extruderCount = max(extruderCount, profile.minimalExtruderCount())
-
-		if overrides is not None:
-			for k, v in overrides.items():
-				profile.setTempOverride(k, v)
-		commandList = [self._engine_executable, '-v', '-p']
-		for k, v in self._engineSettings(extruderCount).iteritems():
-			commandList += ['-s', '%s=%s' % (k, str(v))]
-		commandList += ['-g', '%d' % (self._serverPortNr)]
-		if overrides is not None:
-			profile.resetTempOverride()
-		self._objCount = 0
-		engineModelData = []
-		hash = hashlib.sha512()
-		order = scene.printOrder()
-		if order is None:
-			pos = numpy.array(profile.getMachineCenterCoords()) * 1000
-			objMin = None
-			objMax = None
-			for obj in scene.objects():
-				if scene.checkPlatform(obj):
-					oMin = obj.getMinimum()[0:2] + obj.getPosition()
-					oMax = obj.getMaximum()[0:2] + obj.getPosition()
-					if objMin is None:
-						objMin = oMin
-						objMax = oMax
-					else:
-						objMin[0] = min(oMin[0], objMin[0])
-						objMin[1] = min(oMin[1], objMin[1])
-						objMax[0] = max(oMax[0], objMax[0])
-						objMax[1] = max(oMax[1], objMax[1])
-			if objMin is None:
-				return
-			pos += (objMin + objMax) / 2.0 * 1000
-			commandList += ['-s', 'posx=%d' % int(pos[0]), '-s', 'posy=%d' % int(pos[1])]
-
-			vertexTotal = [0] * 4
-			meshMax = 1
-			for obj in scene.objects():
-				if scene.checkPlatform(obj):
-					meshMax = max(meshMax, len(obj._meshList))
-					for n in xrange(0, len(obj._meshList)):
-						vertexTotal[n] += obj._meshList[n].vertexCount
-
-			for n in xrange(0, meshMax):
-				verts = numpy.zeros((0, 3), numpy.float32)
-				for obj in scene.objects():
-					if scene.checkPlatform(obj):
-						if n < len(obj._meshList):
-							vertexes = (numpy.matrix(obj._meshList[n].vertexes, copy = False) * numpy.matrix(obj._matrix, numpy.float32)).getA()
-							vertexes -= obj._drawOffset
-							vertexes += numpy.array([obj.getPosition()[0], obj.getPosition()[1], 0.0])
-							verts = numpy.concatenate((verts, vertexes))
-							hash.update(obj._meshList[n].vertexes.tostring())
-				engineModelData.append((vertexTotal[n], verts))
-
-			commandList += ['$' * meshMax]
-			self._objCount = 1
-		else:
-			for n in order:
-				obj = scene.objects()[n]
-				for mesh in obj._meshList:
-					engineModelData.append((mesh.vertexCount, mesh.vertexes))
-					hash.update(mesh.vertexes.tostring())
-				pos = obj.getPosition() * 1000
-				pos += numpy.array(profile.getMachineCenterCoords()) * 1000
-				commandList += ['-m', ','.join(map(str, obj._matrix.getA().flatten()))]
-				commandList += ['-s', 'posx=%d' % int(pos[0]), '-s', 'posy=%d' % int(pos[1])]
-				commandList += ['$' * len(obj._meshList)]
-				self._objCount += 1
-		modelHash = hash.hexdigest()
+		if model is None:
+			with _phaseTimer(metrics, 'meshTransform'):
+				model = EngineModel(scene)
+		self._objCount = model.objCount
 		if self._objCount < 1:
 			return
 		if self._thread != threading.currentThread():
 			return
+		extruderCount = max(model.extruderCount, profile.minimalExtruderCount())
 
-		self._modelData = engineModelData
+		phaseStart = time.time()
+		if overrides is None:
+			overrides = {}
+		with _tempOverrides(overrides):
+			engineSettings = self._engineSettings(extruderCount)
+		alterations = {}
+		for name in POST_SLICE_SETTINGS:
+			if engineSettings[name] != '':
+				alterations[name] = engineSettings[name]
+				engineSettings[name] = ALTERATION_MARKER % (name)
+		commandList = self._settingsCommandList(engineSettings) + ['-g', '%d' % (self._serverPortNr)]
+		metrics['settings'] = time.time() - phaseStart
+		commandList += model.commandList
+		modelHash = model.modelHash
+		parallel = model.objectCommandLists is not None and self._canSliceObjectsInParallel(engineSettings, extruderCount, len(model.objectCommandLists))
+
+		with _phaseTimer(metrics, 'cacheLookup'):
+			#Objects which are sliced in parallel are joined with slightly different moves between the objects.
+			cacheArgs = model.commandList + (['parallel'] if parallel else [])
+			cacheKey = sliceCache.getKey(self._engine_executable, engineSettings, cacheArgs, model.getModelKey())
+		if self._loadCachedResult(cacheKey, modelHash, alterations, overrides, metrics, startTime):
+			return
+		if parallel:
+			if self._runObjectEngines(engineSettings, alterations, overrides, model.objectCommandLists, model.objectModelData, cacheKey, modelHash, metrics, startTime):
+				return
+			#The GCode of the objects could not be joined, slice all objects in one engine instead.
+
+		self._modelData = model.modelData
+		self._socketMetrics = {}
 		try:
-			self._process = self._runEngineProcess(commandList)
+			with _phaseTimer(metrics, 'engineStart'):
+				self._process = self._runEngineProcess(commandList)
 		except OSError:
 			traceback.print_exc()
 			return
+		engineStartTime = time.time()
 
+		if self._result is not None:
+			self._result.abortGCodeLoad()
 		self._result = EngineResult()
 		self._result.addLog('Running: %s' % (' '.join(commandList)))
 		self._result.setHash(modelHash)
+		self._result.addMetrics(metrics)
+		self._result.setAlterations(alterations)
+		self._result.setOverrides(overrides)
+		if len(pluginInfo.getPostProcessPluginConfig()) < 1:
+			#Post processing plugins change the GCode after it is received, so only stream when there are none.
+			self._result.startGCodeStream()
 		self._callback(0.0)
 
 		logThread = threading.Thread(target=self._watchStderr, args=(self._process.stderr,))
@@ -403,26 +1083,29 @@ class Engine(object):
 		logThread.start()
 
 		try:
-			data = self._process.stdout.read(4096)
+			#Read the GCode in large chunks directly from the pipe, a read returns as soon as some data is available.
+			stdout = self._process.stdout.fileno()
+			data = os.read(stdout, STDOUT_READ_SIZE)
 			while len(data) > 0:
 				if self._thread != threading.currentThread():
 					self._process.terminate()
-				self._result._gcodeData.write(data)
-				data = self._process.stdout.read(4096)
+				with self._result.timePhase('gcodeReceive'):
+					self._result.appendGCode(data)
+				data = os.read(stdout, STDOUT_READ_SIZE)
+			with self._result.timePhase('gcodeReceive'):
+				self._result.finishGCodeStream()
 
 			returnCode = self._process.wait()
 			logThread.join()
+			self._result.addMetrics({'engine': time.time() - engineStartTime})
+			self._result.addMetrics(self._socketMetrics)
 			if returnCode == 0:
-				self._result.addReplaceTag('#P_TIME#', self._result.getPrintTime())
-				self._result.addReplaceTag('#F_AMNT#', self._result.getFilamentAmountMeters(0))
-				self._result.addReplaceTag('#F_WGHT#', math.floor(self._result.getFilamentWeight(0) * 1000.0))
-				self._result.addReplaceTag('#F_COST#', self._result.getFilamentCost(0))
-				self._result.applyReplaceTags()
-				plugin_error = pluginInfo.runPostProcessingPlugins(self._result)
-				if plugin_error is not None:
-					print plugin_error
-					self._result.addLog(plugin_error)
-				self._result.setFinished(True)
+				#The cache keeps the GCode before the replace tags and post processing, these are applied to cached results again.
+				with self._result.timePhase('cacheStore'):
+					sliceCache.store(cacheKey, self._result)
+				self._finishResult(self._result)
+				self._result.addMetrics({'total': time.time() - startTime})
+				self._logMetrics(self._result)
 				self._callback(1.0)
 			else:
 				for line in self._result.getLog():
@@ -434,13 +1117,224 @@ class Engine(object):
 			self._result.addLog("MemoryError")
 			self._callback(-1.0)
 
-	def _watchStderr(self, stderr):
+	def _settingsCommandList(self, engineSettings):
+		commandList = [self._engine_executable, '-v', '-p']
+		for k, v in engineSettings.iteritems():
+			commandList += ['-s', '%s=%s' % (k, str(v))]
+		return commandList
+
+	def _canSliceObjectsInParallel(self, engineSettings, extruderCount, objectCount):
+		"""
+		Objects of a one at a time print can be sliced in parallel when the 'slice_parallel_objects' preference is set.
+		Joining the GCode of the objects handles absolute E values of a single extruder without Z hop on retraction.
+		"""
+		if profile.getPreference('slice_parallel_objects') != 'True':
+			return False
+		return objectCount > 1 and extruderCount == 1 and 'gcodeFlavor' not in engineSettings and engineSettings['retractionZHop'] == 0
+
+	def _objectEngineProgress(self):
+		self._callback(sum([objectEngine.progress for objectEngine in self._objectEngines]) / max(1, len(self._objectEngines)))
+
+	def _runObjectEngines(self, engineSettings, alterations, overrides, objectCommandLists, objectModelData, cacheKey, modelHash, metrics, startTime):
+		"""
+		Slice each object of a one at a time print in its own engine process, with at most one process per CPU core, and join
+		their GCode in print order. Only the first object gets the start GCode, and only the last object the end GCode.
+		Returns False when the GCode of the objects can not be joined.
+		"""
+		count = len(objectCommandLists)
+		startCodes = [engineSettings['startCode']] + [''] * (count - 1)
+		endCodes = [''] * (count - 1) + [engineSettings['endCode']]
+		objectEngines = []
+		for n in xrange(0, count):
+			settings = engineSettings.copy()
+			settings['startCode'] = startCodes[n]
+			settings['endCode'] = endCodes[n]
+			objectEngines.append(_ObjectEngine(self, self._settingsCommandList(settings), objectCommandLists[n], objectModelData[n]))
+
+		if self._result is not None:
+			self._result.abortGCodeLoad()
+		self._result = EngineResult()
+		self._result.addLog('Slicing %d objects in parallel' % (count))
+		self._result.setHash(modelHash)
+		self._result.addMetrics(metrics)
+		self._result.setAlterations(alterations)
+		self._result.setOverrides(overrides)
+		self._objectEngines = objectEngines
+		self._callback(0.0)
+
+		engineStartTime = time.time()
+		semaphore = threading.Semaphore(max(1, multiprocessing.cpu_count()))
+		def runObjectEngine(objectEngine):
+			with semaphore:
+				objectEngine.run()
+		threads = []
+		for objectEngine in objectEngines:
+			thread = threading.Thread(target=runObjectEngine, args=(objectEngine,))
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+		for thread in threads:
+			thread.join()
+		self._objectEngines = []
+		self._result.addMetrics({'engine': time.time() - engineStartTime})
+		for objectEngine in objectEngines:
+			for line in objectEngine.getResult().getLog():
+				self._result.addLog(line)
+			for name, seconds in objectEngine._socketMetrics.items():
+				_addPhaseTime(self._result._metrics, name, seconds)
+		if self._thread != threading.currentThread():
+			return True
+		if len([objectEngine for objectEngine in objectEngines if objectEngine.returnCode != 0]) > 0:
+			for line in self._result.getLog():
+				print line
+			self._callback(-1.0)
+			return True
+
+		try:
+			objects = []
+			for n in xrange(0, count):
+				objects.append(_ObjectGCode(objectEngines[n].getResult().getGCode(), startCodes[n], endCodes[n]))
+		except ValueError:
+			traceback.print_exc()
+			return False
+		result = self._result
+		if len(pluginInfo.getPostProcessPluginConfig()) < 1:
+			result.startGCodeStream()
+		with result.timePhase('gcodeJoin'):
+			self._joinObjectGCode(result, objects, engineSettings)
+			result.finishGCodeStream()
+		result._printTimeSeconds = 0
+		for objectEngine in objectEngines:
+			objectResult = objectEngine.getResult()
+			result._polygons += objectResult._polygons
+			result._printTimeSeconds += objectResult._printTimeSeconds or 0
+			for e in xrange(0, len(result._filamentMM)):
+				result._filamentMM[e] += objectResult._filamentMM[e]
+			result._replaceInfo.update(objectResult._replaceInfo)
+		with result.timePhase('cacheStore'):
+			sliceCache.store(cacheKey, result)
+		self._finishResult(result)
+		result.addMetrics({'total': time.time() - startTime})
+		self._logMetrics(result)
+		self._callback(1.0)
+		return True
+
+	def _joinObjectGCode(self, result, objects, engineSettings):
+		"""
+		Append the GCode of separately sliced objects to the result, with the moves the engine makes between objects: reset the
+		E value, retract, lift the head above the highest object printed so far, and move to the start of the next object.
+		The retraction is primed again at the first extrusion of the next object.
+		"""
+		liftZ = 0.0
+		for n, obj in enumerate(objects):
+			if n == 0:
+				obj.copyTo(result, 0, obj.bodyEnd)
+				liftZ = obj.liftZ
+				continue
+			previous = objects[n - 1]
+			moves = 'G92 E0\n'
+			if previous.retractLine is not None:
+				moves += _setGCodeValue(previous.retractLine, 'E', '%0.5f' % (-engineSettings['retractionAmount'] / 1000.0)) + '\n'
+			moves += _setGCodeValue(previous.liftLine, 'Z', '%0.3f' % (liftZ)) + '\n'
+			moves += 'G0 %s %s\n' % obj.firstXY
+			result.appendGCode(moves)
+			obj.copyTo(result, obj.bodyStart, obj.extrudeStart)
+			if previous.retractLine is not None:
+				result.appendGCode('G1 F%d E%0.5f\n' % (engineSettings['retractionSpeed'] * 60, 0.0))
+				if obj.extrudeFeedrate is not None:
+					#The prime changed the feedrate, so the first extrusion needs its feedrate again.
+					result.appendGCode('G1 %s' % (obj.extrudeFeedrate))
+					obj.copyTo(result, obj.extrudeStart + 2, obj.bodyEnd)
+					liftZ = max(liftZ, obj.liftZ)
+					continue
+			obj.copyTo(result, obj.extrudeStart, obj.bodyEnd)
+			liftZ = max(liftZ, obj.liftZ)
+		last = objects[-1]
+		moves = ''
+		if last.retractLine is not None:
+			moves += last.retractLine + '\n'
+		moves += _setGCodeValue(last.liftLine, 'Z', '%0.3f' % (liftZ)) + '\n'
+		result.appendGCode(moves)
+		last.copyTo(result, last.endStart, len(last.gcode))
+
+	def _finishResult(self, result):
+		#Apply the replace tags and the post processing plugins, after the GCode is received from the engine or loaded from the cache.
+		#The plugins read the profile, so the overrides of the result are set while they run.
+		with _tempOverrides(result.getOverrides()):
+			with result.timePhase('replaceTags'):
+				result.addReplaceTag('#P_TIME#', result.getPrintTime())
+				result.addReplaceTag('#F_AMNT#', result.getFilamentAmountMeters(0))
+				result.addReplaceTag('#F_WGHT#', math.floor(result.getFilamentWeight(0) * 1000.0))
+				result.addReplaceTag('#F_COST#', result.getFilamentCost(0))
+				result.applyReplaceTags()
+			with result.timePhase('postProcessing'):
+				plugin_error = pluginInfo.runPostProcessingPlugins(result)
+		if plugin_error is not None:
+			print plugin_error
+			result.addLog(plugin_error)
+		result.setFinished(True)
+
+	def _loadCachedResult(self, cacheKey, modelHash, alterations, overrides, metrics, startTime):
+		"""
+		Use the result of an earlier slice with the same settings and models, without running the engine.
+		When only the start or end GCode changed, the new GCode is put in the cached GCode.
+		Returns False when the result is not in the slice cache.
+		"""
+		result = EngineResult()
+		result.setOverrides(overrides)
+		with result.timePhase('cacheLoad'):
+			if not sliceCache.load(cacheKey, result):
+				return False
+		with result.timePhase('alterations'):
+			if not result.replaceAlterations(alterations):
+				return False
+		#The final GCode depends on the cache entry, the start and end GCode, the replace tags and the post processing.
+		contentKey = hashlib.sha1(cacheKey)
+		for name, code in sorted(alterations.items()):
+			contentKey.update('%s:%s\n' % (name, code))
+		self._finishResult(result)
+		contentKey.update(repr(sorted(result._replaceInfo.items())))
+		contentKey.update(repr(result._getProfileSetting('plugin_config')))
+		result.addMetrics(metrics)
+		result.addMetrics({'total': time.time() - startTime})
+		self._logMetrics(result)
+		result.addLog('Using cached result: %s' % (cacheKey))
+		result.setHash(modelHash)
+		result._toolpathCacheKey = toolpathCache.getKey(contentKey.hexdigest(), len(result._gcodeData))
+		if self._result is not None:
+			self._result.abortGCodeLoad()
+		self._result = result
+		self._callback(1.0)
+		return True
+
+	def _logMetrics(self, result):
+		#Append the metrics of a finished slice as a JSON line to the file in the 'slice_metrics_log' preference.
+		filename = profile.getPreference('slice_metrics_log')
+		if filename == '':
+			return
+		try:
+			with open(filename, 'a') as f:
+				f.write(json.dumps({'time': time.time(), 'modelHash': result._modelHash, 'metrics': result.getMetrics()}) + '\n')
+		except IOError:
+			traceback.print_exc()
+
+	def _watchStderr(self, stderr, target = None):
+		if target is None:
+			target = self
 		objectNr = 0
+		#The time of each engine step runs from its first progress line to the first progress line of the next step.
+		step = None
+		stepStartTime = time.time()
 		line = stderr.readline()
 		while len(line) > 0:
 			line = line.strip()
 			if line.startswith('Progress:'):
 				line = line.split(':')
+				if line[1] != step:
+					if step is not None:
+						target._result.addMetrics({'engine:' + step: time.time() - stepStartTime})
+					step = line[1]
+					stepStartTime = time.time()
 				if line[1] == 'process':
 					objectNr += 1
 				elif line[1] in self._progressSteps:
@@ -448,29 +1342,31 @@ class Engine(object):
 					progressValue /= len(self._progressSteps)
 					progressValue += 1.0 / len(self._progressSteps) * self._progressSteps.index(line[1])
 
-					progressValue /= self._objCount
-					progressValue += 1.0 / self._objCount * objectNr
+					progressValue /= target._objCount
+					progressValue += 1.0 / target._objCount * objectNr
 					try:
-						self._callback(progressValue)
+						target._callback(progressValue)
 					except:
 						pass
 			elif line.startswith('Print time:'):
-				self._result._printTimeSeconds = int(line.split(':')[1].strip())
+				target._result._printTimeSeconds = int(line.split(':')[1].strip())
 			elif line.startswith('Filament:'):
-				self._result._filamentMM[0] = int(line.split(':')[1].strip())
+				target._result._filamentMM[0] = int(line.split(':')[1].strip())
 				if profile.getMachineSetting('gcode_flavor') == 'UltiGCode':
 					radius = profile.getProfileSettingFloat('filament_diameter') / 2.0
-					self._result._filamentMM[0] /= (math.pi * radius * radius)
+					target._result._filamentMM[0] /= (math.pi * radius * radius)
 			elif line.startswith('Filament2:'):
-				self._result._filamentMM[1] = int(line.split(':')[1].strip())
+				target._result._filamentMM[1] = int(line.split(':')[1].strip())
 				if profile.getMachineSetting('gcode_flavor') == 'UltiGCode':
 					radius = profile.getProfileSettingFloat('filament_diameter') / 2.0
-					self._result._filamentMM[1] /= (math.pi * radius * radius)
+					target._result._filamentMM[1] /= (math.pi * radius * radius)
 			elif line.startswith('Replace:'):
-				self._result.addReplaceTag(line.split(':')[1].strip(), line.split(':')[2].strip())
+				target._result.addReplaceTag(line.split(':')[1].strip(), line.split(':')[2].strip())
 			else:
-				self._result.addLog(line)
+				target._result.addLog(line)
 			line = stderr.readline()
+		if step is not None:
+			target._result.addMetrics({'engine:' + step: time.time() - stepStartTime})
 
 	def _engineSettings(self, extruderCount):
 		settings = {
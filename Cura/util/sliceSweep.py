@@ -0,0 +1,182 @@
+"""
+The sliceSweep module slices the same models with a grid of setting overrides, for example to compare the print time and
+filament use of different layer heights and infill densities for a quote, or for a calibration series.
+The meshes are loaded and transformed once into an EngineModel, and the variants are sliced by a pool of processes which
+each run their own Engine. The result is a table with the print time and filament use of each variant.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import json
+import time
+import itertools
+import traceback
+import multiprocessing
+
+from Cura.util import profile
+from Cura.util import resources
+from Cura.util import validators
+
+#Engine and model of a sweep worker process.
+_worker = {}
+
+def _validateValue(key, value):
+	#The validators check the value of the setting itself, so the value is set while validating and restored after.
+	setting = profile.settingsDictionary[key]
+	oldValue = setting.getValue()
+	setting.setValue(value)
+	try:
+		result, message = setting.validate()
+	finally:
+		setting.setValue(oldValue)
+	if result == validators.ERROR:
+		raise ValueError('Invalid value for %s: %s' % (key, message))
+
+def parseGrid(args):
+	"""
+	Parse 'setting=value,value,...' arguments into a grid dictionary with a list of values for each setting.
+	Raises a ValueError for unknown settings and invalid values.
+	"""
+	grid = {}
+	for arg in args:
+		if '=' not in arg:
+			raise ValueError('Expected setting=value,value,... not: %s' % (arg))
+		key, values = arg.split('=', 1)
+		key = key.strip()
+		if not profile.isProfileSetting(key):
+			raise ValueError('Unknown profile setting: %s' % (key))
+		grid[key] = [value.strip() for value in values.split(',')]
+		for value in grid[key]:
+			_validateValue(key, value)
+	return grid
+
+def getVariants(grid):
+	"""
+	All combinations of the values in the grid, as a list of override dictionaries.
+	"""
+	keys = sorted(grid.keys())
+	return [dict(zip(keys, values)) for values in itertools.product(*[grid[key] for key in keys])]
+
+def prepareModel(filenames):
+	"""
+	Load the model files on the build platform of a scene, and transform them into an EngineModel.
+	"""
+	from Cura.util import sliceEngine
+	from Cura.util import objectScene
+	from Cura.util import meshLoader
+
+	scene = objectScene.Scene()
+	scene.updateMachineDimensions()
+	for filename in filenames:
+		meshes = meshLoader.loadMeshes(filename)
+		if len(meshes) < 1:
+			raise ValueError('No models loaded from: %s' % (filename))
+		for m in meshes:
+			scene.add(m)
+	model = sliceEngine.EngineModel(scene)
+	if model.objCount < 1:
+		raise ValueError('Nothing to slice, no models on the build platform')
+	return model
+
+def _startWorker(model):
+	from Cura.util import sliceEngine
+	_worker['model'] = model
+	_worker['engine'] = sliceEngine.Engine(lambda progress: None)
+
+def _initWorker(profileString, model):
+	#Pool processes on Windows do not inherit the loaded settings.
+	profile.loadPreferences(profile.getPreferencePath())
+	profile.setProfileFromString(profileString)
+	resources.setupLocalization(profile.getPreference('language'))
+	_startWorker(model)
+
+def _sliceVariant(overrides):
+	startTime = time.time()
+	summary = {'overrides': overrides, 'success': False, 'error': None}
+	try:
+		engine = _worker['engine']
+		previousResult = engine.getResult()
+		engine.runEngineModel(_worker['model'], overrides)
+		engine.wait()
+		result = engine.getResult()
+		if result is previousResult or not result.isFinished():
+			log = result.getLog()[-5:] if result is not previousResult else []
+			summary['error'] = '\n'.join(['Slicing failed'] + log)
+		else:
+			summary['printTimeSeconds'] = result._printTimeSeconds
+			summary['filamentMM'] = [float(amount) for amount in result._filamentMM]
+			summary['filamentGram'] = [result.getFilamentWeight(e) * 1000.0 for e in xrange(0, len(result._filamentMM))]
+			summary['filamentCost'] = result.getFilamentCost(0)
+			summary['success'] = True
+	except:
+		summary['error'] = traceback.format_exc()
+	summary['wallTime'] = time.time() - startTime
+	return summary
+
+def sweep(filenames, grid, processCount = 0):
+	"""
+	Slice the model files with each combination of overrides in the grid, on a pool of processCount processes, 0 uses one
+	process per CPU core. Returns the summaries of the variants, in the order of getVariants.
+	"""
+	model = prepareModel(filenames)
+	variants = getVariants(grid)
+	if processCount < 1:
+		processCount = multiprocessing.cpu_count()
+	processCount = min(processCount, len(variants))
+	if processCount < 2:
+		_startWorker(model)
+		try:
+			return map(_sliceVariant, variants)
+		finally:
+			_worker['engine'].cleanup()
+	pool = multiprocessing.Pool(processCount, _initWorker, (profile.getProfileString(), model))
+	try:
+		return pool.map(_sliceVariant, variants)
+	finally:
+		pool.close()
+		pool.join()
+
+def formatTable(summaries, keys):
+	"""
+	Format the summaries as a text table, with a column for each override and the print time and filament of each variant.
+	"""
+	header = keys + ['print time', 'filament (m)', 'filament (g)']
+	rows = []
+	for summary in summaries:
+		row = [str(summary['overrides'][key]) for key in keys]
+		if summary['success']:
+			seconds = summary['printTimeSeconds'] or 0
+			row += ['%d:%02d' % (seconds / 60 / 60, seconds / 60 % 60), '%0.2f' % (summary['filamentMM'][0] / 1000.0), '%0.1f' % (summary['filamentGram'][0])]
+		else:
+			row += ['failed', '', '']
+		rows.append(row)
+	widths = [max([len(row[n]) for row in rows + [header]]) for n in xrange(0, len(header))]
+	lines = []
+	for row in [header] + rows:
+		lines.append('  '.join([value.rjust(width) for value, width in zip(row, widths)]))
+	return '\n'.join(lines)
+
+def sweepFiles(filenames, gridArgs, processCount = 0, summaryFilename = None):
+	"""
+	Command line entry point: slice the files with the 'setting=value,value,...' grid arguments, print the table and write
+	the summaries as JSON to summaryFilename. Returns True when all variants succeeded.
+	"""
+	resources.setupLocalization(profile.getPreference('language'))
+	grid = parseGrid(gridArgs)
+	startTime = time.time()
+	summaries = sweep(filenames, grid, processCount)
+	print formatTable(summaries, sorted(grid.keys()))
+	for summary in summaries:
+		if not summary['success']:
+			print 'Failed to slice: %s' % (summary['overrides'])
+			print summary['error']
+	report = {
+		'filenames': filenames,
+		'grid': grid,
+		'variants': summaries,
+		'wallTime': time.time() - startTime,
+		'failures': len([summary for summary in summaries if not summary['success']]),
+	}
+	if summaryFilename is not None:
+		with open(summaryFilename, 'w') as f:
+			json.dump(report, f, indent=2)
+	return report['failures'] == 0
@@ -0,0 +1,167 @@
+"""
+The toolpathCache module keeps the parsed toolpaths of GCode files on disk, so reopening a GCode file does not need to parse it again.
+Toolpaths are stored in the memory mappable format of gcodeColumnar, and loaded with numpy.memmap.
+
+Entries are keyed on the content hash of the GCode and the settings which change how GCode is interpreted.
+An index maps the filename, size and modification time of files to their content hash, so known files do not need to be hashed.
+When the cache grows over the 'toolpath_cache_size' preference, the least recently used entries are removed.
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import json
+import hashlib
+import threading
+import traceback
+
+from Cura.util import profile
+from Cura.util import gcodeColumnar
+
+_indexLock = threading.Lock()
+
+def getCachePath():
+	path = os.path.join(profile.getBasePath(), 'toolpath_cache')
+	if not os.path.isdir(path):
+		try:
+			os.makedirs(path)
+		except OSError:
+			print "Failed to create directory: %s" % (path)
+	return path
+
+def _getIndexFilename():
+	return os.path.join(getCachePath(), 'index.json')
+
+def _loadIndex():
+	try:
+		with open(_getIndexFilename(), 'r') as f:
+			return json.load(f)
+	except (IOError, ValueError):
+		return {}
+
+def _saveIndex(index):
+	try:
+		with open(_getIndexFilename(), 'w') as f:
+			json.dump(index, f)
+	except IOError:
+		traceback.print_exc()
+
+def _getFileInfo(filename):
+	stat = os.stat(filename)
+	return os.path.abspath(filename), stat.st_size, stat.st_mtime
+
+def getKnownContentHash(filename):
+	"""
+	Return the content hash of a file when the file is in the index and did not change, else None.
+	"""
+	try:
+		path, size, mtime = _getFileInfo(filename)
+	except OSError:
+		return None
+	with _indexLock:
+		entry = _loadIndex().get(path)
+	if entry is not None and entry['size'] == size and entry['mtime'] == mtime:
+		return entry['hash']
+	return None
+
+def setContentHash(filename, contentHash):
+	try:
+		path, size, mtime = _getFileInfo(filename)
+	except OSError:
+		return
+	with _indexLock:
+		index = _loadIndex()
+		index[path] = {'size': size, 'mtime': mtime, 'hash': contentHash}
+		_saveIndex(index)
+
+def newContentHash():
+	return hashlib.sha1()
+
+def getKey(contentHash, size):
+	"""
+	Build the cache key from the content hash, the size and the settings which are used by the GCode interpreter.
+	"""
+	key = hashlib.sha1()
+	key.update('%s:%d' % (contentHash, size))
+	if profile.getProfileSetting('spiralize') == 'True':
+		key.update(':spiralize:%s' % (profile.getProfileSetting('layer_height')))
+	key.update(':arc:%s' % (profile.getPreference('gcode_arc_tolerance')))
+	for n in xrange(1, 4):
+		key.update(':%s,%s' % (profile.getMachineSetting('extruder_offset_x%d' % (n)), profile.getMachineSetting('extruder_offset_y%d' % (n))))
+	return key.hexdigest()
+
+def _getEntryFilename(key):
+	return os.path.join(getCachePath(), key + '.toolpath')
+
+def load(key):
+	"""
+	Load the cached toolpath for this key, returns None when it is not in the cache.
+	"""
+	filename = _getEntryFilename(key)
+	if not os.path.isfile(filename):
+		return None
+	try:
+		toolpath = gcodeColumnar.loadToolpath(filename)
+	except:
+		traceback.print_exc()
+		return None
+	if toolpath is None or not toolpath.finished:
+		return None
+	#Mark the entry as recently used.
+	try:
+		os.utime(filename, None)
+	except OSError:
+		pass
+	return toolpath
+
+def store(key, toolpath):
+	"""
+	Store a completely parsed toolpath in the cache, and remove old entries when the cache becomes too large.
+	"""
+	if not toolpath.finished:
+		return
+	filename = _getEntryFilename(key)
+	tempFilename = filename + '.%d.tmp' % (threading.currentThread().ident)
+	try:
+		with open(tempFilename, 'wb') as f:
+			gcodeColumnar.saveToolpath(toolpath, f)
+		if os.path.exists(filename):
+			os.unlink(filename)
+		os.rename(tempFilename, filename)
+	except (IOError, OSError):
+		traceback.print_exc()
+		try:
+			os.unlink(tempFilename)
+		except OSError:
+			pass
+		return
+	evict()
+
+def evict(maxSize = None):
+	"""
+	Remove the least recently used entries until the total size of the cache is below maxSize bytes.
+	"""
+	if maxSize is None:
+		maxSize = int(profile.getPreferenceFloat('toolpath_cache_size') * 1024 * 1024)
+	path = getCachePath()
+	entries = []
+	totalSize = 0
+	for filename in os.listdir(path):
+		if not filename.endswith('.toolpath'):
+			continue
+		filename = os.path.join(path, filename)
+		try:
+			stat = os.stat(filename)
+		except OSError:
+			continue
+		entries.append((stat.st_mtime, stat.st_size, filename))
+		totalSize += stat.st_size
+	entries.sort()
+	for mtime, size, filename in entries:
+		if totalSize <= maxSize:
+			break
+		try:
+			os.unlink(filename)
+			totalSize -= size
+		except OSError:
+			#On windows a file which is still memory mapped cannot be removed.
+			pass
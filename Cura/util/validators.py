@@ -83,7 +83,7 @@ class warningAbove(object):
 				if f >= self.minValueForWarning:
 					return WARNING, self.warningMessage
 			return SUCCESS, ''
-		except (ValueError, SyntaxError, TypeError):
+		except (ValueError, SyntaxError, TypeError, NameError):
 			#We already have an error by the int/float validator in this case.
 			return SUCCESS, ''
 
@@ -107,7 +107,7 @@ class warningBelow(object):
 				if f <= self.minValueForWarning:
 					return WARNING, self.warningMessage
 			return SUCCESS, ''
-		except (ValueError, SyntaxError, TypeError):
+		except (ValueError, SyntaxError, TypeError, NameError):
 			#We already have an error by the int/float validator in this case.
 			return SUCCESS, ''
 
@@ -177,6 +177,6 @@ class printSpeedValidator(object):
 				return WARNING, 'You are trying to print more then %.1fmm^3 of filament per second. This might cause filament slipping. (You are printing at %0.1fmm^3 per second)' % (maxPrintVolumePerSecond, printVolumePerSecond)
 			
 			return SUCCESS, 'You are printing at %0.1fmm^3 per second' % (printVolumePerSecond)
-		except ValueError:
+		except (ValueError, SyntaxError, TypeError, NameError):
 			#We already have an error by the int/float validator in this case.
 			return SUCCESS, ''
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Measure the time and peak memory used to interpret GCode files with the GCode interpreter backends.
+Each backend runs in its own process, so the peak resident set size of that process is the peak of that backend.
+
+Backends:
+	baseline  The gcodeInterpreter module of the baseline revision, read with 'git show' into a temporary module.
+	          By default the baseline revision is the first commit of the repository.
+	lines     The line parser with gcodePathRecords, which the gcodeInterpreter only uses for a list of lines.
+	columnar  The columnar parser from a file, as the gcodeInterpreter loads files. Large files are parsed in parallel.
+	storage   The columnar parser from a BigDataStorage, as the gcodeInterpreter loads the GCode of a slice result.
+
+Usage: python scripts/gcodeMemoryBenchmark.py [--backend baseline|lines|columnar|storage] [--baseline-rev REV] file.gcode [...]
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import sys
+import time
+import platform
+import resource
+import __builtin__
+import tempfile
+import subprocess
+
+BACKENDS = ['baseline', 'lines', 'columnar', 'storage']
+
+def _peakRSS():
+	#ru_maxrss is in kilobytes on Linux, and in bytes on MacOS.
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if platform.system() == 'Darwin':
+		return peak / 1024
+	return peak
+
+def _repoPath():
+	return os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def _baselineRevision():
+	#The first commit of the repository.
+	return subprocess.check_output(['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd=_repoPath()).split()[-1]
+
+def _loadBaselineModule(revision):
+	#The module is written to a temporary file, as imp needs a file to load it from. It imports from the current Cura package.
+	import imp
+	source = subprocess.check_output(['git', 'show', '%s:Cura/util/gcodeInterpreter.py' % (revision)], cwd=_repoPath())
+	f = tempfile.NamedTemporaryFile(prefix='CuraBaselineInterpreter', suffix='.py', delete=False)
+	try:
+		f.write(source)
+		f.close()
+		return imp.load_source('baselineGCodeInterpreter', f.name)
+	finally:
+		os.unlink(f.name)
+		if os.path.isfile(f.name + 'c'):
+			os.unlink(f.name + 'c')
+
+def _run(backend, filename, revision):
+	sys.path.insert(0, _repoPath())
+	__builtin__._ = lambda s: s
+	from Cura.util import gcodeInterpreter
+	from Cura.util import bigDataStorage
+
+	module = gcodeInterpreter
+	data = filename
+	if backend == 'baseline':
+		module = _loadBaselineModule(revision)
+	elif backend == 'lines':
+		with open(filename, 'r') as f:
+			data = f.readlines()
+	elif backend == 'storage':
+		data = bigDataStorage.BigDataStorage()
+		with open(filename, 'r') as f:
+			while True:
+				chunk = f.read(1024 * 1024)
+				if len(chunk) < 1:
+					break
+				data.write(chunk)
+
+	#The lines and storage backends hold the GCode before parsing, the peak before parsing includes it.
+	baseRSS = _peakRSS()
+	t = time.time()
+	g = module.gcode()
+	g.load(data)
+	t = time.time() - t
+	points = 0
+	for layer in g.layerList:
+		for path in layer:
+			points += len(path['points'])
+	print '%-10s %8.2fs %8d layers %10d points %8.1f MB peak (%.1f MB before parsing)' % (backend, t, len(g.layerList), points, _peakRSS() / 1024.0, baseRSS / 1024.0)
+
+def main():
+	args = sys.argv[1:]
+	if len(args) > 3 and args[0] == '--run':
+		_run(args[1], args[2], args[3])
+		return
+	backends = BACKENDS
+	revision = None
+	while len(args) > 1 and args[0] in ['--backend', '--baseline-rev']:
+		if args[0] == '--backend':
+			backends = [args[1]]
+		else:
+			revision = args[1]
+		args = args[2:]
+	if len(args) < 1:
+		print __doc__
+		sys.exit(1)
+	if revision is None:
+		revision = _baselineRevision()
+	for filename in args:
+		print '%s: %.1f MB, baseline revision %s' % (filename, os.stat(filename).st_size / 1024.0 / 1024.0, revision[:7])
+		for backend in backends:
+			subprocess.call([sys.executable, os.path.abspath(__file__), '--run', backend, filename, revision])
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Regression checks for the GCode handling which can run without the CuraEngine or a display.
+Each check raises an AssertionError when it fails.
+
+Usage: python scripts/gcodeRegressionChecks.py
+"""
+__copyright__ = "Copyright (C) 2013 David Braam - Released under terms of the AGPLv3 License"
+
+import os
+import sys
+import __builtin__
+import cStringIO as StringIO
+
+def checkAlterationsInOneChunk():
+	#The start and end GCode markers arrive in the same data, the end GCode offset has to include the start GCode size change.
+	from Cura.util import sliceEngine
+
+	result = sliceEngine.EngineResult()
+	result.setAlterations({'startCode': 'G28\nM109 S210\n', 'endCode': 'M104 S0\nM84\n'})
+	body = 'G1 X1 Y1 E1\nG1 X2 Y2 E2\n'
+	result.appendGCode(sliceEngine.ALTERATION_MARKER % ('startCode') + body + sliceEngine.ALTERATION_MARKER % ('endCode'))
+	result.finishGCodeStream()
+	assert result.getGCode().read() == 'G28\nM109 S210\n' + body + 'M104 S0\nM84\n'
+	for name, (offset, length, code) in result._alterations.items():
+		assert result.getGCode().read()[offset:offset + length] == code, name
+
+	assert result.replaceAlterations({'startCode': ';start\n', 'endCode': ';end\nM84\n'})
+	assert result.getGCode().read() == ';start\n' + body + ';end\nM84\n'
+
+def checkUncommittedPolygonPoints():
+	#Points grown by the socket thread are not drawn until their polygons are added.
+	import numpy
+	from Cura.util import polygonStorage
+
+	storage = polygonStorage.PolygonStorage()
+	storage.growPoints(4)[:] = 1.0
+	assert len(storage.getPoints()) == 0 and len(storage.getLineIndices()) == 0
+	storage.addPolygons([0, 4])
+	storage.growPoints(3)
+	assert len(storage.getPoints()) == 4
+	assert storage.getLineIndices().max() < 4
+	joined = polygonStorage.concatenate([storage, storage])
+	assert len(joined.getPoints()) == 8 and numpy.array_equal(joined.getOffsets(), [0, 4, 8])
+	assert joined.getLineIndices().max() < 8
+	points, indices = storage.getLines()
+	assert len(points) == 4 and indices.max() < len(points)
+
+def checkFeatureVolumes():
+	#A retraction at the end of a feature and the prime at the start of the next one are not part of either feature.
+	from Cura.util import gcodeColumnar
+	from Cura.util import gcodeStatistics
+
+	gcode = '\n'.join([
+		'G21', 'G90', 'M82', 'G92 E0', ';LAYER:0', 'G0 Z0.3',
+		';TYPE:SKIN', 'G1 X10 Y0 E1.0', 'G1 X10 Y10 E2.0', 'G1 F1800 E-2.5',
+		';TYPE:FILL', 'G0 X20 Y20', 'G1 F1800 E2.0', 'G1 X30 Y20 E3.0',
+		';TYPE:WALL-OUTER', 'G1 F1800 E-1.5', 'G0 X0 Y0', 'G92 E0', 'G1 F1800 E0.0', 'G1 X5 Y0 E0.5', ''])
+	toolpath = gcodeColumnar.parseStream(StringIO.StringIO(gcode).read).toolpath
+	statistics = gcodeStatistics.gcodeStatistics(toolpath, 1.0)
+	volumes = statistics.getFeatureVolumes()
+	assert min(volumes.values()) >= 0.0, volumes
+	area = statistics.filamentArea
+	assert abs(volumes['SKIN'] - 2.0 * area) < 1e-6, volumes
+	assert abs(volumes['FILL'] - 1.0 * area) < 1e-6, volumes
+	assert abs(volumes['WALL-OUTER'] - 0.5 * area) < 1e-6, volumes
+	assert abs(statistics.getTotalExtrusion() - 3.5) < 1e-6
+
+def checkLazyLayerStates():
+	#Lazily parsed layers start from the exact parser state, also for axes set long before and for relative moves.
+	import numpy
+	from Cura.util import gcodeColumnar
+	from Cura.util import gcodeLayerIndex
+	from Cura.util import bigDataStorage
+
+	lines = ['G21', 'G90', 'M82', 'G92 E0', ';LAYER:0', 'G0 Z0.3 Y1', 'G1 X10 E1']
+	for n in xrange(1, 7):
+		lines += [';LAYER:%d' % (n), 'G0 Z%.1f' % (0.3 + 0.2 * n), 'G1 X%d E%d' % (10 + n, 1 + n)]
+		if n == 2:
+			lines += ['G91', 'G0 X1 Y1', 'G90']
+		if n == 3:
+			lines += ['G91', 'G1 X1 E0.5']
+	gcode = '\n'.join(lines) + '\n'
+	settings = {'spiralize': False, 'layerHeight': 0.2, 'arcTolerance': 0.01, 'extruderOffsets': {0: (0.0, 0.0)}}
+	p = gcodeColumnar.parser(spiralize = False, layerHeight = 0.2, arcTolerance = 0.01)
+	full = gcodeColumnar.layerListView(gcodeColumnar.parseStream(StringIO.StringIO(gcode).read, p = p).toolpath)
+	storage = bigDataStorage.BigDataStorage()
+	storage.write(gcode)
+	lazy = gcodeLayerIndex.lazyLayerList(storage)
+	lazy._settings = settings
+	lazy.scan()
+	assert len(lazy) == len(full)
+	for n in xrange(0, len(full)):
+		assert len(lazy[n]) == len(full[n]), n
+		for a, b in zip(full[n], lazy[n]):
+			assert a['type'] == b['type'] and a['extruder'] == b['extruder'], n
+			assert numpy.array_equal(a['points'], b['points']), (n, a['points'], b['points'])
+			assert numpy.array_equal(a['extrusion'], b['extrusion']), n
+			assert abs(a['layerThickness'] - b['layerThickness']) < 1e-6, n
+	assert lazy[5][-1]['points'][-1][1] == 2.0
+
+CHECKS = [checkAlterationsInOneChunk, checkUncommittedPolygonPoints, checkFeatureVolumes, checkLazyLayerStates]
+
+def main():
+	sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+	__builtin__._ = lambda s: s
+	failures = 0
+	for check in CHECKS:
+		try:
+			check()
+			print 'ok      %s' % (check.__name__)
+		except AssertionError:
+			import traceback
+			traceback.print_exc()
+			print 'FAILED  %s' % (check.__name__)
+			failures += 1
+	sys.exit(1 if failures > 0 else 0)
+
+if __name__ == '__main__':
+	main()